@@ -0,0 +1,41 @@
+import logging
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+log = logging.getLogger("CameraBridge")
+log.setLevel(logging.INFO)
+
+
+class CameraBridge(QObject):
+    """Hands results from the camera event loop back to the Qt thread, so the UI never waits on a camera"""
+    _finished = pyqtSignal(object, object) # (callback, concurrent.futures.Future)
+    discoveryEvent = pyqtSignal(object) # discovery.DiscoveryEvent, emitted from the camera loop by the discovery listener
+
+    def __init__(self):
+        super().__init__()
+        self._finished.connect(self._deliver)
+
+    def watch(self, future, callback):
+        """Call callback(result) on the Qt thread once the future is done, result is None if it failed"""
+        # done callbacks run on the camera loop thread, the signal queues the call over to the Qt thread
+        future.add_done_callback(lambda f: self._finished.emit(callback, f))
+        return future
+
+    def _deliver(self, callback, future):
+        try:
+            result = future.result()
+        except Exception:
+            log.exception("Camera request failed")
+            result = None
+        callback(result)
+
+    def inquire(self, camera, command, callback):
+        """Send an inquiry, callback(reply) is called on the Qt thread"""
+        return self.watch(camera.inquireAsync(command), callback)
+
+    def queueCommands(self, camera, *commands, callback=None, override=True):
+        """Queue commands, callback(results) is called on the Qt thread once they've all been answered"""
+        future = camera.queueCommands(*commands, override=override)
+        if callback is not None:
+            self.watch(future, callback)
+        return future
@@ -5,10 +5,6 @@ from dataclasses import dataclass
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("PiControl")
 
-def doTrimBecauseJamieSucks(r):
-    return r[8:]
-
-
 class CameraProperties:
     def __init__(self):
         self.destinationAddress = 0
@@ -64,11 +60,11 @@ class CameraProperties:
             log.warning("Block Lens Inquiry responded with None")
             return
 
-        if len(response)<15:
+        if len(response.payload)<15:
             log.warning("Block Lens Inquiry repsonse was too short")
             return
 
-        response = doTrimBecauseJamieSucks(response)
+        response = response.payload
         self.destinationAddress = (response[0] & 0xf0) >> 4
         self.sourceAddress = response[0] & 0x0f
         self.completion = bool(response[1]&0x80)
@@ -88,11 +84,11 @@ class CameraProperties:
         if response is None:
             log.warning("Block Control Inquiry responded with None")
             return
-        if len(response)<14:
+        if len(response.payload)<14:
             log.warning("Block Control Inquiry repsonse was too short")
             return
 
-        response = doTrimBecauseJamieSucks(response)
+        response = response.payload
         self.destinationAddress=(response[0] & 0xf0) >> 4
         self.sourceAddress = response[0] & 0x0f
         self.completion = bool(response[1] & 0x80)
@@ -115,11 +111,11 @@ class CameraProperties:
         if response is None:
             log.warning("Block Other Inquiry responded with None")
             return
-        if len(response)<13:
+        if len(response.payload)<13:
             log.warning("Block Other Inquiry repsonse was too short")
             return
 
-        response = doTrimBecauseJamieSucks(response)
+        response = response.payload
         self.destinationAddress = (response[0] & 0xf0) >> 4
         self.sourceAddress = response[0] & 0x0f
         self.completion = bool(response[1] & 0x80)
@@ -132,11 +128,11 @@ class CameraProperties:
         if response is None:
             log.warning("Block Enlargment1 Inquiry responded with None")
             return
-        if len(response)<15:
+        if len(response.payload)<15:
             log.warning("Block Enlargment1 Inquiry repsonse was too short")
             return
 
-        response = doTrimBecauseJamieSucks(response)
+        response = response.payload
         self.destinationAddress = (response[0] & 0xf0) >> 4
         self.sourceAddress = response[0] & 0x0f
         self.completion = bool(response[1] & 0x80)
@@ -154,11 +150,11 @@ class CameraProperties:
         if response is None:
             log.warning("Block Enlargement2 Inquiry responded with None")
             return
-        if len(response)<8:
+        if len(response.payload)<8:
             log.warning("Block Enlargement2 Inquiry repsonse was too short")
             return
 
-        response = doTrimBecauseJamieSucks(response)
+        response = response.payload
         self.destinationAddress = (response[0] & 0xf0) >> 4
         self.sourceAddress = response[0] & 0x0f
         self.completion = bool(response[1] & 0x80)
@@ -168,11 +164,11 @@ class CameraProperties:
         if response is None:
             log.warning("Block Enlargement3 Inquiry responded with None")
             return
-        if len(response)<3:
+        if len(response.payload)<3:
             log.warning("Block Enlargement3 Inquiry repsonse was too short")
             return
 
-        response = doTrimBecauseJamieSucks(response)
+        response = response.payload
         self.destinationAddress = (response[0] & 0xf0) >> 4
         self.sourceAddress = response[0] & 0x0f
         self.completion = bool(response[1] & 0x80)
@@ -182,10 +178,10 @@ class CameraProperties:
         if response is None:
             log.warning("Pan/Tilt Inquiry responded with None")
             return
-        if len(response) != 19:
+        if len(response.payload) != 11:
             log.warning("Pan/Tilt Inquiry response was too short")
             return
-        response = doTrimBecauseJamieSucks(response)
+        response = response.payload
         try:
             pan = response[2] << 12 | response[3] << 8 | response[4] << 4 | response[5]
             tilt = response[6] << 12 | response[7] << 8 | response[8] << 4 | response[9]
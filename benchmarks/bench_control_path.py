@@ -0,0 +1,238 @@
+"""End-to-end benchmark: the control path from the front panel to the cameras, against simulated cameras.
+
+Measures, with the same threads as the UI (lines parsed on one thread, cameras run on ViscaIPCamera's event loop and
+the simulator on its own):
+  - serial line to UDP packet on the wire, p50/p99, through SerialParser and ViscaIPCamera.queueCommands
+  - commands/s per camera, every camera sending at once
+  - p50/p99 ack and completion latency, from a capture of the traffic
+  - time to fetch and decode every property (the updateCameraProperties inquiries) for all the cameras
+  - time to sweep the simulator's network and find every camera, and that a sweep finds Sony cameras which only
+    answer VISCA (not the ENQ), as behind a router
+
+Each measurement is the median of --runs runs. Results are printed as JSON. With --baseline they're compared with a
+stored run and the exit status is 1 if anything got more than --tolerance worse (--tail-tolerance for the p99
+latencies, which swing most with the load on the machine), --save stores this run as the baseline. With fewer runs
+than the default neither is done, only a warning printed. Run from the repository root:
+
+    python -m benchmarks.bench_control_path --baseline benchmarks/baseline_control_path.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import gate
+from InquiryDecode import CameraProperties
+from SerialParser import SerialParser
+from sony_visca import aioudp, capture
+from sony_visca.simulator import Profile, Simulator
+from sony_visca.simulator.server import SONY_PORT
+from sony_visca.visca_commands import Command, Inquiry
+from sony_visca.visca_ip_camera import LoopThread, ViscaIPCamera
+
+HIGHER_IS_BETTER = ("commands_per_second_per_camera",)
+VISCA_ONLY = 4  # simulated Sony cameras that don't answer the ENQ
+VISCA_ONLY_FIRST = "127.0.9.1"
+# the inquiries updateCameraProperties makes, with what decodes each
+PROPERTIES = (
+    (Inquiry.BlockControl, CameraProperties.decodeBlockControl),
+    (Inquiry.BlockOther, CameraProperties.decodeBlockOther),
+    (Inquiry.BlockEnlargement, CameraProperties.decodeBlockEnlargement1),
+    (Inquiry.BlockLens, CameraProperties.decodeBlockLens),
+    (Inquiry.PanTiltPos, CameraProperties.decodePanTiltPosition),
+)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class WireClock:
+    """Capture hook noting when the next datagram goes out, for timing serial line to wire"""
+
+    def __init__(self):
+        self.sent = threading.Event()
+        self.time = None
+
+    def record(self, direction, addr, data):
+        if direction == aioudp.SENT and not self.sent.is_set():
+            self.time = time.perf_counter()
+            self.sent.set()
+
+
+class Joystick(SerialParser):
+    """The front panel parser, sending its commands to one camera as MainScreen.doCameraCommand does"""
+
+    def __init__(self, camera):
+        self.camera = camera
+
+    def cameraCommand(self, command):
+        self.camera.queueCommands(command, override=True)
+
+
+def serialToWire(camera, lines):
+    joystick = Joystick(camera)
+    clock = WireClock()
+    aioudp.set_capture(clock)
+    times = []
+    try:
+        for number in range(lines):
+            # alternate so every line changes the speed, and a command goes out for each
+            line = f"X{(number % 2) * 8 + 4}\n"
+            clock.sent.clear()
+            start = time.perf_counter()
+            joystick.parseLine(line)
+            if clock.sent.wait(1):
+                times.append(clock.time - start)
+            time.sleep(0.002)  # let the camera finish with it, this is the latency of an idle path
+    finally:
+        aioudp.set_capture(None)
+    return times
+
+
+def commandThroughput(cameras, commands, path):
+    """Every camera sends commands one after another (not superseding each other), all cameras at once"""
+    recorder = capture.start(path)
+    try:
+        async def run(camera):
+            for number in range(commands):
+                await camera.send(Command.ZoomPos(number * 100 % 0x4000), override=False)
+
+        async def runAll():
+            await asyncio.gather(*(run(camera) for camera in cameras))
+
+        start = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(runAll(), ViscaIPCamera._LOOP_THREAD.loop).result()
+        elapsed = time.perf_counter() - start
+    finally:
+        capture.stop(recorder)
+    exchanges = [exchange for exchange in capture.exchanges(capture.read(path)) if exchange.reply is not None]
+    return elapsed, exchanges
+
+
+def populateProperties(cameras):
+    """Fetch and decode every property of every camera at once, the way updateCameraProperties does"""
+    done = threading.Event()
+    remaining = [len(cameras) * len(PROPERTIES)]
+    lock = threading.Lock()
+
+    def onReply(properties, decode, future):
+        decode(properties, future.result())
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+
+    start = time.perf_counter()
+    for camera in cameras:
+        properties = CameraProperties()
+        for inquiry, decode in PROPERTIES:
+            camera.inquireAsync(Command(inquiry)).add_done_callback(
+                lambda future, properties=properties, decode=decode: onReply(properties, decode, future)
+            )
+    done.wait(30)
+    return time.perf_counter() - start
+
+
+def discoverViscaOnly(profile, simulatorLoop):
+    """Sweep for Sony cameras that only answer VISCA, returns how many were found"""
+    simulator = Simulator(sony=VISCA_ONLY, profile=profile, first=VISCA_ONLY_FIRST, seed=1, enq=False)
+    asyncio.run_coroutine_threadsafe(simulator.start(), simulatorLoop.loop).result()
+    try:
+        return len(ViscaIPCamera.sweep([simulator.network], timeout=0.2, sonyPort=SONY_PORT).result())
+    finally:
+        simulatorLoop.loop.call_soon_threadsafe(simulator.close)
+
+
+def measure(cameras, args):
+    """One run of the control path measurements, with the cameras open"""
+    results = {}
+    times = serialToWire(cameras[0], args.lines)
+    results["serial_to_wire_p50_ms"] = percentile(times, 0.5) * 1e3
+    results["serial_to_wire_p99_ms"] = percentile(times, 0.99) * 1e3
+
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed, exchanges = commandThroughput(cameras, args.commands, os.path.join(directory, "bench.cap"))
+    results["commands_per_second_per_camera"] = len(exchanges) / elapsed / len(cameras)
+    acks = [exchange.ack for exchange in exchanges if exchange.ack is not None]
+    results["ack_p50_ms"] = percentile(acks, 0.5) * 1e3
+    results["ack_p99_ms"] = percentile(acks, 0.99) * 1e3
+    completions = [exchange.completion for exchange in exchanges]
+    results["completion_p50_ms"] = percentile(completions, 0.5) * 1e3
+    results["completion_p99_ms"] = percentile(completions, 0.99) * 1e3
+
+    results["populate_properties_seconds"] = populateProperties(cameras)
+    return results
+
+
+def run(args):
+    profile = Profile(latency=args.latency, jitter=0, loss=0, bufferFull=0, execution=args.execution)
+    simulator = Simulator(sony=args.cameras, profile=profile, seed=1)
+    simulatorLoop = LoopThread()
+    simulatorLoop.start()
+    simulatorLoop.wait_ready()
+    asyncio.run_coroutine_threadsafe(simulator.start(), simulatorLoop.loop).result()
+    cameras = simulator.connect(ViscaIPCamera)
+    results = {}
+    try:
+        start = time.perf_counter()
+        found = ViscaIPCamera.sweep([simulator.network], concurrency=256, rate=5000, timeout=0.2).result()
+        results["discovery_seconds"] = time.perf_counter() - start
+        results["discovered"] = len(found)
+        results["discovered_visca_only"] = discoverViscaOnly(profile, simulatorLoop)
+
+        for future in [camera.initialiseAsync() for camera in cameras]:
+            future.result()
+
+        # one run is at the mercy of whatever else the machine is doing, the median of several much less so
+        rounds = [measure(cameras, args) for _ in range(args.runs)]
+        for name in rounds[0]:
+            results[name] = statistics.median(measured[name] for measured in rounds)
+    finally:
+        for camera in cameras:
+            if camera.is_connected:
+                camera.close()
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), simulatorLoop.loop).result()
+        simulatorLoop.loop.call_soon_threadsafe(simulator.close)
+        simulatorLoop.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cameras", type=int, default=20)
+    parser.add_argument("--commands", type=int, default=50, help="commands each camera sends")
+    parser.add_argument("--lines", type=int, default=200, help="serial lines timed to the wire")
+    parser.add_argument("--latency", type=float, default=0.001, help="simulated camera reply latency")
+    parser.add_argument("--execution", type=float, default=0.002, help="simulated command execution time")
+    gate.addArguments(parser, tolerance=0.5, runs=5)
+    parser.add_argument(
+        "--tail-tolerance", type=float, default=2.0, help="fraction worse that counts as a regression for the p99s"
+    )
+    parser.add_argument("--log", action="store_true", help="leave the camera debug logging on")
+    args = parser.parse_args()
+    if not args.log:
+        # the numbers are of the control path, not of writing debug logs to the terminal
+        for name in ("ptz", "ptz.visca", "SerialControl"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    results = run(args)
+    results["cameras"] = args.cameras
+    results["python"] = platform.python_version()
+    print(json.dumps(results, indent=2))
+    tails = {name: args.tail_tolerance for name in results if name.endswith("_p99_ms")}
+    return gate.check(
+        results, args, HIGHER_IS_BETTER, matching=("cameras", "discovered", "discovered_visca_only"), tolerances=tails
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Memory check: the UDP endpoints under a flood of datagrams stay the same size.
+
+Floods, from many loopback addresses at once, both kinds of endpoint the cameras use: the local socket replies come
+back to (as AsyncViscaCamera opens it, only the cameras' addresses allowed) and a plain Endpoint nothing is reading,
+as a sweep or the discovery listener has while busy. Memory traced by tracemalloc is noted after each round; it should
+stop growing once the first round has filled the buffers. The exit status is 1 (through gate.checkLimits) if it grew
+by more than --limit bytes after that, or if the local socket kept count of late replies from more hosts than it
+allows. Run from the repository root:
+
+    python -m benchmarks.bench_flood
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import socket
+import sys
+import tracemalloc
+
+from benchmarks import gate
+from sony_visca import aioudp, replies
+from sony_visca.async_camera import _replyKey
+from sony_visca.simulator.camera import completion, frame
+
+FIRST_SENDER = "127.0.3.1"
+CAMERAS = 8  # of the senders, the ones the local socket allows
+
+
+def senders(count):
+    sockets = []
+    first = ipaddress.ip_address(FIRST_SENDER)
+    for number in range(count):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((str(first + number), 0))
+        sock.setblocking(False)
+        sockets.append(sock)
+    return sockets
+
+
+async def flood(sockets, targets, datagrams):
+    """Send datagrams to each target, spread over the senders, letting the loop read them as it goes"""
+    sent = 0
+    while sent < datagrams:
+        for number, sock in enumerate(sockets):
+            # a reply to a command nobody sent, different every time so nothing's shared
+            data = frame(completion(1), sent + number)
+            for target in targets:
+                try:
+                    sock.sendto(data, target)
+                except BlockingIOError:
+                    pass
+        sent += len(sockets)
+        # the loop reads a datagram per socket each time round, give it as many turns as were sent
+        for _ in sockets:
+            await asyncio.sleep(0)
+
+
+async def run(args):
+    local = await aioudp.open_local_endpoint("0.0.0.0", 0, reply_key=_replyKey, reply_frames=replies.decodeAll)
+    first = ipaddress.ip_address(FIRST_SENDER)
+    local.allowed = {str(first + number) for number in range(CAMERAS)}
+    unread = await aioudp.open_datagram_endpoint("0.0.0.0", 0)
+    targets = [("127.0.0.1", local.address[1]), ("127.0.0.1", unread.address[1])]
+    sockets = senders(args.senders)
+    results = {"rounds": []}
+    try:
+        tracemalloc.start()
+        for _ in range(args.rounds):
+            await flood(sockets, targets, args.datagrams)
+            results["rounds"].append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+        for sock in sockets:
+            sock.close()
+        local.close()
+        unread.close()
+    for name, endpoint in (("local", local), ("unread", unread)):
+        for attribute in ("datagrams_received", "datagrams_dropped", "datagrams_rejected"):
+            results[f"{name} {attribute}"] = getattr(endpoint, attribute)
+    results["local late_replies hosts"] = len(local.late_replies)
+    results["growth_after_first_round"] = results["rounds"][-1] - results["rounds"][0]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--senders", type=int, default=200, help="loopback addresses the flood comes from")
+    parser.add_argument("--datagrams", type=int, default=20000, help="datagrams to each endpoint per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=64 * 1024, help="bytes of growth after the first round allowed")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    return gate.checkLimits(
+        results, {"growth_after_first_round": args.limit, "local late_replies hosts": CAMERAS}
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
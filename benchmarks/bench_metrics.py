@@ -0,0 +1,81 @@
+"""Microbenchmark: what recording one reply's metrics costs.
+
+Times what _sendRawCommand adds per reply for the metrics (a Histogram.observe and the byte and error counters) on
+their own, and render() for a fleet of cameras, which is what each scrape of the metrics endpoint costs. Run from the
+repository root:
+
+    python -m benchmarks.bench_metrics
+"""
+import collections
+import random
+import time
+
+from sony_visca import metrics
+
+N = 200000
+CAMERAS = 20
+
+
+class FakeCamera:
+    """Just the attributes metrics.render reads"""
+
+    def __init__(self, number):
+        self.name = f"cam{number}"
+        self.ip = f"192.168.0.{number + 10}"
+        self.stats = collections.Counter()
+        self.ackTimes = metrics.Histogram()
+        self.completionTimes = metrics.Histogram()
+        self.inquiryTimes = metrics.Histogram()
+        self.stopWaits = metrics.Histogram()
+        self.superseded = 0
+        self.queueDepth = 0
+        self.inflight = 0
+        self.is_connected = True
+
+
+def best(run, repeat=5):
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        result = elapsed if result is None else min(result, elapsed)
+    return result
+
+
+def main():
+    latencies = [random.lognormvariate(-5, 1) for _ in range(1000)]  # around 7ms, with a long tail
+    camera = FakeCamera(0)
+
+    def observe():
+        histogram = camera.ackTimes
+        for _ in range(N // len(latencies)):
+            for latency in latencies:
+                histogram.observe(latency)
+
+    def record():
+        stats = camera.stats
+        histogram = camera.ackTimes
+        for _ in range(N // len(latencies)):
+            for latency in latencies:
+                stats["bytesSent"] += 14
+                stats["bytesReceived"] += 11
+                histogram.observe(latency)
+
+    ns = best(observe) / N * 1e9
+    print(f"Histogram.observe: {ns:6.0f} ns/sample")
+    ns = best(record) / N * 1e9
+    print(f"    reply metrics: {ns:6.0f} ns/reply")
+
+    cameras = [FakeCamera(number) for number in range(CAMERAS)]
+    for fake in cameras:
+        for latency in latencies:
+            fake.ackTimes.observe(latency)
+    scrapes = 200
+    seconds = best(lambda: [metrics.render(cameras) for _ in range(scrapes)])
+    print(f"           render: {seconds / scrapes * 1e3:6.2f} ms/scrape for {CAMERAS} cameras")
+    print(f"     ack p50, p99: {camera.ackTimes.quantile(0.5) * 1e3:.1f}ms, {camera.ackTimes.quantile(0.99) * 1e3:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Microbenchmarks: the pure Python on the joystick and properties paths, in ns/op and bytes allocated/op.
+
+Covers the Command encoders the UI and front panel use, the CameraProperties block decoders (fed replies from the
+simulator's encoders, so they're laid out as a camera sends them), the front panel serialRegex and the PTZOptics
+discovery regexes. Each time is the best of several runs. Allocation is the peak traced by tracemalloc during one
+call, which counts memory that's freed again before the call returns.
+
+Timings swing with whatever else the machine is doing, so the regression gate doesn't use ns/op. It uses "rel", each
+time divided by that of a fixed pure Python loop timed alongside it. That also makes a baseline from a desktop
+roughly usable on a Pi. Run from the repository root:
+
+    python -m benchmarks.bench_micro --baseline benchmarks/baseline_micro.json
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks import gate
+from InquiryDecode import CameraProperties
+from SerialParser import serialRegex
+from sony_visca import discovery, replies
+from sony_visca.simulator import CameraState
+from sony_visca.simulator.camera import frame
+from sony_visca.visca_commands import Command
+
+SERIAL_LINES = ("X12", "Y-7", "Z3", "P1,3", "LRN512,498,505,12,15,9,1010,1003,998")
+NON_SONY_REPLIES = (
+    "REPLY OK\r\nClient ID:bdb47600e5c445338a30a59dd902c842\r\nDevice ID:0123456789abcdef0123456789abcdef\r\n"
+    "Uptime=5321\r\nDHCP=0\r\nIP=192.168.0.50\r\nMASK=255.255.255.0\r\nGATEWAY=192.168.0.1\r\n"
+    "MAC=dc:ed:84:00:00:01\r\nFDNS=8.8.8.8\r\n",
+    "REPLY OK\r\nVERSION:6.3.34\r\nDEVICE_MODEL:PT20XSDI\r\nClient ID:bdb47600e5c445338a30a59dd902c842\r\n"
+    "Device ID:0123456789abcdef0123456789abcdef\r\nUptime=5321\r\nDHCP=1\r\nIP=192.168.0.51\r\nMASK=255.255.255.0\r\n"
+    "GATEWAY=192.168.0.1\r\nMAC=dc:ed:84:00:00:02\r\nFDNS=8.8.8.8\r\n",
+)
+
+
+def encoders():
+    return {
+        "PanTiltUp": lambda: Command.PanTiltUp(12, 10),
+        "PanTiltUpLeft": lambda: Command.PanTiltUpLeft(12, 10),
+        "PanTiltStop": lambda: Command.PanTiltStop(),
+        "PanTiltAbs": lambda: Command.PanTiltAbs(1000, -200, 12, 10),
+        "ZoomTeleVariable": lambda: Command.ZoomTeleVariable(5),
+        "ZoomPos": lambda: Command.ZoomPos(0x1234),
+        "FocusPos": lambda: Command.FocusPos(0x1234),
+        "RGainDirect": lambda: Command.RGainDirect(0x80),
+        "ShutterDirect": lambda: Command.ShutterDirect(0x11),
+        "IrisDirect": lambda: Command.IrisDirect(0x0d),
+        "GainDirect": lambda: Command.GainDirect(0x01),
+        "BrightDirect": lambda: Command.BrightDirect(0x0a),
+        "ExposureCompDirect": lambda: Command.ExposureCompDirect(7),
+        "ApertureDirect": lambda: Command.ApertureDirect(5),
+        "Command": lambda: Command(Command.PanTiltStop()),
+    }
+
+
+def decoders():
+    state = CameraState(cameraID=3)
+    properties = CameraProperties()
+    benchmarks = {}
+    for name, block in (
+        ("decodeBlockLens", state.blockLens),
+        ("decodeBlockControl", state.blockControl),
+        ("decodeBlockOther", state.blockOther),
+        ("decodeBlockEnlargement1", state.blockEnlargement),
+        ("decodeBlockEnlargement2", state.blockEnlargement2),
+        ("decodeBlockEnlargement3", state.blockEnlargement3),
+        ("decodePanTiltPosition", state.panTiltPosition),
+    ):
+        reply = replies.decode(frame(block(), 1))
+        benchmarks[name] = lambda decode=getattr(properties, name), reply=reply: decode(reply)
+    return benchmarks
+
+
+def parsers():
+    def nonSony(text):
+        # as discovery.nonSonyCamera tries them
+        for regex in discovery.NON_SONY_REGEXES:
+            match = regex.match(text)
+            if match:
+                return match.groupdict()
+        return None
+
+    benchmarks = {}
+    for line in SERIAL_LINES:
+        name = "serialRegex " + line.split(",")[0][:4]
+        benchmarks[name] = lambda line=line: serialRegex.search(line)
+    benchmarks["NON_SONY_REGEXES first"] = lambda: nonSony(NON_SONY_REPLIES[0])
+    benchmarks["NON_SONY_REGEXES second"] = lambda: nonSony(NON_SONY_REPLIES[1])
+    benchmarks["NON_SONY_REGEXES no match"] = lambda: nonSony("SEARCH * UPGRADE")
+    return benchmarks
+
+
+def calibration():
+    """Fixed work to measure the others against"""
+    total = 0
+    for number in range(20):
+        total += number
+    return total
+
+
+def nsPerOp(run, repeat=9, target=0.02):
+    """(ns per call of run, ns per call of calibration), best of repeat runs of about target seconds each
+
+    The two are timed alternately so both see the same conditions, with the garbage collector off as timeit does.
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        runs = _number(run, target)
+        calibrations = _number(calibration, target)
+        best = reference = float("inf")
+        for _ in range(repeat):
+            best = min(best, _time(run, runs))
+            reference = min(reference, _time(calibration, calibrations))
+        return best / runs * 1e9, reference / calibrations * 1e9
+    finally:
+        gc.enable()
+
+
+def _time(run, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        run()
+    return time.perf_counter() - start
+
+
+def _number(run, target):
+    """How many calls of run take about target seconds"""
+    number = 1
+    while True:
+        elapsed = _time(run, number)
+        if elapsed >= target / 10:
+            return max(1, int(number * target / elapsed))
+        number *= 10
+
+
+def bytesPerOp(run, number=200):
+    """Average peak bytes allocated during one call"""
+    run()  # warm up any caches
+    total = 0
+    tracemalloc.start()
+    try:
+        for _ in range(number):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            run()
+            total += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return total / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run benchmarks with this in their name")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON instead of a table")
+    gate.addArguments(parser, tolerance=0.5)
+    args = parser.parse_args()
+
+    results = {}
+    for group, benchmarks in (("encode", encoders()), ("decode", decoders()), ("parse", parsers())):
+        for name, run in benchmarks.items():
+            name = f"{group} {name}"
+            if args.filter not in name:
+                continue
+            ns, reference = nsPerOp(run)
+            allocated = bytesPerOp(run)
+            results[f"{name} ns/op"] = ns
+            results[f"{name} rel"] = ns / reference
+            results[f"{name} B/op"] = allocated
+            if not args.json:
+                print(f"{name:<40} {ns:8.0f} ns/op {ns / reference:6.2f} rel {allocated:8.0f} B/op")
+    results["python"] = platform.python_version()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return gate.check(results, args, gated=lambda name: not name.endswith(" ns/op"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Microbenchmark: allocations and time per packet framed for sending.
+
+Compares the old concatenation (b"\x01\x00" + length + seq + payload) with PacketBuilder, which packs the header and
+payload into a reused buffer. Run from the repository root:
+
+    python -m benchmarks.bench_packet
+"""
+import time
+import tracemalloc
+
+from sony_visca.packet import PacketBuilder
+from sony_visca.visca_commands import Command
+
+PAYLOAD = bytes(Command.PanTiltUp(12, 12))
+N = 100000
+
+
+def concatenate(payload, sequenceNumber):
+    length = len(payload).to_bytes(2, 'big')
+    return b"\x01\x00" + length + sequenceNumber.to_bytes(4, 'big') + payload
+
+
+def builder():
+    packets = PacketBuilder()
+    return packets.build
+
+
+def allocations(build):
+    """Bytes allocated per packet (peak while building, whether or not it's freed again) and bytes still held"""
+    build(PAYLOAD, 0)  # warm up any caches
+    tracemalloc.start()
+    peak = 0
+    held = []
+    for sequenceNumber in range(1, 1001):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        packet = build(PAYLOAD, sequenceNumber)
+        current, top = tracemalloc.get_traced_memory()
+        peak += top - before
+        held.append(packet)  # as if it were still queued in the transport
+    retained = tracemalloc.get_traced_memory()[0]
+    del held
+    tracemalloc.stop()
+    return peak / 1000, retained / 1000
+
+
+def timing(build):
+    start = time.perf_counter()
+    for sequenceNumber in range(N):
+        build(PAYLOAD, sequenceNumber)
+    return (time.perf_counter() - start) / N * 1e9
+
+
+def nothing(payload, sequenceNumber):
+    return None
+
+
+def main():
+    # what the measuring itself allocates, taken off the results
+    basePeak, baseRetained = allocations(nothing)
+    for name, build in (("concatenate", concatenate), ("PacketBuilder", builder())):
+        peak, retained = allocations(build)
+        peak, retained = max(peak - basePeak, 0), max(retained - baseRetained, 0)
+        print(f"{name:>14}: {timing(build):6.0f} ns/packet, {peak:5.1f} bytes allocated/packet, "
+              f"{retained:5.1f} bytes retained/packet")
+
+
+if __name__ == "__main__":
+    main()
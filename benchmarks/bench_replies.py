@@ -0,0 +1,88 @@
+"""Microbenchmark: decode throughput for camera replies.
+
+Compares what used to be done to each reply as it went up through the layers (reading the header to match it, the
+NAK substring check and data[8]/data[9] reads to log and pace it, then slicing the header off to decode it) with
+replies.decode, which reads the header and VISCA body once and hands every layer the same Reply.
+
+The two are timed in turn, best of several runs each, and the exit status is 1 if replies.decode takes more than
+--max-ratio times as long as the checks it replaced. Run from the repository root:
+
+    python -m benchmarks.bench_replies
+"""
+import argparse
+import sys
+import time
+
+from sony_visca import replies
+
+# ack, completion, a block lens inquiry reply and a buffer full error, each with the VISCA over IP header
+REPLIES = [
+    bytes.fromhex("01110003 00000005 9041ff"),
+    bytes.fromhex("01110003 00000005 9051ff"),
+    bytes.fromhex("01110011 00000006 9050 0102030405060708090a0b0c0d0e ff"),
+    bytes.fromhex("01110004 00000007 906003ff"),
+]
+N = 200000
+
+
+def substrings(data):
+    # matching it to its command (the old _replyKey)
+    if data[0:2] == b"\x02\x01":
+        key, final = "control", True
+    else:
+        final = not (len(data) > 9 and data[8] == 0x90 and (data[9] & 0xf0) == 0x40)
+        key = int.from_bytes(data[4:8], 'big')
+    # logging it (the old _logReply) and pacing (the old _paceReply)
+    nak = b"NAK" in data
+    kind = error = None
+    if len(data) > 10 and data[8] == 0x90:
+        kind = data[9] & 0xf0
+        if kind == 0x60:
+            error = data[10]
+    bufferFull = len(data) > 10 and data[8] == 0x90 and (data[9] & 0xf0) == 0x60 and data[10] == 0x03
+    # trimmed again before decoding (doTrimBecauseJamieSucks)
+    return key, final, nak, kind, error, bufferFull, data[8:]
+
+
+def decoded(data):
+    reply = replies.decode(data)
+    key, final = reply.key, reply.final
+    bufferFull = reply.kind is replies.ERROR and reply.error == replies.BUFFER_FULL
+    return key, final, reply.kind, reply.error, bufferFull, reply.payload
+
+
+def timing(decode):
+    """One run, in ns per reply"""
+    start = time.perf_counter()
+    for _ in range(N // len(REPLIES)):
+        for data in REPLIES:
+            decode(data)
+    return (time.perf_counter() - start) / N * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7, help="runs of each, the best is taken")
+    parser.add_argument(
+        "--max-ratio", type=float, default=1.0, help="replies.decode time allowed, as a multiple of the old checks'"
+    )
+    args = parser.parse_args()
+
+    best = {"substrings": None, "replies.decode": None}
+    for _ in range(args.repeat):
+        # in turn, so a busy spell on the machine slows both rather than just one
+        for name, decode in (("substrings", substrings), ("replies.decode", decoded)):
+            ns = timing(decode)
+            best[name] = ns if best[name] is None else min(best[name], ns)
+    for name, ns in best.items():
+        print(f"{name:>14}: {ns:6.0f} ns/reply, {1e9 / ns / 1e6:5.2f} M replies/s")
+    ratio = best["replies.decode"] / best["substrings"]
+    print(f"{'ratio':>14}: {ratio:6.2f}")
+    if ratio > args.max_ratio:
+        print(f"REGRESSION replies.decode takes {ratio:.2f}x as long, over --max-ratio {args.max_ratio}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Benchmark: a socket per camera against every camera sharing the local socket, with 200 simulated cameras.
+
+For each way of sending, in a fresh process so neither sees the other's memory, measures:
+  - file descriptors and memory (traced by tracemalloc, and the growth in RSS) the open cameras take, per camera
+  - CPU time per command, every camera sending commands at once, and the commands/s that gives
+
+The simulated cameras run in a process of their own (python -m sony_visca.simulator) so only the controller's side is
+counted. Results are printed as JSON, --baseline and --save work as in the other benchmarks. Whatever the baseline, the
+exit status is 1 if any command goes unanswered, or if a camera takes more than LIMITS allows (the fds and memory that
+would grow without bound as cameras are added). Run from the repository root:
+
+    python -m benchmarks.bench_shared_socket --baseline benchmarks/baseline_shared_socket.json
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks import gate
+from sony_visca.async_camera import AsyncViscaCamera
+from sony_visca.simulator.server import FIRST_IP, SONY_PORT
+from sony_visca.visca_commands import Command
+
+MODES = ("per_camera", "shared")
+HIGHER_IS_BETTER = tuple(f"{mode} commands_per_second" for mode in MODES)
+# the most each may be at any scale, an open camera takes one socket of its own at most and none when sharing
+LIMITS = {
+    "per_camera fds_per_camera": 1.05,
+    "shared fds_per_camera": 0.05,
+    "per_camera traced_bytes_per_camera": 32 * 1024,
+    "shared traced_bytes_per_camera": 32 * 1024,
+    "per_camera errors": 0,
+    "shared errors": 0,
+}
+
+
+def openFiles():
+    """File descriptors this process has open, None where /proc isn't there to count them"""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def rss():
+    """Resident memory of this process in bytes, None without /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+async def measure(args, shared):
+    first = ipaddress.ip_address(FIRST_IP)
+    cameras = [
+        AsyncViscaCamera(f"SIM{number + 1}", str(first + number), "02-00-00-00-00-00", port=SONY_PORT,
+                         shared_socket=shared)
+        for number in range(args.cameras)
+    ]
+    results = {}
+    # the local socket is opened with the first camera, leave it out of the per camera figures
+    await cameras[0].open()
+    files = openFiles()
+    memory = rss()
+    tracemalloc.start()
+    try:
+        await asyncio.gather(*(camera.open() for camera in cameras[1:]))
+        traced = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    opened = len(cameras) - 1
+    if files is not None:
+        results["fds_per_camera"] = (openFiles() - files) / opened
+    results["traced_bytes_per_camera"] = traced / opened
+    if memory is not None:
+        results["rss_bytes_per_camera"] = (rss() - memory) / opened
+
+    async def run(camera):
+        for number in range(args.commands):
+            await camera.send(Command.ZoomPos(number * 100 % 0x4000), override=False)
+
+    try:
+        before = sum(camera.stats["commands"] for camera in cameras)
+        cpu = time.process_time()
+        start = time.perf_counter()
+        await asyncio.gather(*(run(camera) for camera in cameras))
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        commands = sum(camera.stats["commands"] for camera in cameras) - before
+        results["cpu_us_per_command"] = cpu / commands * 1e6
+        results["commands_per_second"] = commands / elapsed
+        results["errors"] = sum(camera.stats["errors"] + camera.stats["timeouts"] for camera in cameras)
+    finally:
+        await asyncio.gather(*(camera.close() for camera in cameras))
+    return results
+
+
+def runMode(args, mode):
+    """Measure one way of sending in a process of its own"""
+    command = [
+        sys.executable, "-m", "benchmarks.bench_shared_socket", "--mode", mode,
+        "--cameras", str(args.cameras), "--commands", str(args.commands),
+    ]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output)
+
+
+def startSimulator(args):
+    simulator = subprocess.Popen(
+        [
+            sys.executable, "-m", "sony_visca.simulator", "--sony", str(args.cameras), "--seed", "1",
+            "--latency", str(args.latency), "--execution", str(args.execution),
+        ],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    for line in simulator.stdout:
+        if line.startswith("Sweep"):
+            return simulator
+    simulator.kill()
+    raise RuntimeError("The simulator didn't start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cameras", type=int, default=200)
+    parser.add_argument("--commands", type=int, default=20, help="commands each camera sends")
+    parser.add_argument("--latency", type=float, default=0.001, help="simulated camera reply latency")
+    parser.add_argument("--execution", type=float, default=0.002, help="simulated command execution time")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)  # measure one, with the simulator running
+    gate.addArguments(parser, tolerance=0.5)
+    args = parser.parse_args()
+    # the numbers are of the sockets, not of writing debug logs
+    for name in ("ptz", "ptz.visca"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    if args.mode:
+        print(json.dumps(asyncio.run(measure(args, args.mode == "shared"))))
+        return 0
+
+    simulator = startSimulator(args)
+    try:
+        results = {}
+        for mode in MODES:
+            for name, value in runMode(args, mode).items():
+                results[f"{mode} {name}"] = value
+    finally:
+        simulator.terminate()
+        simulator.wait()
+    results["cameras"] = args.cameras
+    results["python"] = platform.python_version()
+    print(json.dumps(results, indent=2))
+    return gate.check(results, args, HIGHER_IS_BETTER, matching=("cameras",), limits=LIMITS)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Regression gate shared by the benchmarks: store a run as a baseline, then fail later runs that got worse.
+
+Metrics can also have limits, the most they may ever be (e.g. memory growth under a flood), which fail a run whether or
+not there's a baseline to compare with.
+"""
+import json
+import sys
+
+
+def addArguments(parser, tolerance=0.25, runs=None):
+    """Add the gate's options, and --runs if the benchmark takes the median of several runs
+
+    runs is the default number of runs, and the fewest a baseline is saved from or compared with, as the median of
+    fewer swings too much to gate on.
+    """
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--save", help="write the results here as a new baseline")
+    parser.add_argument(
+        "--tolerance", type=float, default=tolerance, help="fraction worse that counts as a regression"
+    )
+    if runs is not None:
+        parser.add_argument(
+            "--runs", type=int, default=runs, help=f"runs to take the median of, fewer than {runs} aren't gated"
+        )
+        parser.set_defaults(gateRuns=runs)
+
+
+def compare(results, baseline, tolerance, higherIsBetter=(), tolerances=None):
+    """The metrics more than tolerance (a fraction) worse than baseline, as lines to print
+
+    Metrics are lower is better unless named in higherIsBetter, anything that isn't a number in both is skipped.
+    tolerances gives metrics that need their own tolerance, e.g. tail latencies, by name.
+    """
+    tolerances = tolerances or {}
+    regressions = []
+    for name, value in results.items():
+        before = baseline.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or not before:
+            continue
+        change = (value - before) / before
+        if name in higherIsBetter:
+            change = -change
+        if change > tolerances.get(name, tolerance):
+            regressions.append(f"{name}: {before:.3f} -> {value:.3f} ({change:+.0%} worse)")
+    return regressions
+
+
+def bound(results, limits):
+    """The metrics over their limit, as lines to print
+
+    limits gives the most each metric may be by name. One missing from results (e.g. where it can't be measured) isn't
+    checked.
+    """
+    exceeded = []
+    for name, limit in limits.items():
+        value = results.get(name)
+        if isinstance(value, (int, float)) and value > limit:
+            exceeded.append(f"{name}: {value:.3f} over the limit of {limit}")
+    return exceeded
+
+
+def checkLimits(results, limits):
+    """Print the metrics over their limits, returns the exit status"""
+    exceeded = bound(results, limits)
+    for line in exceeded:
+        print("OVER LIMIT", line, file=sys.stderr)
+    return 1 if exceeded else 0
+
+
+def check(results, args, higherIsBetter=(), matching=(), gated=None, tolerances=None, limits=None):
+    """Save and/or compare results as the command line asked, returns the exit status
+
+    The baseline has to have the same values for the keys in matching (e.g. the number of cameras), otherwise the
+    runs aren't comparable and the status is 2. If gated is given, only the metrics it returns True for are compared.
+    With fewer --runs than addArguments was given, nothing is saved or compared, with a warning rather than a failure.
+    limits (see bound) are checked either way.
+    """
+    status = checkLimits(results, limits or {})
+    fewest = getattr(args, "gateRuns", None)
+    if fewest is not None and args.runs < fewest and (args.save or args.baseline):
+        print(
+            f"WARNING only {args.runs} runs, the median of fewer than {fewest} is too noisy to gate on,"
+            " not saving or comparing with a baseline",
+            file=sys.stderr,
+        )
+        return status
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if not args.baseline:
+        return status
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    for key in matching:
+        if baseline.get(key) != results.get(key):
+            print(f"Baseline has {key} {baseline.get(key)}, not {results.get(key)}", file=sys.stderr)
+            return 2
+    regressions = compare(
+        {
+            name: value for name, value in results.items()
+            if name not in matching and (gated is None or gated(name))
+        },
+        baseline, args.tolerance,
+        higherIsBetter, tolerances,
+    )
+    for line in regressions:
+        print("REGRESSION", line, file=sys.stderr)
+    return 1 if regressions else status
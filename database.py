@@ -3,12 +3,29 @@ import sqlite3
 DATABASE = "./database.sqlite3"
 _db = None
 
+# Tables created on first connection if they don't already exist
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS camera_pacing (model TEXT PRIMARY KEY, gap REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS camera_groups (name TEXT NOT NULL, mac TEXT NOT NULL, PRIMARY KEY (name, mac))",
+]
+
+# Columns added to existing tables since they were created, as (table, column, definition)
+COLUMNS = [
+    ("cameras", "transport", "TEXT NOT NULL DEFAULT 'auto'"),  # udp, tcp or auto
+]
+
 
 def get():
     global _db
     if _db is None:
         _db = sqlite3.connect(DATABASE)
         _db.row_factory = sqlite3.Row
+        for statement in SCHEMA:
+            _db.execute(statement)
+        for table, column, definition in COLUMNS:
+            existing = [row["name"] for row in _db.execute(f"PRAGMA table_info({table})")]
+            if existing and column not in existing:
+                _db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
     return _db
 
 
@@ -30,4 +47,44 @@ def query(query, args=(), one=False, commit=False):
     cur.close()
     if commit:
         db.commit()
-    return (rv[0] if rv else None) if one else rv
\ No newline at end of file
+    return (rv[0] if rv else None) if one else rv
+
+
+def save_cameras(cameras):
+    """Add or update many found cameras at once, as (name, ip, type, mac). Cameras with a display name keep it"""
+    db = get()
+    known = {row["mac"] for row in db.execute("SELECT mac FROM cameras")}
+    db.executemany(
+        "UPDATE cameras SET name = ?, ip = ?, type = ?, autocreated = 1 WHERE mac = ? AND (display_name IS NULL OR display_name = '')",
+        [camera for camera in cameras if camera[3] in known],
+    )
+    # the ones with a display name keep it, but not an IP they've since lost
+    db.executemany(
+        "UPDATE cameras SET ip = ? WHERE mac = ? AND display_name IS NOT NULL AND display_name <> ''",
+        [(camera[1], camera[3]) for camera in cameras if camera[3] in known],
+    )
+    db.executemany(
+        "INSERT INTO cameras (name, ip, type, mac, autocreated) VALUES (?, ?, ?, ?, 1)",
+        [camera for camera in cameras if camera[3] not in known],
+    )
+    db.commit()
+
+
+def groups():
+    """Camera groups as {group name: [camera macs]}"""
+    rv = {}
+    for row in query("SELECT name, mac FROM camera_groups ORDER BY name, rowid"):
+        rv.setdefault(row["name"], []).append(row["mac"])
+    return rv
+
+
+def save_group(name, macs):
+    """Create or replace a camera group"""
+    db = get()
+    db.execute("DELETE FROM camera_groups WHERE name = ?", (name,))
+    db.executemany("INSERT OR IGNORE INTO camera_groups (name, mac) VALUES (?, ?)", [(name, mac) for mac in macs])
+    db.commit()
+
+
+def delete_group(name):
+    query("DELETE FROM camera_groups WHERE name = ?", (name,), commit=True)
@@ -5,7 +5,8 @@ import subprocess
 import sys
 import re
 import logging
-import time
+import functools
+import ipaddress
 
 from getmac import get_mac_address
 
@@ -17,9 +18,12 @@ from PyQt5.uic import loadUi
 
 import database
 from ButtonControl import ButtonControl
+from CameraBridge import CameraBridge
 from CameraPinger import CameraPinger
 from sony_visca.visca_ip_camera import ViscaIPCamera
 from sony_visca.visca_commands import Command, Inquiry, Lookups
+from sony_visca import capture, metrics
+from sony_visca.pacing import PacingController
 from SerialControl import SerialControl
 
 
@@ -66,10 +70,14 @@ class MainScreen(QMainWindow):
         self.selectedCamera = None
         self.selectedCameraName = ""
         self.cameras = {}
+        # with many cameras, send to them all from the one local socket instead of a socket each
+        ViscaIPCamera.SHARED_SOCKET = os.environ.get("PTZ_SHARED_SOCKET", "0") != "0"
 
         self.tempUI = [] # list in which to store temporary UI items that need to be removed on a page change
 
         loadUi("MainUI.ui", self)
+        self.cameraBridge = CameraBridge()
+        self.cameraBridge.discoveryEvent.connect(self.discoveryEvent)
         self.ButtonControl = ButtonControl(self)
         self.ButtonControl.connectUIButtons()
         self.uiUpdateTrigger.connect(self.UISignalReceiver)
@@ -141,7 +149,9 @@ class MainScreen(QMainWindow):
 
         self.show()
 
-        self.discoverCameras()
+        self.startCapture()
+        self.startDiscovery()
+        self.startMetrics()
         # self.debug()
         self.nextCamera() # select a camera to start with please
 
@@ -262,18 +272,51 @@ class MainScreen(QMainWindow):
         else:
             log.warning("[PingCallback] Unable to find camera")
 
-    def doCameraCommand(self, command, **kwargs):
-        """Perform a camera action on the active camera handling errors and removing disconnected cameras."""
+    def doCameraCommand(self, command, callback=None, **kwargs):
+        """Perform a camera action on the active camera handling errors and removing disconnected cameras.
+        Doesn't wait for the camera, callback(result) is called on the UI thread once it has answered.
+        """
         if not self.selectedCamera:
             log.warning("!! No cam active !!")
             return
         if not self.selectedCamera.is_connected:
             log.warning("Skipping camera command, not connected!")
             return
-        if isinstance(command, Command):
-            self.selectedCamera.queueCommands(command, override=True)
-        else:
-            self.selectedCamera.queueCommands(Command(command, **kwargs), override=True)
+        if not isinstance(command, Command):
+            command = Command(command, **kwargs)
+        self.cameraBridge.queueCommands(
+            self.selectedCamera, command, override=True,
+            callback=(lambda results: callback(results[0] if results else None)) if callback else None,
+        )
+
+    def groupCameras(self, group=None):
+        """Cameras in a group from the database, or every camera if group is None"""
+        cameras = [cam for cam in self.cameras.values() if cam]
+        if group is None:
+            return cameras
+        macs = database.groups().get(group, [])
+        return [cam for cam in cameras if cam.mac in macs]
+
+    def doGroupCommand(self, group, command, callback=None, timeout=2, **kwargs):
+        """Send a camera action to every camera in a group at once (or all cameras if group is None).
+        callback(results) is called on the UI thread with a FleetResult per camera, failures are reported per camera.
+        """
+        cameras = self.groupCameras(group)
+        if not cameras:
+            log.warning("No cameras in group %r", group)
+            return
+        if not isinstance(command, Command):
+            command = Command(command, **kwargs)
+
+        def onResults(results):
+            failed = [f"{result.camera} ({result.error})" for result in results or [] if not result.ok]
+            if failed:
+                self.popup(f"{len(failed)} camera(s) failed")
+                log.warning("Group command %r failed on: %s", command, ", ".join(failed))
+            if callback:
+                callback(results)
+
+        self.cameraBridge.watch(ViscaIPCamera.broadcast(cameras, command, timeout=timeout), onResults)
 
     def getManualCamerasFromdb(self):
         """Get camera objects from DB data"""
@@ -284,121 +327,205 @@ class MainScreen(QMainWindow):
             if row["display_name"] and row["display_name"]!="":
                 display_name = row["display_name"]
             if row["type"] == "sony":
-                extras.append(ViscaIPCamera(display_name if display_name else row["name"], row["ip"], row["mac"])) # TODO: update mac?
+                extras.append(ViscaIPCamera(display_name if display_name else row["name"], row["ip"], row["mac"], transport=row["transport"])) # TODO: update mac?
             else:
-                extras.append(ViscaIPCamera(display_name if display_name else row["name"], row["ip"], row["mac"], port=1259, simple_visca=True))
+                extras.append(ViscaIPCamera(display_name if display_name else row["name"], row["ip"], row["mac"], port=1259, simple_visca=True, transport=row["transport"]))
         log.info("Found %d extra cameras (from db) (includes autocreated with added display names)", len(extras))
         return extras
 
+    def pacingModel(self, cam):
+        """Key learnt command pacing by model, or by camera type if the model is unknown"""
+        return cam.model or ("chinese" if cam.simple_visca else "sony")
+
+    def loadCameraPacing(self, cam):
+        """Start a camera off with the command pacing learnt for its model"""
+        row = database.query("SELECT gap FROM camera_pacing WHERE model = ?", (self.pacingModel(cam),), one=True)
+        if row:
+            cam.pacing = PacingController(row["gap"])
+
+    def saveCameraPacing(self):
+        """Store the learnt command pacing, the slowest camera of each model wins"""
+        gaps = {}
+        for cam in self.cameras.values():
+            if cam and cam.pacing.successes:
+                model = self.pacingModel(cam)
+                gaps[model] = max(gaps.get(model, 0), cam.pacing.gap)
+        for model, gap in gaps.items():
+            database.query("INSERT OR REPLACE INTO camera_pacing (model, gap) VALUES (?, ?)", (model, gap))
+        database.commit()
+
+    def startDiscovery(self):
+        """Add the cameras from the database, then keep listening for cameras on the network"""
+        for camera in self.getManualCamerasFromdb():
+            self.showCamera(camera)
+        self.discoveryListener = ViscaIPCamera.listen(self.cameraBridge.discoveryEvent.emit)
+
+    def startCapture(self):
+        """Record all camera traffic to the ring file named by PTZ_CAPTURE, if it's set, for sony_visca.capture to read"""
+        self.capture = None
+        path = os.environ.get("PTZ_CAPTURE")
+        if path:
+            try:
+                self.capture = capture.start(path)
+            except OSError as e:
+                log.warning("Couldn't capture camera traffic to %s: %r", path, e)
+
+    def startMetrics(self):
+        """Serve the cameras' latency and throughput metrics locally, for Prometheus or a browser"""
+        try:
+            self.metricsUrl = ViscaIPCamera.serveMetrics(lambda: list(self.cameras.values()))
+        except OSError as e:
+            log.warning("Couldn't start the metrics server: %r", e)
+            self.metricsUrl = None
+
     def discoverCameras(self):
+        """Ask every camera to answer the discovery listener now, the list updates itself as they reply"""
         self.infoPopup.setText("Searching...")
         self.infoPopup.show()
-        updateUI()
         log.info("Searching for cameras")
-        found = ViscaIPCamera.discoverCameras()
-        found += ViscaIPCamera.discoverNonSony()
-        #TODO: sometimes discovery can duplicate a camera, causing failure then in removing an already-removed item when re-generating the UI list
-        log.info("Found %d cameras", len(found))
-        updateUI()
-        self.popup("Found "+str(len(found))+" cameras")
-
-        if found:
-            for cam in found:
-                # database fun
-                row = database.query("SELECT * FROM cameras WHERE mac = ?", (cam.mac,), one=True)
-                if row:
-                    # update it
-                    if row["display_name"] and row["display_name"] != "":
-                        log.debug("Skipping camera[%s,%s] update as has set display_name (%s)",cam.name, cam.ip, row["display_name"])
-                        continue
-                    log.debug("Updating camera[%s,%s] to database",cam.name, cam.ip)
-                    database.query(
-                        "UPDATE cameras SET name = ?, type = ?, ip = ?, autocreated = 1 WHERE mac = ?",
-                        (cam.name, "chinese" if cam.simple_visca else "sony", cam.ip, cam.mac),
-                    )
-                    # Set the display name of the camera if set in db
-                    if row["display_name"]:
-                        cam.name = row["display_name"]
-                else:
-                    # Create it
-                    log.debug("Adding new camera[%s,%s] to database", cam.name, cam.ip)
-                    database.query(
-                        "INSERT INTO cameras (name, ip, type, mac, autocreated) VALUES (?, ?, ?, ?, 1)",
-                        (cam.name, cam.ip, "chinese" if cam.simple_visca else "sony", cam.mac),
-                    )
-                database.commit()
-
-        manualExtras = self.getManualCamerasFromdb()
-
-        for camera in manualExtras:
-            for fcamera in found:
-                if fcamera.mac == camera.mac:
-                    log.info("Found a manual db entry that matches a found camera, using stored display name")
-                    fcamera.name = camera.name
-                    break # inner loop
-            else:
-                # else for for loop (if not break'd)
-                found.append(camera) # just add cameras that we don't know about
+        ViscaIPCamera.announce()
+        QTimer.singleShot(1000, lambda: self.popup("Found "+str(len(self.discoveryListener.cameras))+" cameras"))
 
-        database.close()
-
-        known_ips = [c.ip for k, c in self.cameras.items()] # old list of ips
-        known_names = list(self.cameras.keys()) # old list of cam names
-        # no clearing as we find the previous found cameras and update them
-        #TODO: clear out old cameras that are properly gone
-        #self.cameras.clear()  # do NOT re-initialise as we've passed a reference to other bits
-        notFound = list(self.cameras.keys()) # we'll remove cameras as we find them, anything left we need to remove
-        stuckCameras = [i.text() for i in self.cameraListWidget.findItems('.*', QtCore.Qt.MatchRegExp)] # bodge to remove stuck cameras in list widget
+    def sweepCameras(self, networks):
+        """Probe every address in the networks (CIDR strings) for cameras the discovery broadcast can't reach"""
+        try:
+            for network in networks:
+                ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            self.popup("Invalid IP range!")
+            return
+        self.infoPopup.setText("Sweeping...")
+        self.infoPopup.show()
+        log.info("Sweeping %s for cameras", ", ".join(networks))
 
-        if found:
+        def onFound(found):
+            if found is None:
+                self.popup("Sweep failed")
+                return
+            database.save_cameras([(cam.name, cam.ip, "chinese" if cam.simple_visca else "sony", cam.mac) for cam in found])
+            rows = {row["mac"]: row for row in database.query("SELECT mac, display_name, transport FROM cameras")}
             for cam in found:
-                if cam.ip not in known_ips:
-                    try:
-                        cam.initialise()
-                        self.updateCameraProperties(camera=cam)
-                    except socket.timeout:
-                        # probably camera is on a different network
-                        log.warning("Failed to initialise camera %s",str(cam))
-                    log.info("Adding '%s'",str(cam))
-                    self.cameras[str(cam)] = cam
-
-                    cameraItem = QListWidgetItem(str(cam))
-                    cameraItem.setData(QtCore.Qt.UserRole, cam)
-                    self.cameraListWidget.addItem(cameraItem)
-
-                else:
-                    # camera already existed (presumably)
-                    oldName = known_names[known_ips.index(cam.ip)]
-                    self.cameras.pop(oldName)
-                    if oldName in notFound: # in case there's a duplicate ip or something
-                        notFound.remove(oldName)
-                    if oldName in stuckCameras:
-                        stuckCameras.remove(oldName)
-
-                    self.cameras[str(cam)] = cam
-                    items = self.cameraListWidget.findItems(oldName, QtCore.Qt.MatchExactly)
-                    if len(items)==1:
-                        items[0].setData(QtCore.Qt.UserRole, cam)
-                    else:
-                        log.error("Failed to find existing camera in QListWidget")
-
-        # delete old cameras that have disappeared
-        for camName in notFound:
-            self.cameras.pop(camName)
-            # find qlistwidget item
-            item = self.cameraListWidget.findItems(camName, QtCore.Qt.MatchExactly)[0]
-            index = self.cameraListWidget.row(item)
-            self.cameraListWidget.takeItem(index)
-            log.info("Removed missing camera %s",item.data(QtCore.Qt.UserRole))
-            del item
-        for cam in stuckCameras:
-            items = self.cameraListWidget.findItems(cam, QtCore.Qt.MatchExactly)
-            if len(items)>0:
-                index = self.cameraListWidget.row(items[0])
-                if index>=0:
-                    self.cameraListWidget.takeItem(index)
-                    log.info("Removed stuck camera %s",camName.text())
-
+                row = rows.get(cam.mac)
+                if row:
+                    cam.transport = row["transport"]
+                    cam.name = row["display_name"] or cam.name
+                _, known = self.findCamera(cam.mac)
+                if known is not None and known.ip != cam.ip:
+                    self.moveCamera(known, cam)
+                self.showCamera(cam)
+            self.popup("Found "+str(len(found))+" cameras")
+
+        self.cameraBridge.watch(ViscaIPCamera.sweep(networks), onFound)
+
+    def storeCamera(self, cam):
+        """Add or update a discovered camera in the database, picking up its display name and transport"""
+        row = database.query("SELECT * FROM cameras WHERE mac = ?", (cam.mac,), one=True)
+        if row:
+            # update it
+            cam.transport = row["transport"]
+            if row["display_name"] and row["display_name"] != "":
+                log.debug("Keeping camera[%s,%s] display_name (%s), updating only its IP",cam.name, cam.ip, row["display_name"])
+                cam.name = row["display_name"]
+                database.query("UPDATE cameras SET ip = ? WHERE mac = ?", (cam.ip, cam.mac), commit=True)
+                return
+            log.debug("Updating camera[%s,%s] to database",cam.name, cam.ip)
+            database.query(
+                "UPDATE cameras SET name = ?, type = ?, ip = ?, autocreated = 1 WHERE mac = ?",
+                (cam.name, "chinese" if cam.simple_visca else "sony", cam.ip, cam.mac),
+            )
+        else:
+            # Create it
+            log.debug("Adding new camera[%s,%s] to database", cam.name, cam.ip)
+            cam.transport = "auto" # the database default
+            database.query(
+                "INSERT INTO cameras (name, ip, type, mac, autocreated) VALUES (?, ?, ?, ?, 1)",
+                (cam.name, cam.ip, "chinese" if cam.simple_visca else "sony", cam.mac),
+            )
+        database.commit()
+
+    def initialiseCamera(self, cam):
+        """Open a camera on the camera loop without waiting, its properties are fetched once it's ready"""
+        self.loadCameraPacing(cam)
+        self.cameraBridge.watch(cam.initialiseAsync(), lambda _: self.updateCameraProperties(camera=cam))
+
+    def discoveryEvent(self, event):
+        """Apply one change from the discovery listener to the camera list"""
+        cam = event.camera
+        if event.kind == event.ADDED:
+            self.storeCamera(cam)
+            _, known = self.findCamera(cam.mac)
+            if known is not None and known.ip != cam.ip:
+                # loaded from the database at the IP it had last time, it's been given a new one since
+                self.moveCamera(known, cam)
+            self.showCamera(cam)
+        elif event.kind == event.MOVED:
+            self.storeCamera(cam)
+            _, known = self.findCamera(cam.mac)
+            if known is None:
+                self.showCamera(cam)
+                return
+            self.moveCamera(known, cam)
+        elif event.kind == event.REMOVED:
+            name, known = self.findCamera(cam.mac)
+            row = database.query("SELECT autocreated FROM cameras WHERE mac = ?", (cam.mac,), one=True)
+            if known is None or (row and not row["autocreated"]):
+                return # cameras added by hand stay, whether or not they answer discovery
+            self.cameras.pop(name)
+            items = self.cameraListWidget.findItems(name, QtCore.Qt.MatchExactly)
+            if items:
+                self.cameraListWidget.takeItem(self.cameraListWidget.row(items[0]))
+            known.closeAsync()
+            log.info("Removed missing camera %s", known)
+
+    def moveCamera(self, known, cam):
+        """Reconnect a camera we have at the IP it's been found at"""
+        log.info("Camera %s moved from %s to %s, reconnecting", known.name, known.ip, cam.ip)
+        known.interface = cam.interface
+
+        def onReopened(_):
+            # the IP in its list name only changes once it's reopened
+            name, _ = self.findCamera(known.mac)
+            if name is not None:
+                self.renameCamera(name, known)
+            self.updateCameraProperties(camera=known)
+
+        self.cameraBridge.watch(known.reopenAsync(cam.ip), onReopened)
+
+    def findCamera(self, mac):
+        """The (list name, camera) we have for a MAC, (None, None) if there isn't one"""
+        for name, known in self.cameras.items():
+            if known and known.mac == mac:
+                return name, known
+        return None, None
+
+    def renameCamera(self, name, cam):
+        """Update the key and list item of a camera listed as name, after its name or IP has changed"""
+        if name == str(cam):
+            return
+        self.cameras[str(cam)] = self.cameras.pop(name)
+        items = self.cameraListWidget.findItems(name, QtCore.Qt.MatchExactly)
+        if len(items)==1:
+            items[0].setText(str(cam))
+        else:
+            log.error("Failed to find existing camera in QListWidget")
+
+    def showCamera(self, cam):
+        """Add a camera to the list and open it, unless we already have it"""
+        name, known = self.findCamera(cam.mac)
+        if known is not None:
+            # camera already existed, keep the one that's connected but pick up any new name
+            known.name = cam.name
+            known.model = cam.model or known.model
+            self.renameCamera(name, known)
+            return
+        log.info("Adding '%s'",str(cam))
+        self.initialiseCamera(cam)
+        self.cameras[str(cam)] = cam
+        cameraItem = QListWidgetItem(str(cam))
+        cameraItem.setData(QtCore.Qt.UserRole, cam)
+        self.cameraListWidget.addItem(cameraItem)
+        if self.cameraListWidget.currentItem() is None:
+            self.cameraListWidget.setCurrentItem(cameraItem) # select a camera to start with please
 
     def changeSelectedCamera(self):
         if self.selectedCamera and self.selectedCamera.is_connected:
@@ -484,22 +611,38 @@ class MainScreen(QMainWindow):
         except KeyError:
             log.error("KeyError whilst looking up selected camera properties")
 
-    def updateCameraProperties(self, camera=None, full=True, type=""):
+    def updateCameraProperties(self, camera=None, full=True, type="", callback=None):
+        """Fetch camera properties without waiting, the UI is updated (and callback called) once they're all in"""
         if camera is None:
             if self.selectedCamera is None:
                 return
             camera = self.selectedCamera
+        inquiries = []
         if type=="block" or full:
-            camera.properties.decodeBlockControl(camera.inquire(Command(Inquiry.BlockControl)))
+            inquiries.append((Inquiry.BlockControl, camera.properties.decodeBlockControl))
         if type=="blockOther" or full:
-            camera.properties.decodeBlockOther(camera.inquire(Command(Inquiry.BlockOther)))
+            inquiries.append((Inquiry.BlockOther, camera.properties.decodeBlockOther))
         if type=="blockEnlargement" or full:
-            camera.properties.decodeBlockEnlargement1(camera.inquire(Command(Inquiry.BlockEnlargement)))
+            inquiries.append((Inquiry.BlockEnlargement, camera.properties.decodeBlockEnlargement1))
         if type=="" or full:
-            camera.properties.decodeBlockLens(camera.inquire(Command(Inquiry.BlockLens)))  # TODO: seperate out the camera inquire and check if it actualy responded
-            camera.properties.decodePanTiltPosition(camera.inquire(Command(Inquiry.PanTiltPos)))
+            inquiries.append((Inquiry.BlockLens, camera.properties.decodeBlockLens))  # TODO: seperate out the camera inquire and check if it actualy responded
+            inquiries.append((Inquiry.PanTiltPos, camera.properties.decodePanTiltPosition))
 
-        self.updatePropertiesUI()
+        if not inquiries:  # type matched nothing to fetch
+            if callback:
+                callback()
+            return
+        remaining = [len(inquiries)]
+        def onReply(decode, response):
+            decode(response)
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                self.updatePropertiesUI()
+                if callback:
+                    callback()
+
+        for inquiry, decode in inquiries:
+            self.cameraBridge.inquire(camera, Command(inquiry), functools.partial(onReply, decode))
 
     def toggleCameraProperty(self, parameter, qwidget, textTrue, textFalse, commandTrue=None, commandFalse=None, toggle=True, default=True):
         # toggles a parameter on a camera and/or checks what state the paramters is in and udpdates relevent bits
@@ -569,7 +712,7 @@ class MainScreen(QMainWindow):
         })
 
     def cameraConfigScreen(self):
-        self.labelTopLeft.setText("Discover Cameras")
+        self.labelTopLeft.setText("Camera Groups")
         self.labelMidLeft.setText("Home Screen")
         self.labelBottomLeft.setText("Settings")
         self.labelCenterLeft.setText("Recall Preset")
@@ -604,6 +747,7 @@ class MainScreen(QMainWindow):
                 try:
                     if self.selectedCamera:
                         self.selectedCamera.setIP(ip=self._tempIPAddress, netmask=newSubnet)
+                        ViscaIPCamera.announce() # the listener moves it to the new IP once it answers there
                 except socket.timeout:
                     self.popup("Failed to set IP: timeout")
                     log.warning("Failed to set IP: timeout")
@@ -658,7 +802,7 @@ class MainScreen(QMainWindow):
             self.selectedCamera.queueCommands(Command(Command.PanTiltReset, skipCompletion=True))
 
         self.ButtonControl.connectFunctions({
-            "TopLeft": lambda: self.discoverCameras(),
+            "TopLeft": lambda: self.changeView(self.groupsScreen),
             "MidLeft": lambda: self.changeView(self.homeScreen),
             "BottomLeft": lambda: self.changeView(self.networkConfigScreen),
             "MidRight": lambda: changeName(),
@@ -671,6 +815,91 @@ class MainScreen(QMainWindow):
             "Prev": lambda: self.nextCamera(-1),
         })
 
+    def groupsScreen(self):
+        self.labelTopLeft.setText("Camera Config")
+        self.labelMidLeft.setText("Home Screen")
+        self.labelBottomLeft.setText("Settings")
+        self.labelCenterLeft.setText("Group Recall Preset")
+        self.labelCenterMid.setText("Group Store Preset")
+        self.labelCenterRight.setText("Group Home")
+        self.labelBottomRight.setText("Delete Group")
+        self.labelMidRight.setText("Remove From Group")
+        self.labelTopRight.setText("Add To Group")
+        self.labelCurrentScreen.setText("Camera Groups")
+
+        def showGroups():
+            names = {cam.mac: str(cam) for cam in self.cameras.values() if cam}
+            lines = [
+                "Group "+group+": "+", ".join(names.get(mac, mac) for mac in macs)
+                for group, macs in database.groups().items()
+            ]
+            self.textView.setText("\n".join(lines) or "No camera groups")
+            self.textView.show()
+
+        def withGroup(title, func):
+            def onGroup(group):
+                if group and group.strip() != "":
+                    func(group.strip())
+            self.ButtonControl.input("", title, onGroup)
+
+        def addToGroup(group):
+            if not self.selectedCamera:
+                log.info("No camera selected to add to a group!")
+                return
+            macs = database.groups().get(group, [])
+            database.save_group(group, macs + [self.selectedCamera.mac])
+            self.popup("Added "+str(self.selectedCamera)+" to group "+group)
+            showGroups()
+
+        def removeFromGroup(group):
+            if not self.selectedCamera:
+                log.info("No camera selected to remove from a group!")
+                return
+            macs = [mac for mac in database.groups().get(group, []) if mac != self.selectedCamera.mac]
+            if macs:
+                database.save_group(group, macs)
+            else:
+                database.delete_group(group)
+            self.popup("Removed "+str(self.selectedCamera)+" from group "+group)
+            showGroups()
+
+        def deleteGroup(group):
+            def onConfirm():
+                database.delete_group(group)
+                self.popup("Deleted group "+group)
+                showGroups()
+            self.dialogBox("Delete group "+group+" - are you sure?", onConfirm)
+
+        def groupPreset(group, store):
+            def confirm(num):
+                if num and num.strip() != "":
+                    num = int(num)
+                    self.popup(("Storing" if store else "Recalling")+" Preset "+str(num)+" on group "+group)
+                    self.doGroupCommand(group, Command(Command.MemorySet(num) if store else Command.MemoryRecall(num)))
+            self.ButtonControl.input("", ("Store" if store else "Recall")+" Preset on group "+group+":", confirm)
+
+        def groupHome(group):
+            def onConfirm():
+                self.doGroupCommand(group, Command(Command.PanTiltHome))
+                self.popup("Homing group "+group)
+            self.dialogBox("Home group "+group+" - are you sure?", onConfirm)
+
+        showGroups()
+
+        self.ButtonControl.connectFunctions({
+            "TopLeft": lambda: self.changeView(self.cameraConfigScreen),
+            "MidLeft": lambda: self.changeView(self.homeScreen),
+            "BottomLeft": lambda: self.changeView(self.networkConfigScreen),
+            "TopRight": lambda: withGroup("Add camera to group:", addToGroup),
+            "MidRight": lambda: withGroup("Remove camera from group:", removeFromGroup),
+            "BottomRight": lambda: withGroup("Delete group:", deleteGroup),
+            "CenterLeft": lambda: withGroup("Recall preset on group:", lambda group: groupPreset(group, False)),
+            "CenterMid": lambda: withGroup("Store preset on group:", lambda group: groupPreset(group, True)),
+            "CenterRight": lambda: withGroup("Home group:", groupHome),
+            "Next": lambda: self.nextCamera(),
+            "Prev": lambda: self.nextCamera(-1),
+        })
+
     def networkConfigScreen(self):
         self.labelTopLeft.setText("Discover Cameras")
         self.labelMidLeft.setText("Camera Config")
@@ -717,11 +946,31 @@ class MainScreen(QMainWindow):
             interface = ""
 
 
+        def ms(seconds):
+            if seconds is None:
+                return "-"
+            if seconds == float("inf"):
+                return ">{:.0f}ms".format(metrics.LATENCY_BUCKETS[-1] * 1000)
+            return "{:.0f}ms".format(seconds * 1000)
+
+        cameraLinks = ""
+        for camName, cam in self.cameras.items():
+            if cam:
+                cameraLinks += "{}: retries {}, recovered {}, resyncs {}, timeouts {}\n".format(
+                    camName, cam.stats["retries"], cam.stats["recovered"], cam.stats["resyncs"], cam.stats["timeouts"])
+                cameraLinks += "    ack p50 {} p99 {}, stop wait p99 {}, errors {}, queued {}, superseded {}, sent {}B, received {}B\n".format(
+                    ms(cam.ackTimes.quantile(0.5)), ms(cam.ackTimes.quantile(0.99)), ms(cam.stopWaits.quantile(0.99)),
+                    cam.stats["errors"], cam.queueDepth, cam.superseded, cam.stats["bytesSent"], cam.stats["bytesReceived"])
+        if self.metricsUrl:
+            cameraLinks += "Metrics: "+self.metricsUrl+"\n"
+
         self.textView.setText("Network IP: "+str(ip)+"\n"+
                               "Found Cameras: "+str(len(self.cameras))+"\n"+
                               "Missing Cameras: "+"0"+"\n"+
                               "FrontPanel Connected: "+str(self.serial.isConnected())+"\n"+
                               "\n"+
+                              cameraLinks+
+                              "\n"+
                               str(interface)
                               )
 
@@ -764,6 +1013,11 @@ class MainScreen(QMainWindow):
                         self.labelCenterMid.setText("Recall Preset")
                         self.ButtonControl.functionPressDict["CenterMid"] = lambda: self.storePreset()
                         return
+                    if "/" in newip_:
+                        self.sweepCameras(newip_.split())
+                        self.labelCenterMid.setText("Recall Preset")
+                        self.ButtonControl.functionPressDict["CenterMid"] = lambda: self.storePreset()
+                        return
                     try:
                         socket.inet_aton(newip_)
 
@@ -776,8 +1030,8 @@ class MainScreen(QMainWindow):
                         else:
                             # todo determine the type of camera
                             log.debug("Adding new camera: %s[%s,%s]", newName, newip_,mac)
-                            cam = ViscaIPCamera(newName, newip_, mac, simple_visca=True if "#" in newName else False)
-                            cam.initialise()
+                            cam = ViscaIPCamera(newName, newip_, mac, simple_visca=True if "#" in newName else False, transport="auto")
+                            self.initialiseCamera(cam)
                             camItem = QListWidgetItem(str(cam))
                             camItem.setData(QtCore.Qt.UserRole, cam)
                             self.cameraListWidget.addItem(camItem)
@@ -802,7 +1056,7 @@ class MainScreen(QMainWindow):
 
                 self.labelCenterMid.setText("•")
                 self.ButtonControl.functionPressDict["CenterMid"] = lambda: self.ButtonControl.typeChar(".")
-                self.ButtonControl.input("", "Camera IP", setIP)
+                self.ButtonControl.input("", "Camera IP (or range, e.g. 10.0.1.0/24, to sweep)", setIP)
 
             self.ButtonControl.input("", "Camera Name (# for simpleVisca)", setName)
 
@@ -812,6 +1066,7 @@ class MainScreen(QMainWindow):
                     "DELETE FROM cameras WHERE mac = ?",
                     (self.selectedCamera.mac,),
                 )
+                database.query("DELETE FROM camera_groups WHERE mac = ?", (self.selectedCamera.mac,))
                 database.commit()
                 self.popup(f"Sucesfully deleted {self.selectedCameraName}")
                 deletingQItem = self.cameraListWidget.currentItem()
@@ -1041,8 +1296,6 @@ class MainScreen(QMainWindow):
         layout.addWidget(title)
         layout.addWidget(buttonFrame)
 
-        self.updateCameraProperties()
-
         buttonExposure = QPushButton("\nExposure\n\n")
         buttonExposure.clicked.connect(lambda event: buttonCallback("exposure"))
         buttonWhiteBalance = QPushButton("\nWhite\nBalance\n")
@@ -1104,15 +1357,20 @@ class MainScreen(QMainWindow):
             elif button == "infodisp":
                 self.toggleCameraProperty("infoDisplay", buttonInfoDisplay, "\nInfo Display\nOn\n", "\nInfo Display\nOff\n", Command.InfoDisplayOn, Command.InfoDisplayOff, default=False)
 
-        self.toggleCameraProperty("backlightComp", buttonBacklight, "\nBacklight\nComp On\n", "\nBacklight\nComp Off\n", toggle=False)
-        self.toggleCameraProperty("highResolution", buttonHighRes, "\nHigh Resolution\nOn\n", "\nHigh Resolution\nOff\n", toggle=False)
-        self.toggleCameraProperty("highSensitivity", buttonHighSensitivity, "\nHigh Sensitivity\nOn\n", "\nHigh Sensitivity\nOff\n", toggle=False)
-        self.toggleCameraProperty("infoDisplay", buttonInfoDisplay, "\nInfo Display\nOn\n", "\nInfo Display\nOff\n", toggle=False, default=False)
+        def refreshToggles():
+            if frame not in self.tempUI:
+                return # menu was closed before the camera answered
+            self.toggleCameraProperty("backlightComp", buttonBacklight, "\nBacklight\nComp On\n", "\nBacklight\nComp Off\n", toggle=False)
+            self.toggleCameraProperty("highResolution", buttonHighRes, "\nHigh Resolution\nOn\n", "\nHigh Resolution\nOff\n", toggle=False)
+            self.toggleCameraProperty("highSensitivity", buttonHighSensitivity, "\nHigh Sensitivity\nOn\n", "\nHigh Sensitivity\nOff\n", toggle=False)
+            self.toggleCameraProperty("infoDisplay", buttonInfoDisplay, "\nInfo Display\nOn\n", "\nInfo Display\nOff\n", toggle=False, default=False)
 
         self.layout().addWidget(frame)
         frame.setFixedSize(700, 400)
         frame.move(int(self.width() / 2 - frame.width() / 2), int(self.height() / 2 - frame.height() / 2))
         self.tempUI.append(frame)
+        refreshToggles() # show what we last knew straight away
+        self.updateCameraProperties(callback=refreshToggles)
 
     def exposureMenu(self):
         cancelFrame = QFrame()
@@ -1140,19 +1398,20 @@ class MainScreen(QMainWindow):
 
         def buttonCallback(button):
             if button=="auto":
-                self.doCameraCommand(Command.ExposureAuto)
+                self.doCameraCommand(Command.ExposureAuto, callback=refreshHighlight)
             elif button=="shutter":
-                self.doCameraCommand(Command.ExposureShutterPriority)
+                self.doCameraCommand(Command.ExposureShutterPriority, callback=refreshHighlight)
             elif button=="iris":
-                self.doCameraCommand(Command.ExposureIrisPriority)
+                self.doCameraCommand(Command.ExposureIrisPriority, callback=refreshHighlight)
             elif button=="manual":
-                self.doCameraCommand(Command.ExposureManual)
+                self.doCameraCommand(Command.ExposureManual, callback=refreshHighlight)
 
-            time.sleep(0.05) # urghh
-            self.updateCameraProperties(type="block", full=False)
-            highlightButton(self.selectedCamera.properties.exposureMode, buttons)
             # self.changeView() # close the popup
 
+        def refreshHighlight(*_):
+            # once the mode change has completed, ask the camera what it's now in
+            self.updateCameraProperties(type="block", full=False, callback=lambda: highlightButton(self.selectedCamera.properties.exposureMode, buttons))
+
         buttonAuto = QPushButton("\nFull Auto\n\n")
         buttonAuto.clicked.connect(lambda event: buttonCallback("auto"))
         buttonPriority = QPushButton("\nShutter Priority\n\n")
@@ -1214,8 +1473,7 @@ class MainScreen(QMainWindow):
             elif button == "manual":
                 self.doCameraCommand(Command.WBManual)
 
-            self.updateCameraProperties()
-            highlightButton(self.selectedCamera.properties.whiteBalanceMode, buttons)
+            self.updateCameraProperties(callback=lambda: highlightButton(self.selectedCamera.properties.whiteBalanceMode, buttons))
             # self.changeView()  # close the popup
 
         buttonAuto = QPushButton("\nAuto WB\n\n")
@@ -1339,8 +1597,7 @@ class MainScreen(QMainWindow):
                 self.doCameraCommand(Command.NoiseReduction(4))
             elif button == "5":
                 self.doCameraCommand(Command.NoiseReduction(5))
-            self.updateCameraProperties()
-            highlightButton(self.selectedCamera.properties.noiseReduction, buttons)
+            self.updateCameraProperties(callback=lambda: highlightButton(self.selectedCamera.properties.noiseReduction, buttons))
             # self.changeView()  # close the popup
 
         buttonOff = QPushButton("\nOff\n\n")
@@ -1420,10 +1677,17 @@ class MainScreen(QMainWindow):
         self.serial.stop()
         log.info("Stopping camera pinger")
         self.pinger.stop()
+        log.info("Saving camera pacing")
+        self.saveCameraPacing()
+        log.info("Stopping discovery")
+        ViscaIPCamera.stopListening()
+        ViscaIPCamera.stopMetrics()
         log.info("Stopping cameras")
         for camName, cam in self.cameras.items():
             if cam:
                 cam.close()
+        if self.capture is not None:
+            capture.stop(self.capture)
         log.info("Exiting")
         a0.accept()
 
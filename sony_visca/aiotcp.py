@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import logging
+
+from sony_visca import replies
+from sony_visca.aioudp import PendingReply
+
+LOGGER = logging.getLogger("ptz.aiotcp")
+
+_POOL = {}  # (host, port) -> TcpConnection shared by every camera object for that address
+
+
+class TcpConnection:
+	"""One long-lived VISCA over TCP connection to a camera, reconnecting in the background when it drops
+
+	The stream is raw (headerless) VISCA, so there are no sequence numbers: replies come back in the order commands
+	were sent. An ack (0x4Y) answers the oldest command still waiting for its first reply and ties it to socket Y,
+	completions and errors for socket Y finish that command, and anything else (inquiry replies, errors before an
+	ack) finishes the oldest command waiting. Commands that timed out stay in line until the camera answers them so
+	a late reply can't be taken for the next command's.
+	"""
+	CONNECT_TIMEOUT = 1
+	RECONNECT_MIN = 0.5  # seconds before the first reconnect attempt, doubled for each failure after
+	RECONNECT_MAX = 5
+
+	def __init__(self, host, port):
+		self.host = host
+		self.port = port
+		self._refs = 0
+		self._reader = None
+		self._writer = None
+		self._task = None
+		self._connected = asyncio.Event()
+		self._closed = False
+		self._pending = {}  # (host, key) -> PendingReply, as PendingReply expects of an endpoint
+		self._key = 0
+		self._order = collections.deque()  # PendingReply waiting for their first reply, oldest first
+		self._sockets = {}  # camera socket number -> acknowledged PendingReply waiting for completion
+		self.late_replies = 0
+		self.reconnects = 0
+
+	def __repr__(self):
+		return f"<TcpConnection {self.host}:{self.port} {'connected' if self.connected else 'disconnected'}>"
+
+	@property
+	def connected(self):
+		return self._connected.is_set()
+
+	def start(self):
+		if self._task is None:
+			self._task = asyncio.create_task(self._run())
+
+	async def wait_connected(self, timeout=CONNECT_TIMEOUT):
+		"""Wait for the connection to be up, returns whether it is"""
+		try:
+			await asyncio.wait_for(self._connected.wait(), timeout)
+		except asyncio.TimeoutError:
+			pass
+		return self.connected
+
+	def expect(self, timeout=1, final_timeout=None):
+		"""Register for the replies to the next command sent, returns a PendingReply"""
+		if self._closed:
+			raise IOError("Connection is closed")
+		self._key += 1
+		pending = PendingReply(self, self.host, self._key, timeout, final_timeout)
+		self._pending[(self.host, self._key)] = pending
+		self._order.append(pending)
+		return pending
+
+	def send(self, data, pending=None):
+		"""Send a command, dropped if the connection is down
+
+		pending is the PendingReply expect() gave for it. If the command is dropped that fails straight away with
+		asyncio.TimeoutError and leaves the line, otherwise the replies to later commands would be fed to it.
+		"""
+		if not self.connected:
+			LOGGER.debug("Not connected to %s:%d, dropping %r", self.host, self.port, data)
+			if pending is not None:
+				if pending in self._order:
+					self._order.remove(pending)
+				pending._fail(asyncio.TimeoutError())
+			return
+		self._writer.write(data)
+
+	def reconnect(self):
+		"""Drop the connection and make a new one, to get back in step with the camera"""
+		if self._writer is not None:
+			self._writer.close()
+
+	async def close(self):
+		"""Release this connection, it's closed once nothing else is using it"""
+		self._refs -= 1
+		if self._refs > 0:
+			return
+		_POOL.pop((self.host, self.port), None)
+		self._closed = True
+		if self._task is not None:
+			self._task.cancel()
+			await asyncio.gather(self._task, return_exceptions=True)
+		self._disconnected(IOError("Connection is closed"))
+
+	async def _run(self):
+		delay = self.RECONNECT_MIN
+		while True:
+			try:
+				self._reader, self._writer = await asyncio.wait_for(
+					asyncio.open_connection(self.host, self.port), self.CONNECT_TIMEOUT
+				)
+			except (OSError, asyncio.TimeoutError) as e:
+				LOGGER.debug("Couldn't connect to %s:%d: %r", self.host, self.port, e)
+				await asyncio.sleep(delay)
+				delay = min(delay * 2, self.RECONNECT_MAX)
+				continue
+			LOGGER.info("Connected to %s:%d", self.host, self.port)
+			delay = self.RECONNECT_MIN
+			self._connected.set()
+			try:
+				await self._read()
+			except OSError as e:
+				LOGGER.warning("Connection to %s:%d failed: %r", self.host, self.port, e)
+			finally:
+				self._disconnected(asyncio.TimeoutError())
+			self.reconnects += 1
+			LOGGER.info("Lost connection to %s:%d, reconnecting", self.host, self.port)
+
+	async def _read(self):
+		buffer = bytearray()
+		while True:
+			data = await self._reader.read(1024)
+			if not data:
+				return
+			buffer += data
+			while True:
+				end = buffer.find(b"\xff")
+				if end < 0:
+					break
+				frame = bytes(buffer[:end + 1])
+				del buffer[:end + 1]
+				self._feed_reply(replies.decode(frame))
+
+	def _feed_reply(self, reply):
+		if reply.kind == replies.ACK:
+			pending = self._next()
+			if pending is not None:
+				pending.feed(reply, False)
+				self._sockets[reply.socket] = pending
+				return
+		elif reply.kind in (replies.COMPLETION, replies.ERROR) and reply.socket in self._sockets:
+			self._sockets.pop(reply.socket).feed(reply, True)
+			return
+		else:
+			pending = self._next()
+			if pending is not None:
+				pending.feed(reply, True)
+				return
+		self.late_replies += 1
+		LOGGER.debug("Unexpected reply from %s: %r", self.host, reply)
+
+	def _next(self):
+		"""The oldest command waiting for its first reply"""
+		return self._order.popleft() if self._order else None
+
+	def _disconnected(self, exc):
+		"""Forget the stream, everything in flight fails with exc"""
+		self._connected.clear()
+		if self._writer is not None:
+			self._writer.close()
+		self._reader = self._writer = None
+		self._order.clear()
+		self._sockets.clear()
+		for pending in list(self._pending.values()):
+			pending._fail(exc)
+
+
+async def open_tcp_connection(host, port):
+	"""Get the shared connection to host:port, starting it if it's new. close() it when finished with"""
+	connection = _POOL.get((host, port))
+	if connection is None:
+		connection = _POOL[(host, port)] = TcpConnection(host, port)
+		connection.start()
+	connection._refs += 1
+	return connection
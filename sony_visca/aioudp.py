@@ -35,18 +35,31 @@ COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER I
 OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-__all__ = ['open_local_endpoint', 'open_remote_endpoint']
+__all__ = ['open_local_endpoint', 'open_remote_endpoint', 'set_capture']
 
 
 # Imports
 
 import asyncio
-import warnings
 import logging
 import collections
 
 LOGGER = logging.getLogger("ptz.aioudp")
 
+# Capture directions
+SENT = 0
+RECEIVED = 1
+
+_capture = None
+
+
+def set_capture(capture):
+    """Record the traffic of every endpoint with capture.record(direction, addr, data), or stop if None.
+    addr is the (host, port) of the other end, for both directions.
+    """
+    global _capture
+    _capture = capture
+
 
 # Datagram protocol
 
@@ -60,6 +73,7 @@ class DatagramEndpointProtocol(asyncio.DatagramProtocol):
 
     def connection_made(self, transport):
         self._endpoint._transport = transport
+        self._endpoint._peer = transport.get_extra_info("peername")
 
     def connection_lost(self, exc):
         assert exc is None
@@ -70,11 +84,20 @@ class DatagramEndpointProtocol(asyncio.DatagramProtocol):
     # Datagram protocol methods
 
     def datagram_received(self, data, addr):
-        self._endpoint.feed_datagram(data, addr)
+        endpoint = self._endpoint
+        endpoint.datagrams_received += 1
+        endpoint.bytes_received += len(data)
+        if _capture is not None:
+            _capture.record(RECEIVED, addr, data)
+        if endpoint.allowed is not None and addr[0] not in endpoint.allowed:
+            endpoint.datagrams_rejected += 1
+            return
+        endpoint.feed_datagram(data, addr)
 
     def error_received(self, exc):
-        msg = 'Endpoint received an error: {!r}'
-        warnings.warn(msg.format(exc))
+        # e.g. ICMP port unreachable from a camera that's off, counted rather than warned about on every send
+        self._endpoint.errors_received += 1
+        LOGGER.debug("Endpoint received an error: %r", exc)
 
     # Workflow control
 
@@ -94,24 +117,48 @@ class DatagramEndpointProtocol(asyncio.DatagramProtocol):
 class Endpoint:
     """High-level interface for UDP endpoints.
     Can either be local or remote.
-    It is initialized with an optional queue size for the incoming datagrams.
+    Incoming datagrams wait in a ring buffer per source host of queue_size datagrams, for at most max_sources hosts.
+    When a source's buffer is full its oldest datagram is dropped, datagrams from further sources are dropped, and
+    receive() takes from the sources in turn. If `allowed` is set to a set of hosts, datagrams from anywhere else are
+    dropped as they arrive (allow() and disallow() keep it for hosts more than one user expects datagrams from).
+    Drops are counted, not warned about.
     """
-
-    def __init__(self, queue_size=None):
-        if queue_size is None:
-            queue_size = 0
-        self._queue = asyncio.Queue(queue_size)
+    QUEUE_SIZE = 32
+    MAX_SOURCES = 256
+
+    def __init__(self, queue_size=None, max_sources=None):
+        self._queue_size = queue_size or self.QUEUE_SIZE
+        self._max_sources = max_sources or self.MAX_SOURCES
+        self._queues = {}  # host -> deque of (data, addr), only hosts with datagrams waiting, in turn order
+        self._ready = asyncio.Event()
         self._closed = False
         self._transport = None
+        self._peer = None
         self._write_ready_future = None
+        self.allowed = None  # hosts datagrams are accepted from, None for any
+        self._allowing = collections.Counter()  # host -> allow() calls not yet disallow()ed
+        # Traffic counters, for metrics
+        self.datagrams_sent = 0
+        self.bytes_sent = 0
+        self.datagrams_received = 0
+        self.bytes_received = 0
+        self.datagrams_dropped = 0  # buffers full
+        self.datagrams_rejected = 0  # not from an allowed host
+        self.errors_received = 0
 
     # Protocol callbacks
 
     def feed_datagram(self, data, addr):
-        try:
-            self._queue.put_nowait((data, addr))
-        except asyncio.QueueFull:
-            warnings.warn('Endpoint queue is full')
+        queue = self._queues.get(addr[0])
+        if queue is None:
+            if len(self._queues) >= self._max_sources:
+                self.datagrams_dropped += 1
+                return
+            queue = self._queues[addr[0]] = collections.deque(maxlen=self._queue_size)
+        elif len(queue) == self._queue_size:
+            self.datagrams_dropped += 1  # the oldest makes way
+        queue.append((data, addr))
+        self._ready.set()
 
     def close(self):
         # Manage flag
@@ -119,30 +166,56 @@ class Endpoint:
             return
         self._closed = True
         # Wake up
-        if self._queue.empty():
-            self.feed_datagram(None, None)
+        self._ready.set()
         # Close transport
         if self._transport:
             self._transport.close()
 
     # User methods
 
+    def allow(self, host):
+        """Accept datagrams from host, until it's disallow()ed as many times as it was allowed.
+        This turns the allow-list on if it was off.
+        """
+        if self.allowed is None:
+            self.allowed = set()
+        self._allowing[host] += 1
+        self.allowed.add(host)
+
+    def disallow(self, host):
+        """Undo one allow(host)."""
+        self._allowing[host] -= 1
+        if self._allowing[host] <= 0:
+            del self._allowing[host]
+            if self.allowed is not None:
+                self.allowed.discard(host)
+
     def send(self, data, addr):
         """Send a datagram to the given address."""
         if self._closed:
             raise IOError("Endpoint is closed")
         self._transport.sendto(data, addr)
+        self.datagrams_sent += 1
+        self.bytes_sent += len(data)
+        if _capture is not None:
+            _capture.record(SENT, addr or self._peer, data)
 
     async def receive(self):
         """Wait for an incoming datagram and return it with
         the corresponding address.
         This method is a coroutine.
         """
-        if self._queue.empty() and self._closed:
-            raise IOError("Endpoint is closed")
-        data, addr = await self._queue.get()
-        if data is None:
-            raise IOError("Endpoint is closed")
+        while not self._queues:
+            if self._closed:
+                raise IOError("Endpoint is closed")
+            self._ready.clear()
+            await self._ready.wait()
+        host, queue = next(iter(self._queues.items()))
+        data, addr = queue.popleft()
+        # to the back of the line, so one busy source can't starve the others
+        del self._queues[host]
+        if queue:
+            self._queues[host] = queue
         return data, addr
 
     def abort(self):
@@ -170,25 +243,112 @@ class Endpoint:
         return self._closed
 
 
+class PendingReply:
+    """Replies expected from one address for one key.
+    `first` resolves with the first reply, `final` with the reply that finishes the exchange (which may be the same
+    one). Each stage fails with asyncio.TimeoutError if nothing arrives within `timeout` seconds (`final_timeout`
+    for the final reply if given).
+    """
+
+    def __init__(self, endpoint, addr, key, timeout, final_timeout=None):
+        loop = asyncio.get_event_loop()
+        self.first = loop.create_future()
+        self.final = loop.create_future()
+        self._endpoint = endpoint
+        self._addr = addr
+        self._key = key
+        self._final_timeout = timeout if final_timeout is None else final_timeout
+        self._timer = loop.call_later(timeout, self._fail, asyncio.TimeoutError)
+
+    def feed(self, data, final):
+        """Resolve with a reply, `final` being whether it finishes the exchange."""
+        if not self.first.done():
+            self.first.set_result(data)
+            if not final:
+                # Rearm the timeout for the final reply
+                self._timer.cancel()
+                self._timer = self.first.get_loop().call_later(self._final_timeout, self._fail, asyncio.TimeoutError)
+        if final:
+            if not self.final.done():
+                self.final.set_result(data)
+            self.close()
+
+    def close(self):
+        """Stop waiting for replies, any still outstanding are cancelled."""
+        self._timer.cancel()
+        if self._endpoint._pending.get((self._addr, self._key)) is self:
+            del self._endpoint._pending[(self._addr, self._key)]
+        for future in (self.first, self.final):
+            if not future.done():
+                future.cancel()
+
+    def _fail(self, exc):
+        # Only the stage being waited on gets the exception, so it's always retrieved
+        if not self.first.done():
+            self.first.set_exception(exc)
+        elif not self.final.done():
+            self.final.set_exception(exc)
+        self.close()
+
+
 class LocalEndpoint(Endpoint):
     """High-level interface for UDP local endpoints.
-    It is initialized with an optional queue size for the incoming datagrams.
+    Replies are dispatched straight from datagram_received to the PendingReply registered by expect() for the
+    (address, key) pair, where `reply_key(data)` gives the (key, final) of a datagram. If given, `reply_frames(data)`
+    splits a datagram holding several replies into the individual replies first. Set `allowed` to the hosts replies
+    are expected from, so stray traffic is dropped before it's decoded.
     """
     # Note: usually this can be left blank (i.e. exact implementation of Endpoint) but we need to be able to have
     #  selective receives.
 
-    def __init__(self, queue_size=None):
-        if queue_size is None:
-            queue_size = 0
+    def __init__(self, queue_size=None, reply_key=None, reply_frames=None):
         super().__init__(queue_size=queue_size)
-        self._queues = collections.defaultdict(lambda: asyncio.Queue(queue_size))
+        self._reply_key = reply_key or (lambda data: (None, True))
+        self._reply_frames = reply_frames or (lambda data: (data,))
+        self._pending = {}  # (addr, key) -> PendingReply
+        self._unmatched_handlers = {}  # addr -> callable for datagrams no PendingReply wanted
+        self.late_replies = collections.Counter()  # addr -> datagrams that arrived with no one waiting for them
 
     def feed_datagram(self, data, addr):
         addr, port = addr
-        try:
-            self._queues[addr].put_nowait(data)
-        except asyncio.QueueFull:
-            warnings.warn(f"Endpoint queue {addr} is full")
+        for frame in self._reply_frames(data):
+            self._feed_reply(frame, addr)
+
+    def _feed_reply(self, data, addr):
+        key, final = self._reply_key(data)
+        pending = self._pending.get((addr, key))
+        if pending is not None:
+            pending.feed(data, final)
+            return
+        handler = self._unmatched_handlers.get(addr)
+        if handler is not None and handler(data, final):
+            return
+        if addr in self.late_replies or len(self.late_replies) < self._max_sources:
+            self.late_replies[addr] += 1
+        else:
+            self.late_replies[None] += 1  # from too many hosts to count each
+        LOGGER.debug("Late reply from %s (key %r): %r", addr, key, data)
+
+    def expect(self, addr, key, timeout=1, final_timeout=None):
+        """Register for the replies from addr matching key, returns a PendingReply."""
+        if self._closed:
+            raise IOError("Endpoint is closed")
+        pending = PendingReply(self, addr, key, timeout, final_timeout)
+        self._pending[(addr, key)] = pending
+        return pending
+
+    def pending(self, addr):
+        """The replies currently expected from addr."""
+        return [pending for (a, key), pending in self._pending.items() if a == addr]
+
+    def set_unmatched_handler(self, addr, handler):
+        """Handle datagrams from addr that no PendingReply was waiting for.
+        handler(data, final) returns True if it dealt with the datagram, otherwise it's counted as a late reply.
+        """
+        if handler is None:
+            self._unmatched_handlers.pop(addr, None)
+        else:
+            self._unmatched_handlers[addr] = handler
 
     def close(self):
         # Manage flag
@@ -196,25 +356,12 @@ class LocalEndpoint(Endpoint):
             return
         self._closed = True
         # Wake up
-        for addr, queue in self._queues.items():
-            if queue.empty():
-                try:
-                    queue.put_nowait(None)
-                except asyncio.QueueFull:
-                    warnings.warn(f"Endpoint queue {addr} is full")
+        for pending in list(self._pending.values()):
+            pending._fail(IOError("Endpoint is closed"))
         # Close transport
         if self._transport:
             self._transport.close()
 
-    async def receive(self, addr):
-        """Wait for an incoming datagram to a specific address."""
-        if self._queues[addr].empty() and self._closed:
-            raise IOError("Endpoint is closed")
-        data = await self._queues[addr].get()
-        if data is None:
-            raise IOError("Endpoint is closed")
-        return data
-
 
 class RemoteEndpoint(Endpoint):
     """High-level interface for UDP remote enpoints.
@@ -251,14 +398,15 @@ async def open_datagram_endpoint(
 
 
 async def open_local_endpoint(
-        host='0.0.0.0', port=0, *, queue_size=None, **kwargs):
+        host='0.0.0.0', port=0, *, queue_size=None, reply_key=None, reply_frames=None, **kwargs):
     """Open and return a local datagram endpoint.
-    An optional queue size arguement can be provided.
+    An optional queue size arguement can be provided, and reply_key/reply_frames functions to match replies to
+    expect() calls.
     Extra keyword arguments are forwarded to `loop.create_datagram_endpoint`.
     """
     return await open_datagram_endpoint(
         host, port, remote=False,
-        endpoint_factory=lambda: LocalEndpoint(queue_size),
+        endpoint_factory=lambda: LocalEndpoint(queue_size, reply_key, reply_frames),
         **kwargs)
 
 
@@ -0,0 +1,625 @@
+import asyncio
+import collections
+import functools
+import logging
+import socket
+import time
+
+from InquiryDecode import CameraProperties
+from sony_visca import aioudp, aiotcp, netif, replies
+from sony_visca.metrics import Histogram
+from sony_visca.packet import PacketBuilder
+from sony_visca.visca_commands import Command, Priority
+from sony_visca.scheduler import CommandScheduler
+from sony_visca.pacing import PacingController
+
+LOGGER = logging.getLogger("ptz.visca")
+
+
+class ReplyTimeout(asyncio.TimeoutError):
+	"""No reply from the camera in time, acknowledged is whether the command got as far as an acknowledge"""
+
+	def __init__(self, acknowledged):
+		super().__init__("acknowledged" if acknowledged else "no reply")
+		self.acknowledged = acknowledged
+
+
+_RESET_SEQUENCE_NUMBER = bytes.fromhex('02 00 00 01 00 00 00 01 01')
+
+
+def _replyKey(reply):
+	"""Replies are matched to commands by sequence number (replies.CONTROL for control replies)"""
+	return reply.key, reply.final
+
+
+class AsyncViscaCamera:
+	"""A VISCA over IP camera driven from an asyncio event loop
+
+	Everything is a coroutine running on the loop the camera was opened on, so one loop can drive any number of
+	cameras without extra threads. All cameras share one local socket (replies always come back to port 52381),
+	which is opened with the first camera and closed with the last, so all cameras must be opened on the same loop.
+	Commands to Sony cameras go out of a socket of their own unless shared_socket is set (or SHARED_SOCKET for all
+	cameras), then they're sent from the local socket too, so a camera costs no file descriptor or transport of its own.
+	A camera whose interface the routing table wouldn't send out of keeps a socket of its own even then.
+
+		async with AsyncViscaCamera("CAM1", "192.168.0.100", "00-00-00-00-00-00") as cam:
+			await cam.send(Command.PanTiltHome)
+			lens = await cam.inquire(Inquiry.BlockLens)
+	"""
+	_LOCAL_SOCK = None
+	_LOCAL_LOOP = None  # loop the local socket belongs to
+	_LOCAL_OPENING = None  # Task opening the local socket, for cameras opened at the same time to wait on
+	_OPEN_CAMS = 0  # cameras (and anything else) using the local socket
+
+	DEFAULT_WINDOW = 2  # commands in flight for cameras that match replies by sequence number
+	UNMATCHED_FALLBACK = 3  # unmatched replies before assuming the firmware can't pipeline
+	RETRIES = 2  # times an idempotent command is resent when nothing comes back
+	RETRY_TIMEOUT = 0.2  # seconds to wait before the first resend, doubled for each one after
+	SEQUENCE_ERROR_RESYNC = 2  # sequence number errors from the camera before resetting it
+	TIMEOUT_RESYNC = 3  # commands in a row timing out before resetting the sequence number
+	SOCKETS = 2  # command buffers in a VISCA camera, commands of different classes can execute in each at once
+	BUFFER_FULL_RETRIES = 3  # times a command is resent when the camera's command buffers are full
+	BUFFER_FULL_BACKOFF = 0.05  # seconds before resending after buffer full, doubled for each one after
+	TCP_PORT = 5678  # raw VISCA over TCP on PTZOptics-style cameras
+	LATE_REPLY_DRAIN = 0.25  # seconds replies to a timed out headerless command are discarded for after it
+	TRANSPORTS = ("udp", "tcp", "auto")
+	SHARED_SOCKET = False  # default for shared_socket, send to every camera from the local socket
+	RECEIVE_BUFFER = 1 << 20  # bytes asked for on the local socket, so replies from many cameras at once aren't dropped
+
+	def __init__(self, name, ip, mac, netmask="255.255.255.0", gateway="0.0.0.0", port=52381, device_id=None, simple_visca=False, window=None, model=None, transport="udp", interface=None, shared_socket=None):
+		self.sequenceNumber = 1 # starts at 1?
+		self.name = name
+		self.ip = ip
+		self.mac = mac # mac using dashes to seperate
+		self.netmask = netmask
+		self.gateway = gateway
+		self.port = port
+		self.is_connected = False
+		self.device_id = device_id
+		self.simple_visca = simple_visca
+		self.model = model
+		# udp, tcp (simple_visca cameras only) or auto to use tcp if the camera accepts a connection
+		if transport not in self.TRANSPORTS:
+			raise ValueError(f"Unknown transport {transport!r}")
+		self.transport = transport
+		self.interface = interface  # netif.Interface the camera was found on, None to go by the routing table
+		# send from the local socket (replies are told apart by address anyway) rather than a socket per camera
+		self.shared_socket = self.SHARED_SOCKET if shared_socket is None else shared_socket
+		self._tcp = None  # aiotcp.TcpConnection when commands go over TCP
+		self.pacing = PacingController()  # gap between queued commands, learnt per model
+		self._remote_sock = None
+		self._packets = PacketBuilder()  # reusable buffer commands are framed in
+		self._queue_loop = None  # Handle to the Task running the queue processing loop
+		self.cmd_queue = None
+		# Number of commands allowed in flight at once, 1 is lockstep (send, ack, completion, then the next command)
+		self._requestedWindow = window
+		if window is None:
+			window = 1 if simple_visca else self.DEFAULT_WINDOW
+		self.window = window
+		self._inflight = set()  # Tasks sending commands taken from the queue
+		self._executing = collections.Counter()  # lane -> commands sent and not yet finished, inquiries aside
+		self._slot_free = None
+		self._unmatched = 0
+		# commands, errors, retries, recovered, timeouts, sequenceErrors, resyncs, bufferFull, bytesSent, bytesReceived
+		self.stats = collections.Counter()
+		self.ackTimes = Histogram()  # seconds from sending a command to its acknowledge
+		self.completionTimes = Histogram()  # seconds from a command's acknowledge to its completion
+		self.inquiryTimes = Histogram()  # seconds from sending an inquiry to its reply
+		self.stopWaits = Histogram()  # seconds stop commands spent queued before sending
+		self._generation = 0  # bumped on every sequence number reset
+		self._sequenceErrors = 0
+		self._consecutiveTimeouts = 0
+		self._resync = None  # Handle to the Task resetting the sequence number after a desync
+		self._drainUntil = None  # monotonic time to discard late headerless replies until, before the next send
+		self._opened = False
+
+		self.properties = CameraProperties()
+
+	def __str__(self):
+		return f"{self.name}({self.mac}) {self.ip}"
+
+	def __repr__(self):
+		return f"<{self.__class__.__name__} name={self.name!r} mac={self.mac!r}>"
+
+	async def __aenter__(self):
+		await self.open()
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		await self.close()
+
+	async def open(self):
+		"""Open the sockets to this camera on the running loop, and reset its sequence number"""
+		await self._openLocal()
+		await self._initialise()
+
+	async def close(self):
+		"""Close this camera, and the shared local socket if this is the last camera open"""
+		await self._close()
+		await self._closeLocal()
+
+	async def reopen(self, ip=None):
+		"""Close the sockets to this camera and open them again, at a new IP if it has moved"""
+		await self._close()
+		if ip is not None:
+			self.ip = ip
+		await self._initialise()
+
+	async def send(self, command, override=True):
+		"""Queue a command (a Command or its bytes) and wait for the camera to finish it
+		It goes in the lane for its axis, where it replaces older motion commands unless override=False, returns the
+		final reply or None if it was superseded or timed out.
+		"""
+		if not isinstance(command, Command):
+			command = Command(command)
+		results = await self._queueAndWait(command, override=override)
+		return results[0]
+
+	async def inquire(self, command):
+		"""Send an inquiry (an Inquiry or a Command wrapping one) and wait for the reply, None on timeout"""
+		if not isinstance(command, Command):
+			command = Command(command)
+		return await self._inquire(command)
+
+	async def inquire_many(self, *commands):
+		"""Send several inquiries at once, returns the replies in the same order"""
+		commands = [command if isinstance(command, Command) else Command(command) for command in commands]
+		return list(await asyncio.gather(*(self._inquire(command) for command in commands)))
+
+	async def _openLocal(self):
+		"""Open the local socket replies come back to, if this is the first camera"""
+		if not self._opened:
+			await self.openLocalSocket()
+			self._opened = True
+
+	@staticmethod
+	async def openLocalSocket():
+		"""Open the local socket on the running loop, or share it if it's open, returns the aioudp LocalEndpoint
+		For anything else that talks to cameras on port 52381 (e.g. a sweep), closeLocalSocket() it when finished.
+		"""
+		loop = asyncio.get_running_loop()
+		if AsyncViscaCamera._LOCAL_SOCK is None:
+			if AsyncViscaCamera._LOCAL_OPENING is None:
+				AsyncViscaCamera._LOCAL_OPENING = loop.create_task(AsyncViscaCamera._bindLocal())
+			await asyncio.shield(AsyncViscaCamera._LOCAL_OPENING)
+		elif AsyncViscaCamera._LOCAL_LOOP is not loop:
+			raise RuntimeError("The local socket is open on another event loop, cameras must share one loop")
+		AsyncViscaCamera._OPEN_CAMS += 1
+		return AsyncViscaCamera._LOCAL_SOCK
+
+	@staticmethod
+	async def _bindLocal():
+		try:
+			AsyncViscaCamera._LOCAL_SOCK = await aioudp.open_local_endpoint(
+				"0.0.0.0", 52381, reply_key=_replyKey, reply_frames=replies.decodeAll
+			)
+			# the kernel caps this at net.core.rmem_max
+			AsyncViscaCamera._LOCAL_SOCK._transport.get_extra_info("socket").setsockopt(
+				socket.SOL_SOCKET, socket.SO_RCVBUF, AsyncViscaCamera.RECEIVE_BUFFER
+			)
+			AsyncViscaCamera._LOCAL_SOCK.allowed = set()  # only the open cameras, anything else is dropped unread
+			AsyncViscaCamera._LOCAL_LOOP = asyncio.get_running_loop()
+			LOGGER.info("Opened local UDP socket")
+		finally:
+			AsyncViscaCamera._LOCAL_OPENING = None
+
+	async def _closeLocal(self):
+		"""Close the local socket if this was the last camera using it"""
+		if not self._opened:
+			return
+		self._opened = False
+		await self.closeLocalSocket()
+
+	@staticmethod
+	async def closeLocalSocket():
+		"""Release the local socket, it's closed once nothing is using it"""
+		AsyncViscaCamera._OPEN_CAMS -= 1
+		if AsyncViscaCamera._OPEN_CAMS == 0 and AsyncViscaCamera._LOCAL_SOCK is not None:
+			AsyncViscaCamera._LOCAL_SOCK.close()
+			await asyncio.sleep(0)  # let the transport actually close the socket, so it can be reopened straight away
+			AsyncViscaCamera._LOCAL_SOCK = None
+			AsyncViscaCamera._LOCAL_LOOP = None
+			LOGGER.info("Closed local UDP socket")
+
+	async def _initialise(self):
+		"""Setup the async sockets"""
+		self.cmd_queue = CommandScheduler()
+		self._slot_free = asyncio.Event()
+		self._queue_loop = None
+		await self._openTcp()
+		if not self.simple_visca and (not self.shared_socket or not self._routedOutOfInterface()):
+			# simple_visca cameras reply to the port they were sent from, so they're sent to from the local socket
+			self._remote_sock = await self._openRemote()
+			LOGGER.info("Opened remote UDP socket to cam %s", self.ip)
+		self._LOCAL_SOCK.allow(self.ip)
+		self._LOCAL_SOCK.set_unmatched_handler(self.ip, self._unmatchedReply)
+		try:
+			if not self.simple_visca:
+				await self.resetSequenceNumber()
+			self.is_connected = True
+		except asyncio.TimeoutError:
+			LOGGER.warning("Timeout trying to reset sequence number on camera %s", self.ip)
+
+	def _routedOutOfInterface(self):
+		"""Whether sending from the shared local socket reaches the camera out of its interface
+
+		The local socket goes by the routing table, so a camera found on another interface (e.g. a second network
+		without the default route) keeps a socket of its own on that interface.
+		"""
+		if self.interface is None:
+			return True
+		source = netif.routedSource(self.ip)
+		if source == self.interface.ip:
+			return True
+		LOGGER.warning(
+			"Camera %s is on %s but the routing table sends from %s, not sharing the local socket",
+			self.ip, self.interface, source,
+		)
+		return False
+
+	async def _openRemote(self):
+		"""Open the socket commands are sent from, out of the camera's interface if it's known"""
+		if self.interface is None:
+			return await aioudp.open_remote_endpoint(self.ip, self.port)
+		sock = netif.deviceSocket(self.interface)
+		try:
+			sock.connect((self.ip, self.port))
+			endpoint = aioudp.RemoteEndpoint()
+			await asyncio.get_running_loop().create_datagram_endpoint(
+				lambda: aioudp.DatagramEndpointProtocol(endpoint), sock=sock
+			)
+		except OSError:
+			sock.close()
+			raise
+		return endpoint
+
+	async def _openTcp(self):
+		"""Connect over TCP if the transport asks for it"""
+		if self.transport == "udp":
+			return
+		if not self.simple_visca:
+			# auto is the default for stored cameras, only warn when TCP was asked for
+			if self.transport == "tcp":
+				LOGGER.warning("Camera %s only speaks VISCA over IP on UDP, ignoring transport %r", self.ip, self.transport)
+			return
+		connection = await aiotcp.open_tcp_connection(self.ip, self.TCP_PORT)
+		if not await connection.wait_connected() and self.transport == "auto":
+			LOGGER.info("Camera %s didn't accept a TCP connection, using UDP", self.ip)
+			await connection.close()
+			return
+		# The stream keeps replies in order so commands can be pipelined (and nothing is lost so never resent)
+		LOGGER.info("Using TCP for camera %s", self.ip)
+		self._tcp = connection
+		if self._requestedWindow is None:
+			self.window = self.DEFAULT_WINDOW
+
+	async def _close(self):
+		"""Close this camera"""
+		if self._queue_loop is not None:
+			self.cmd_queue.trigger_shutdown()
+			LOGGER.debug("Waiting for queue watcher to exit...")
+			await asyncio.gather(self._queue_loop)
+		if self._inflight:
+			await asyncio.gather(*self._inflight, return_exceptions=True)
+		if self._resync is not None:
+			await asyncio.gather(self._resync, return_exceptions=True)
+		if self._LOCAL_SOCK is not None:
+			self._LOCAL_SOCK.set_unmatched_handler(self.ip, None)
+			self._LOCAL_SOCK.disallow(self.ip)
+		if self._remote_sock is not None:
+			self._remote_sock.close()
+			self._remote_sock = None
+			LOGGER.info("Closed remote UDP socket to cam %s", self.ip)
+		if self._tcp is not None:
+			await self._tcp.close()
+			self._tcp = None
+		self.is_connected = False
+
+	@property
+	def queueDepth(self):
+		"""Commands waiting to be sent"""
+		return len(self.cmd_queue) if self.cmd_queue is not None else 0
+
+	@property
+	def inflight(self):
+		"""Commands sent and waiting for their reply"""
+		return len(self._inflight)
+
+	@property
+	def superseded(self):
+		"""Motion commands dropped from the queue because a newer one replaced them"""
+		return self.cmd_queue.superseded if self.cmd_queue is not None else 0
+
+	async def _queueAndWait(self, *args, override=True):
+		loop = asyncio.get_running_loop()
+		results = [command.result_future(loop) for command in args]
+		await self._queueCommands(*args, override=override)
+		return await asyncio.gather(*results)
+
+	async def _queueCommands(self, *args, override=True):
+		LOGGER.debug("Putting on the queue: %r", args)
+		self.cmd_queue.put_many(*args, supersede=override)
+		if self._queue_loop is None:
+			# Start the queue watcher if not already started
+			self._queue_loop = asyncio.create_task(self._watchQueue())
+
+	async def _watchQueue(self):
+		"""Watch and process the command queue for this camera."""
+		LOGGER.info("Starting queue watcher")
+		while True:
+			# Only take a command off the queue once there's room for it, so it can still be overridden until then
+			await self._waitForSlot()
+			cmd = await self.cmd_queue.get(self._socketFree)
+			if cmd is None:
+				LOGGER.debug("Received trigger to stop the queue watcher")
+				break
+			if cmd.priority == Priority.STOP and cmd.queuedAt is not None:
+				wait = time.monotonic() - cmd.queuedAt
+				self.stopWaits.observe(wait)
+				LOGGER.debug("Stop command waited %0.1fms to be sent", wait * 1000)
+			LOGGER.debug("Sending command cmd: %r", cmd)
+			if cmd.lane != "inquiry":
+				self._executing[cmd.lane] += 1
+			task = asyncio.create_task(self._sendCommand(cmd))
+			self._inflight.add(task)
+			task.add_done_callback(functools.partial(self._commandDone, cmd))
+			if self.window <= 1:
+				# Lockstep, let the command complete before sending the next one
+				await asyncio.wait([task])
+			# Camera times out if you send commands too quickly after an ack
+			await asyncio.sleep(self.pacing.gap)
+		LOGGER.info("Queue watcher exited")
+
+	async def _waitForSlot(self):
+		"""Wait until fewer than `window` queued commands are in flight"""
+		while len(self._inflight) >= max(self.window, 1):
+			self._slot_free.clear()
+			await self._slot_free.wait()
+
+	def _socketFree(self, cmd):
+		"""Whether the camera has a command buffer free for cmd
+
+		Two commands can execute at once as long as they're of different classes, so a zoom can start while pan-tilt
+		finishes but a second preset recall waits for the first. A motion command replaces what its axis is doing so
+		doesn't wait for it, stops go regardless and inquiries don't take a buffer.
+		"""
+		if cmd.lane == "inquiry" or cmd.stop:
+			return True
+		busy = self._executing[cmd.lane]
+		if busy and not cmd.motion:
+			return False
+		return busy or sum(self._executing.values()) < self.SOCKETS
+
+	def _commandDone(self, cmd, task):
+		self._inflight.discard(task)
+		if cmd.lane != "inquiry":
+			self._executing[cmd.lane] -= 1
+			self.cmd_queue.wake()
+		self._slot_free.set()
+		if task.cancelled() or task.exception() is not None:
+			LOGGER.error("Command failed on camera %s: %r", self.ip, cmd, exc_info=None if task.cancelled() else task.exception())
+			cmd.result = None  # release anyone waiting on it
+
+	async def _sendCommand(self, command):
+		# for general commands (payload type 0100), command.value should be bytes and is left as it is
+		# Idempotent commands are resent when nothing comes back, waiting longer each time, to ride out lost packets
+		# Buffer full means the camera got it but had nowhere to put it, so that's always resent after backing off
+		retries = self.RETRIES if command.idempotent and self._tcp is None else 0
+		timeout = self.RETRY_TIMEOUT if retries else 1
+		bufferFullRetries = self.BUFFER_FULL_RETRIES
+		backoff = self.BUFFER_FULL_BACKOFF
+		generation = None
+		reply = None
+		attempt = 0
+		self.stats["commands"] += 1
+		while True:
+			if generation != self._generation:
+				# A reset changes the sequence number the camera expects, so (re)number the command
+				generation = self._generation
+				sequenceNumber = self.sequenceNumber
+				self.sequenceNumber += 1
+			packet = command.value
+			if not self.simple_visca:
+				# Framed in the camera's shared buffer, which is safe as _sendRawCommand sends it before it first
+				#  awaits, so no other command can be built in between
+				packet = self._packets.build(command.value, sequenceNumber)
+			try:
+				reply = await self._sendRawCommand(
+					packet, key=None if self.simple_visca else sequenceNumber, raise_on_timeout=True, timeout=timeout,
+					**command.kwargs
+				)
+			except ReplyTimeout as e:
+				if not e.acknowledged and attempt < retries:
+					attempt += 1
+					self.stats["retries"] += 1
+					LOGGER.warning("No reply from camera %s, resending %r", self.ip, command)
+					timeout *= 2
+					continue
+				self.stats["timeouts"] += 1
+				self.pacing.timeout()
+				LOGGER.error("Timeout waiting for data from camera %s!", self.ip)
+				# TODO: may be nice to set is_connected or similar False here and update UI to show warning. Reset on
+				#  next success. Bare in mind the implications of setting is_connected to False in other code
+				self._consecutiveTimeouts += 1
+				if self._consecutiveTimeouts >= self.TIMEOUT_RESYNC:
+					self._startResync()
+				break
+			if reply.kind == replies.ERROR and reply.error == replies.BUFFER_FULL and bufferFullRetries:
+				bufferFullRetries -= 1
+				self.stats["bufferFull"] += 1
+				LOGGER.warning("Camera %s command buffers are full, resending %r in %dms", self.ip, command, backoff * 1000)
+				await asyncio.sleep(backoff)
+				backoff *= 2
+				generation = None  # the camera took the sequence number, so the resend needs a new one
+				continue
+			if attempt:
+				self.stats["recovered"] += 1
+			self._consecutiveTimeouts = 0
+			break
+		command.result = reply
+		return reply
+
+	async def _inquire(self, command):
+		# No acknowledge messages provided for inquiries
+		command.skipCompletion = True
+		# Inquiries wait their turn on the queue, so stops and moves go ahead of them
+		result = command.result_future(asyncio.get_running_loop())
+		await self._queueCommands(command, override=False)
+		return await result
+
+	async def resetSequenceNumber(self):
+		"""Reset the Sony camera sequence number"""
+		self.sequenceNumber = 1
+		self._generation += 1
+		await self._sendRawCommand(
+			_RESET_SEQUENCE_NUMBER, key=replies.CONTROL, skipCompletion=True, raise_on_timeout=True
+		)
+
+	def _startResync(self):
+		"""Reset the sequence number in the background, unless that's already happening"""
+		if self._resync is None or self._resync.done():
+			self._resync = asyncio.create_task(self._resyncSequenceNumber())
+
+	async def _resyncSequenceNumber(self):
+		"""Get back in step with the camera after lost packets have desynced the sequence number"""
+		self.stats["resyncs"] += 1
+		if self._tcp is not None:
+			# Replies are matched by order, so start a fresh stream
+			LOGGER.warning("Reconnecting to camera %s", self.ip)
+			self._tcp.reconnect()
+		elif not self.simple_visca:
+			LOGGER.warning("Resynchronising sequence number with camera %s", self.ip)
+			try:
+				await self.resetSequenceNumber()
+			except asyncio.TimeoutError:
+				LOGGER.warning("Timeout trying to reset sequence number on camera %s", self.ip)
+		self._sequenceErrors = 0
+		self._consecutiveTimeouts = 0
+
+	def _logReply(self, reply):
+		if reply.kind == replies.ACK:
+			LOGGER.debug("Command acknowledged successfully")
+		elif reply.kind == replies.COMPLETION:
+			LOGGER.debug("Command completed successfully")
+		elif reply.kind == replies.ERROR and reply.error == replies.BUFFER_FULL:
+			LOGGER.debug("Camera %s command buffers are full", self.ip)  # resent by _sendCommand
+		elif reply.kind == replies.ERROR:
+			LOGGER.error("Command failed on camera %s: %s (%r)", self.ip, reply.errorMessage, reply)
+		elif reply.kind == replies.CONTROL:
+			if reply.error is None:
+				LOGGER.debug("Successfully reset sequence number")
+			else:
+				LOGGER.error("Control command failed on camera %s: %s", self.ip, reply.errorMessage)
+		else:
+			LOGGER.error("Unexpected reply from camera %s: %r", self.ip, reply)
+
+	def _paceReply(self, reply, ackTime):
+		"""Feed the result of a command to the pacing controller"""
+		if reply.kind == replies.ERROR:
+			if reply.error == replies.BUFFER_FULL:
+				# Command buffer full, we're sending too fast
+				self.pacing.failure()
+			# Other errors are about the command itself rather than the pacing
+			return
+		self.pacing.success(ackTime)
+
+	def _unmatchedReply(self, reply, final):
+		"""Handle a reply whose sequence number doesn't match a command in flight"""
+		if reply.kind == replies.CONTROL and reply.error == replies.SEQUENCE_NUMBER:
+			self.stats["sequenceErrors"] += 1
+			self._sequenceErrors += 1
+			LOGGER.warning("Camera %s reported a sequence number error", self.ip)
+			if self._sequenceErrors >= self.SEQUENCE_ERROR_RESYNC:
+				self._startResync()
+			return True
+		pending = self._LOCAL_SOCK.pending(self.ip)
+		if not pending:
+			return False  # late reply to a command we've given up on
+		if self.window <= 1 and len(pending) == 1:
+			# Lockstep, so whatever comes back must be for the only command in flight
+			pending[0].feed(reply, final)
+			return True
+		self._unmatched += 1
+		LOGGER.warning("Reply from %s doesn't match a command in flight: %r", self.ip, reply)
+		if self._unmatched >= self.UNMATCHED_FALLBACK and self.window > 1:
+			LOGGER.warning("Camera %s doesn't echo sequence numbers, falling back to lockstep", self.ip)
+			self.window = 1
+		return False
+
+	async def _drainLateReplies(self):
+		"""Discard what's still to come of a timed out headerless command, so it isn't taken as the next one's reply"""
+		remaining = self._drainUntil - time.monotonic()
+		self._drainUntil = None
+		if remaining <= 0:
+			return
+		pending = self._LOCAL_SOCK.expect(self.ip, None, timeout=remaining, final_timeout=remaining)
+		try:
+			reply = await pending.first
+			LOGGER.debug("Discarding late reply from %s: %r", self.ip, reply)
+			if not reply.final:
+				LOGGER.debug("Discarding late reply from %s: %r", self.ip, await pending.final)
+		except asyncio.TimeoutError:
+			pass
+		finally:
+			pending.close()
+
+	async def _sendRawCommand(self, command, key=None, skipCompletion=False, raise_on_timeout=False, timeout=1):
+		# this sends a command and waits for a response, note it does NOT calculate / use the sequence number
+		# command should be a bytes-like object, key is what the reply will be matched by (the sequence number, None
+		#  for simple_visca cameras which are always lockstep). Headerless replies carry nothing to tell which command
+		#  they're for, so after a timeout any late replies are discarded for LATE_REPLY_DRAIN before sending again.
+		#  One arriving later than that is still taken as the next command's.
+		if LOGGER.isEnabledFor(logging.DEBUG):
+			LOGGER.debug("Sending to %s: %r", self.ip, bytes(command))
+
+		# Replies time out on the local endpoint (for when camera goes AWOL)
+		if self._tcp is not None:
+			pending = self._tcp.expect(timeout=timeout, final_timeout=1)
+		else:
+			if key is None and self._drainUntil is not None:
+				# simple_visca commands aren't built in the shared buffer, so it's safe to wait before sending
+				await self._drainLateReplies()
+			pending = self._LOCAL_SOCK.expect(self.ip, key, timeout=timeout, final_timeout=1)
+		LOGGER.debug("Waiting for reply...")
+		try:
+			sent = time.monotonic()
+			if self._tcp is not None:
+				self._tcp.send(command, pending)
+			elif self._remote_sock is None:
+				self._LOCAL_SOCK.send(command, (self.ip, self.port))
+			else:
+				self._remote_sock.send(command)
+			stats = self.stats
+			stats["bytesSent"] += len(command)
+			reply = await pending.first  # acknowledge
+			ackTime = time.monotonic() - sent
+			stats["bytesReceived"] += len(reply.payload) + (8 if reply.sequence is not None else 0)
+			self._logReply(reply)
+			if reply.kind == replies.ACK:
+				self.ackTimes.observe(ackTime)
+			elif skipCompletion and reply.kind == replies.COMPLETION:
+				self.inquiryTimes.observe(ackTime)
+			if not skipCompletion:
+				# the completion may have arrived already (in the same datagram as the ack for simple_visca)
+				first = reply
+				reply = await pending.final  # completion
+				if reply is not first:
+					if first.kind == replies.ACK:
+						self.completionTimes.observe(time.monotonic() - sent - ackTime)
+					stats["bytesReceived"] += len(reply.payload) + (8 if reply.sequence is not None else 0)
+					self._logReply(reply)
+			if reply.kind == replies.ERROR:
+				stats["errors"] += 1
+			self._paceReply(reply, ackTime)
+			return reply
+		except asyncio.TimeoutError:
+			if key is None and self._tcp is None:
+				self._drainUntil = time.monotonic() + self.LATE_REPLY_DRAIN
+			if raise_on_timeout:
+				# the caller may resend, so it tells the pacing once it has given up
+				first = pending.first
+				raise ReplyTimeout(first.done() and not first.cancelled() and first.exception() is None) from None
+			self.pacing.timeout()
+			LOGGER.error("Timeout waiting for data from camera %s!", self.ip)
+		finally:
+			pending.close()
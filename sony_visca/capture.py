@@ -0,0 +1,283 @@
+import asyncio
+import collections
+import logging
+import mmap
+import os
+import socket
+import struct
+import time
+
+from sony_visca import aioudp, packet, replies
+
+LOGGER = logging.getLogger("ptz.capture")
+
+MAGIC = b"VISCAP\x00\x01"
+# magic, data capacity, head (next write), tail (oldest record), record count, wall clock - monotonic clock
+FILE_HEADER = struct.Struct("<8sIIIId")
+_POSITIONS = struct.Struct("<III")
+_POSITIONS_OFFSET = 12
+# monotonic time, camera IPv4 address, camera port, direction (aioudp.SENT/RECEIVED), datagram length
+RECORD = struct.Struct("<d4sHBH")
+WRAP = 0xffff  # length of the marker written where the next record didn't fit before the end of the file
+DEFAULT_SIZE = 4 * 1024 * 1024
+
+SENT = aioudp.SENT
+RECEIVED = aioudp.RECEIVED
+
+
+class Record(collections.namedtuple("Record", "time ip port direction data")):
+	"""One captured datagram, time is time.monotonic() when it was sent or received"""
+	__slots__ = ()
+
+	@property
+	def sent(self):
+		return self.direction == SENT
+
+
+class Exchange(collections.namedtuple("Exchange", "ip time command ack completion reply")):
+	"""A command and what the camera made of it
+
+	ack and completion are seconds from sending, None if that reply never came (completion is the time of the final
+	reply, which for an inquiry is the only one). reply is the final Reply, or None if it timed out.
+	"""
+	__slots__ = ()
+
+
+class CaptureFile:
+	"""Appends datagrams to a memory-mapped ring file, dropping the oldest once it's full
+
+	Each record is a RECORD header followed by the datagram. The positions in the file header are updated after every
+	record, so the file can be read while it's being written and survives the program crashing. Pass it to
+	aioudp.set_capture() to record every endpoint's traffic.
+	"""
+
+	def __init__(self, path, size=DEFAULT_SIZE):
+		self.path = path
+		exists = os.path.exists(path) and os.path.getsize(path) == FILE_HEADER.size + size
+		self._file = open(path, "r+b" if exists else "w+b")
+		if not exists:
+			self._file.truncate(FILE_HEADER.size + size)
+		self._map = mmap.mmap(self._file.fileno(), FILE_HEADER.size + size)
+		self._end = FILE_HEADER.size + size
+		magic, capacity, head, tail, count, _ = FILE_HEADER.unpack_from(self._map)
+		if exists and magic == MAGIC and capacity == size:
+			self._head, self._tail, self._count = head, tail, count
+		else:
+			self._head = self._tail = FILE_HEADER.size
+			self._count = 0
+		# carry on from an existing capture, but its timestamps are from the clock of the run that wrote them
+		FILE_HEADER.pack_into(
+			self._map, 0, MAGIC, size, self._head, self._tail, self._count, time.time() - time.monotonic()
+		)
+		self._addresses = {}  # IP string -> packed address, there are only ever a few cameras
+
+	def __repr__(self):
+		return f"<CaptureFile {self.path} {self._count} records>"
+
+	def record(self, direction, addr, data):
+		"""Append a datagram to or from addr, the (host, port) of the camera"""
+		length = len(data)
+		size = RECORD.size + length
+		if length >= WRAP or size > self._end - FILE_HEADER.size:
+			return
+		host, port = addr[:2] if addr else ("0.0.0.0", 0)
+		address = self._addresses.get(host)
+		if address is None:
+			try:
+				address = socket.inet_aton(host)
+			except OSError:
+				address = bytes(4)
+			self._addresses[host] = address
+		buffer = self._map
+		if self._head + size > self._end:
+			# free the rest of the file, mark where the records stop and carry on from the start
+			while self._count and self._tail >= self._head:
+				self._drop()
+			if self._head + RECORD.size <= self._end:
+				RECORD.pack_into(buffer, self._head, 0.0, bytes(4), 0, 0, WRAP)
+			self._head = FILE_HEADER.size
+		while self._count and self._head <= self._tail < self._head + size:
+			self._drop()
+		if not self._count:
+			self._tail = self._head
+		RECORD.pack_into(buffer, self._head, time.monotonic(), address, port, direction, length)
+		start = self._head + RECORD.size
+		buffer[start:start + length] = data
+		self._head = start + length
+		self._count += 1
+		_POSITIONS.pack_into(buffer, _POSITIONS_OFFSET, self._head, self._tail, self._count)
+
+	def _drop(self):
+		"""Forget the oldest record"""
+		length = RECORD.unpack_from(self._map, self._tail)[4]
+		self._tail += RECORD.size + length
+		self._count -= 1
+		if not self._count:
+			self._tail = self._head
+		elif self._tail + RECORD.size > self._end or RECORD.unpack_from(self._map, self._tail)[4] == WRAP:
+			self._tail = FILE_HEADER.size
+
+	def close(self):
+		self._map.flush()
+		self._map.close()
+		self._file.close()
+
+
+def start(path, size=DEFAULT_SIZE):
+	"""Start capturing every UDP endpoint's traffic to path, returns the CaptureFile"""
+	capture = CaptureFile(path, size)
+	aioudp.set_capture(capture)
+	LOGGER.info("Capturing camera traffic to %s", path)
+	return capture
+
+
+def stop(capture):
+	aioudp.set_capture(None)
+	capture.close()
+
+
+def read(path):
+	"""Stream the records in a capture file, oldest first
+
+	The positions are read once at the start, so reading a file that's still being written gives what was there then
+	(as long as the writer doesn't wrap around onto it first).
+	"""
+	with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+		magic, capacity, head, position, count, _ = FILE_HEADER.unpack_from(buffer)
+		if magic != MAGIC:
+			raise ValueError(f"{path} isn't a capture file")
+		end = FILE_HEADER.size + capacity
+		for _ in range(count):
+			if position + RECORD.size > end or RECORD.unpack_from(buffer, position)[4] == WRAP:
+				position = FILE_HEADER.size
+			timestamp, address, port, direction, length = RECORD.unpack_from(buffer, position)
+			start = position + RECORD.size
+			yield Record(timestamp, socket.inet_ntoa(address), port, direction, buffer[start:start + length])
+			position = start + length
+
+
+def camera(records, ip):
+	"""Only the records to and from ip"""
+	return (record for record in records if record.ip == ip)
+
+
+def exchanges(records, timeout=2):
+	"""Pair the commands in a stream of records with their replies, yielding an Exchange as each one finishes
+
+	Sony commands are matched by sequence number, headerless ones in order as the camera would answer them. Commands
+	with no final reply within timeout seconds (of capture time) are yielded with what they did get. Control
+	messages (sequence number resets) aren't commands, so they're left out.
+	"""
+	waiting = {}  # (ip, sequence number) -> [time, command, ack], oldest first
+	headerless = collections.defaultdict(collections.deque)  # ip -> [time, command, ack] waiting for a first reply
+	sockets = {}  # (ip, camera socket) -> acknowledged headerless [time, command, ack]
+
+	def finish(exchange, ip, reply, now):
+		sent, command, ack = exchange
+		return Exchange(ip, sent, command, ack, None if reply is None else now - sent, reply)
+
+	for record in records:
+		now = record.time
+		while waiting:
+			key = next(iter(waiting))
+			if now - waiting[key][0] < timeout:
+				break
+			yield finish(waiting.pop(key), key[0], None, now)
+		if record.sent:
+			data = record.data
+			if data and data[0] & 0x80:
+				headerless[record.ip].append([now, data, None])
+			elif len(data) >= packet.HEADER.size:
+				payloadType, _, sequence = packet.HEADER.unpack_from(data)
+				if payloadType != packet.CONTROL:
+					waiting[(record.ip, sequence)] = [now, data[packet.HEADER.size:], None]
+			continue
+		for reply in replies.decodeAll(record.data):
+			if reply.sequence is not None:
+				exchange = waiting.get((record.ip, reply.sequence))
+				if exchange is None or reply.kind == replies.CONTROL:
+					continue
+				if reply.kind == replies.ACK:
+					exchange[2] = now - exchange[0]
+				else:
+					yield finish(waiting.pop((record.ip, reply.sequence)), record.ip, reply, now)
+				continue
+			queue = headerless[record.ip]
+			if reply.kind == replies.ACK:
+				if queue:
+					exchange = queue.popleft()
+					exchange[2] = now - exchange[0]
+					sockets[(record.ip, reply.socket)] = exchange
+			elif reply.kind in (replies.COMPLETION, replies.ERROR) and (record.ip, reply.socket) in sockets:
+				yield finish(sockets.pop((record.ip, reply.socket)), record.ip, reply, now)
+			elif queue:
+				yield finish(queue.popleft(), record.ip, reply, now)
+	for (ip, _), exchange in waiting.items():
+		yield finish(exchange, ip, None, None)
+	for (ip, _), exchange in sockets.items():
+		yield finish(exchange, ip, None, None)
+	for ip, queue in headerless.items():
+		for exchange in queue:
+			yield finish(exchange, ip, None, None)
+
+
+def ackTimes(exchanges):
+	return (exchange.ack for exchange in exchanges if exchange.ack is not None)
+
+
+def completionTimes(exchanges):
+	return (exchange.completion for exchange in exchanges if exchange.completion is not None)
+
+
+def summarise(seconds):
+	"""Count, mean and percentiles (in seconds) of a stream of latencies, e.g. summarise(ackTimes(exchanges(read(path))))"""
+	values = sorted(seconds)
+	if not values:
+		return {"count": 0}
+
+	def percentile(q):
+		return values[min(len(values) - 1, int(q * len(values)))]
+	return {
+		"count": len(values), "mean": sum(values) / len(values), "min": values[0], "p50": percentile(0.5),
+		"p90": percentile(0.9), "p99": percentile(0.99), "max": values[-1],
+	}
+
+
+async def replay(records, host, port=None, speed=1.0, linger=1.0, local_port=0):
+	"""Send the datagrams a captured session sent to host (a camera or simulator) with the same timing
+
+	port defaults to the one each datagram went to. speed 2 replays twice as fast, 0 as fast as possible. Everything
+	sent, and every reply that comes back within linger seconds of the last datagram, is returned as new Records for
+	exchanges(), so the replay's latencies can be compared with the original's. Sony cameras reply to port 52381
+	whatever port the command came from, so replaying to one needs local_port=52381 (with nothing else using it).
+	"""
+	endpoint = await aioudp.open_datagram_endpoint("0.0.0.0", local_port)
+	result = []
+
+	async def receive():
+		while True:
+			data, addr = await endpoint.receive()
+			result.append(Record(time.monotonic(), addr[0], addr[1], RECEIVED, data))
+
+	receiver = asyncio.ensure_future(receive())
+	try:
+		first = start = None
+		for record in records:
+			if not record.sent:
+				continue
+			if first is None:
+				first, start = record.time, time.monotonic()
+			elif speed:
+				delay = start + (record.time - first) / speed - time.monotonic()
+				if delay > 0:
+					await asyncio.sleep(delay)
+			target = (host, port or record.port)
+			data = bytes(record.data)
+			endpoint.send(data, target)
+			result.append(Record(time.monotonic(), host, target[1], SENT, data))
+		await asyncio.sleep(linger)
+	finally:
+		receiver.cancel()
+		endpoint.close()
+	result.sort(key=lambda record: record.time)
+	return result
@@ -0,0 +1,265 @@
+import asyncio
+import collections
+import ipaddress
+import logging
+import re
+import socket
+import struct
+
+from sony_visca import aioudp, netif
+
+LOGGER = logging.getLogger("ptz.discovery")
+
+SONY_PORT = 52380
+SONY_ENQ = b"\x02ENQ:network\xFF\x33"
+PTZOPTICS_GROUP = "239.255.255.251"
+PTZOPTICS_PORT = 8005
+PTZOPTICS_SEARCH = b"SEARCH * UPGRADE"
+
+NON_SONY_REGEXES = [
+	re.compile(
+		r"REPLY OK\s+Client ID:(?P<client_id>[A-Fa-f0-9]{32})?\s+Device ID:(?P<device_id>[A-Fa-f0-9]{32})(\s+Uptime=\d*)?\s+DHCP=(?P<dhcp>\d).*IP=(?P<ip>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MASK=(?P<mask>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+GATEWAY=(?P<gateway>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MAC=(?P<mac>([A-Fa-f0-9]{2}[:-]){5}[A-Fa-f0-9]{2})\s+FDNS=(?P<dns>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})",
+		re.DOTALL,
+	),
+	re.compile(
+		r"REPLY OK\s+VERSION:(?P<version>[0-9]+.[0-9]+.[0-9]+)\s+DEVICE_MODEL:(?P<model>[A-Z0-9.]{4,})\s+Client ID:(?P<client_id>[A-Fa-f0-9]{32})?\s+Device ID:(?P<device_id>[A-Fa-f0-9]{32})\s+Uptime=(?P<uptime>[0-9]+)\s+DHCP=(?P<dhcp>\d).*IP=(?P<ip>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MASK=(?P<mask>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+GATEWAY=(?P<gateway>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MAC=(?P<mac>([A-Fa-f0-9]{2}[:-]){5}[A-Fa-f0-9]{2})\s+FDNS=(?P<dns>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})",
+		re.DOTALL,
+	),
+]
+
+
+def sonyCamera(cls, raw, ip):
+	"""Make a camera from a Sony ENQ reply, None if it isn't one (e.g. our own ENQ coming back)"""
+	if raw == SONY_ENQ:
+		return None
+	data = raw.split(b'\xFF')
+	if len(data) < 8 or not data[0].startswith(b"\x02MAC:"):
+		LOGGER.debug("Ignoring discovery reply from %s: %r", ip, raw)
+		return None
+	# anyone can send to the discovery port, so a malformed reply mustn't raise
+	name = data[7][5:].decode("utf-8", errors="replace")
+	mac = data[0][5:].decode("utf-8", errors="replace")
+	model = data[2][6:].decode("utf-8", errors="replace") if data[2].startswith(b"MODEL:") else None
+	LOGGER.info("Found camera '%s' (%s, %s) at IP %s", name, model, mac, ip)
+	return cls(name, ip, mac, model=model)
+
+
+def nonSonyCamera(cls, raw):
+	"""Make a camera from a PTZOptics search reply, None if it isn't one"""
+	text = raw.decode(errors="replace")
+	for regex in NON_SONY_REGEXES:
+		mo = regex.match(text)
+		if mo:
+			info = mo.groupdict()
+			# We don't seem to get camera names back from discover here so bodge a bit of device id
+			LOGGER.info("Found camera '%s' (%s) at IP %s", info["device_id"], info["mac"], info["ip"])
+			return cls(
+				info["device_id"][:8],
+				info["ip"],
+				info["mac"],
+				netmask=info["mask"],
+				gateway=info["gateway"],
+				port=1259,
+				device_id=info["device_id"],
+				simple_visca=True,
+				model=info.get("model"),
+			)
+	LOGGER.debug("Ignoring discovery reply: %r", raw)
+	return None
+
+
+def sonySocket():
+	"""Socket to broadcast the Sony ENQ from and hear the replies on"""
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+	sock.setblocking(False)
+	try:
+		sock.bind(("", SONY_PORT))
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+
+def multicastSocket(interfaces=()):
+	"""Socket joined to the PTZOptics discovery group on each of interfaces, or the default interface if none"""
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+	sock.setblocking(False)
+	try:
+		if interfaces:
+			for interface in interfaces:
+				joinGroup(sock, interface)
+		else:
+			sock.setsockopt(
+				socket.IPPROTO_IP,
+				socket.IP_ADD_MEMBERSHIP,
+				struct.pack("4sl", ipaddress.ip_address(PTZOPTICS_GROUP).packed, socket.INADDR_ANY),
+			)
+		sock.bind(("", PTZOPTICS_PORT))
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+
+def joinGroup(sock, interface):
+	"""Join the PTZOptics discovery group on interface, returns False if it couldn't"""
+	try:
+		sock.setsockopt(
+			socket.IPPROTO_IP,
+			socket.IP_ADD_MEMBERSHIP,
+			ipaddress.ip_address(PTZOPTICS_GROUP).packed + socket.inet_aton(interface.ip),
+		)
+	except OSError as e:
+		LOGGER.warning("Can't join the discovery group on %s: %r", interface, e)
+		return False
+	return True
+
+
+def sendSonySearch(sock, interfaces=()):
+	"""Broadcast the ENQ on each of interfaces (a directed broadcast goes out of the interface it's for)"""
+	for target in [interface.broadcast for interface in interfaces] or ["<broadcast>"]:
+		try:
+			sock.sendto(SONY_ENQ, (target, SONY_PORT))
+		except OSError as e:
+			LOGGER.warning("Can't send discovery to %s: %r", target, e)
+
+
+def sendMulticastSearch(sock, interfaces=()):
+	"""Send the PTZOptics search out of each of interfaces"""
+	for interface in interfaces or [None]:
+		try:
+			if interface is not None:
+				sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface.ip))
+			sock.sendto(PTZOPTICS_SEARCH, (PTZOPTICS_GROUP, PTZOPTICS_PORT))
+		except OSError as e:
+			LOGGER.warning("Can't send discovery on %s: %r", interface or "the default interface", e)
+
+
+def tagInterface(camera, interfaces):
+	"""Note which interface a camera was found on, so it's sent to out of that one"""
+	if camera is not None:
+		camera.interface = netif.interfaceFor(camera.ip, interfaces)
+	return camera
+
+
+async def openEndpoint(sock):
+	"""Wrap a bound socket in an aioudp Endpoint"""
+	endpoint = aioudp.Endpoint()
+	await asyncio.get_running_loop().create_datagram_endpoint(
+		lambda: aioudp.DatagramEndpointProtocol(endpoint), sock=sock
+	)
+	return endpoint
+
+
+class DiscoveryEvent(collections.namedtuple("DiscoveryEvent", "kind camera previousIp")):
+	"""A change to the cameras on the network, previousIp is only set for MOVED"""
+	__slots__ = ()
+	ADDED = "added"
+	REMOVED = "removed"
+	MOVED = "moved"  # same MAC, new IP
+
+
+class DiscoveryListener:
+	"""Keeps listening on the discovery ports, so every camera that answers anyone's search is noticed
+
+	It re-announces out of every interface every `interval` seconds and keeps a registry of cameras by MAC, calling
+	callback(DiscoveryEvent) whenever a camera appears, changes IP, or misses MISSED announcements in a row. Interfaces
+	that come up later are picked up at the next announcement.
+	"""
+	INTERVAL = 30
+	MISSED = 3  # announcements a camera can miss before it's removed
+
+	def __init__(self, cls, callback, interval=INTERVAL):
+		self._cls = cls
+		self._callback = callback
+		self.interval = interval
+		self.cameras = {}  # mac -> camera, as last seen
+		self.interfaces = []
+		self._lastSeen = {}  # mac -> loop time of the last reply
+		self._sony = None  # (endpoint, socket)
+		self._multicast = None
+		self._tasks = []
+
+	async def start(self):
+		self.interfaces = netif.interfaces()
+		self._sony = await self._open(sonySocket, lambda raw, addr: sonyCamera(self._cls, raw, addr[0]))
+		self._multicast = await self._open(
+			lambda: multicastSocket(self.interfaces), lambda raw, addr: nonSonyCamera(self._cls, raw)
+		)
+		self._tasks.append(asyncio.create_task(self._announceLoop()))
+
+	async def _open(self, makeSocket, parse):
+		try:
+			sock = makeSocket()
+			endpoint = await openEndpoint(sock)
+		except OSError as e:
+			LOGGER.warning("Can't listen for cameras: %r", e)
+			return None
+		self._tasks.append(asyncio.create_task(self._listen(endpoint, parse)))
+		return endpoint, sock
+
+	async def stop(self):
+		for task in self._tasks:
+			task.cancel()
+		await asyncio.gather(*self._tasks, return_exceptions=True)
+		self._tasks = []
+		for opened in (self._sony, self._multicast):
+			if opened is not None:
+				opened[0].close()
+		self._sony = self._multicast = None
+
+	def announce(self):
+		"""Ask every camera to reply now"""
+		self._refreshInterfaces()
+		if self._sony is not None:
+			sendSonySearch(self._sony[1], self.interfaces)
+		if self._multicast is not None:
+			sendMulticastSearch(self._multicast[1], self.interfaces)
+
+	def _refreshInterfaces(self):
+		current = netif.interfaces()
+		for interface in current:
+			if interface not in self.interfaces:
+				LOGGER.info("Found interface %s (%s)", interface, interface.network)
+				if self._multicast is not None:
+					joinGroup(self._multicast[1], interface)
+		self.interfaces = current
+
+	async def _announceLoop(self):
+		while True:
+			self.announce()
+			await asyncio.sleep(self.interval)
+			self._expire()
+
+	async def _listen(self, endpoint, parse):
+		while True:
+			raw, addr = await endpoint.receive()
+			# one bad datagram (or callback) mustn't stop the listener for the rest of the session
+			try:
+				camera = parse(raw, addr)
+				if camera is not None:
+					self._seen(tagInterface(camera, self.interfaces))
+			except Exception:
+				LOGGER.exception("Couldn't handle discovery reply from %s: %r", addr[0], raw)
+
+	def _seen(self, camera):
+		self._lastSeen[camera.mac] = asyncio.get_running_loop().time()
+		known = self.cameras.get(camera.mac)
+		if known is None:
+			self.cameras[camera.mac] = camera
+			self._callback(DiscoveryEvent(DiscoveryEvent.ADDED, camera, None))
+		elif known.ip != camera.ip:
+			LOGGER.info("Camera %s moved from %s to %s", camera.mac, known.ip, camera.ip)
+			self.cameras[camera.mac] = camera
+			self._callback(DiscoveryEvent(DiscoveryEvent.MOVED, camera, known.ip))
+
+	def _expire(self):
+		cutoff = asyncio.get_running_loop().time() - self.interval * self.MISSED
+		for mac, seen in list(self._lastSeen.items()):
+			if seen < cutoff:
+				del self._lastSeen[mac]
+				camera = self.cameras.pop(mac)
+				LOGGER.info("Camera %s hasn't replied for a while, removing it", camera)
+				self._callback(DiscoveryEvent(DiscoveryEvent.REMOVED, camera, None))
@@ -0,0 +1,76 @@
+import asyncio
+import collections
+import logging
+
+from sony_visca import replies
+from sony_visca.visca_commands import Command
+
+LOGGER = logging.getLogger("ptz.fleet")
+
+
+class CameraError(Exception):
+	"""The camera answered a command with an error, e.g. it can't execute it now"""
+
+	def __init__(self, reply):
+		super().__init__(reply.errorMessage)
+		self.reply = reply
+		self.code = reply.error
+
+
+class FleetResult(collections.namedtuple("FleetResult", "camera reply error")):
+	"""What one camera made of a broadcast command, error is None if it carried it out
+	An error reply from the camera is kept as reply, with a CameraError for it as error.
+	"""
+	__slots__ = ()
+
+	@property
+	def ok(self):
+		return self.error is None
+
+	@property
+	def timedOut(self):
+		return isinstance(self.error, asyncio.TimeoutError)
+
+
+async def broadcast(cameras, command, timeout=None, override=True):
+	"""Send one command to every camera at once on the running loop
+
+	The command's bytes are built once and shared, only the per camera header differs. Returns a FleetResult for
+	each camera in the same order, a camera that's disconnected, doesn't answer or takes longer than timeout
+	seconds gets an error instead of holding up or failing the others.
+	"""
+	if not isinstance(command, Command):
+		command = Command(command)
+	return await _gather(cameras, lambda camera: camera.send(command.copy(), override=override), timeout)
+
+
+async def _gather(cameras, request, timeout):
+	cameras = list(cameras)
+	tasks = {}
+	for camera in cameras:
+		if camera.is_connected:
+			tasks[camera] = asyncio.ensure_future(request(camera))
+	if tasks:
+		await asyncio.wait(tasks.values(), timeout=timeout)
+
+	results = []
+	for camera in cameras:
+		task = tasks.get(camera)
+		if task is None:
+			results.append(FleetResult(camera, None, ConnectionError("Camera not connected")))
+		elif not task.done():
+			task.cancel()  # stop waiting, the command itself stays queued on the camera
+			results.append(FleetResult(camera, None, asyncio.TimeoutError(f"No reply within {timeout}s")))
+		elif task.exception() is not None:
+			results.append(FleetResult(camera, None, task.exception()))
+		elif task.result() is None:
+			# the camera's own reply timeouts (or a newer command superseding this one) leave no reply
+			results.append(FleetResult(camera, None, asyncio.TimeoutError("No reply")))
+		elif task.result().kind == replies.ERROR:
+			results.append(FleetResult(camera, task.result(), CameraError(task.result())))
+		else:
+			results.append(FleetResult(camera, task.result(), None))
+	failed = [result.camera for result in results if not result.ok]
+	if failed:
+		LOGGER.warning("%d of %d cameras failed: %s", len(failed), len(cameras), ", ".join(map(str, failed)))
+	return results
@@ -0,0 +1,150 @@
+import asyncio
+import bisect
+import logging
+
+LOGGER = logging.getLogger("ptz.metrics")
+
+METRICS_PORT = 9464
+# Upper bounds, in seconds, of the buckets reply latencies are counted in
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+	"""Observations counted into fixed buckets, like a Prometheus histogram
+
+	observe() is a bisect and three additions, well under a microsecond, so it's cheap enough to call for every reply.
+	"""
+	__slots__ = ("buckets", "counts", "sum", "count")
+
+	def __init__(self, buckets=LATENCY_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)  # the last one is everything above the top bucket
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	def quantile(self, q):
+		"""Upper bound of the bucket the q quantile falls in (inf if above the top one), None if nothing's observed"""
+		if not self.count:
+			return None
+		rank = q * self.count
+		seen = 0
+		for bound, count in zip(self.buckets, self.counts):
+			seen += count
+			if seen >= rank:
+				return bound
+		return float("inf")
+
+
+def _label(value):
+	return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# (stats key, metric name, help) for the counters kept in AsyncViscaCamera.stats
+CAMERA_COUNTERS = (
+	("commands", "visca_commands_total", "Commands and inquiries sent, not counting resends"),
+	("errors", "visca_errors_total", "Error replies (NAKs) from the camera"),
+	("timeouts", "visca_timeouts_total", "Commands that got no reply"),
+	("retries", "visca_retries_total", "Commands resent after no reply"),
+	("bufferFull", "visca_buffer_full_total", "Commands resent because the camera's command buffers were full"),
+	("sequenceErrors", "visca_sequence_errors_total", "Sequence number errors reported by the camera"),
+	("resyncs", "visca_resyncs_total", "Sequence number resets (or reconnects) to get back in step"),
+	("bytesSent", "visca_sent_bytes_total", "Bytes of commands sent"),
+	("bytesReceived", "visca_received_bytes_total", "Bytes of replies received"),
+)
+CAMERA_HISTOGRAMS = (
+	("ackTimes", "visca_ack_seconds", "Time from sending a command to its acknowledge"),
+	("completionTimes", "visca_completion_seconds", "Time from a command's acknowledge to its completion"),
+	("inquiryTimes", "visca_inquiry_seconds", "Time from sending an inquiry to its reply"),
+	("stopWaits", "visca_stop_wait_seconds", "Time stop commands spent queued before they were sent"),
+)
+
+
+def render(cameras, endpoints=()):
+	"""The metrics of cameras (AsyncViscaCamera) and aioudp endpoints, as (name, endpoint), in Prometheus text format"""
+	cameras = [(f'camera="{_label(camera.name)}",ip="{camera.ip}"', camera) for camera in cameras if camera]
+	lines = []
+
+	def family(name, kind, description):
+		lines.append(f"# HELP {name} {description}")
+		lines.append(f"# TYPE {name} {kind}")
+
+	for key, name, description in CAMERA_COUNTERS:
+		family(name, "counter", description)
+		for labels, camera in cameras:
+			lines.append(f"{name}{{{labels}}} {camera.stats[key]}")
+	family("visca_superseded_total", "counter", "Motion commands dropped from the queue for a newer one")
+	for labels, camera in cameras:
+		lines.append(f"visca_superseded_total{{{labels}}} {camera.superseded}")
+	family("visca_queue_depth", "gauge", "Commands waiting to be sent")
+	for labels, camera in cameras:
+		lines.append(f"visca_queue_depth{{{labels}}} {camera.queueDepth}")
+	family("visca_in_flight", "gauge", "Commands sent and waiting for their reply")
+	for labels, camera in cameras:
+		lines.append(f"visca_in_flight{{{labels}}} {camera.inflight}")
+	family("visca_connected", "gauge", "Whether the camera is connected")
+	for labels, camera in cameras:
+		lines.append(f"visca_connected{{{labels}}} {int(bool(camera.is_connected))}")
+	for attribute, name, description in CAMERA_HISTOGRAMS:
+		family(name, "histogram", description)
+		for labels, camera in cameras:
+			histogram = getattr(camera, attribute)
+			cumulative = 0
+			for bound, count in zip(histogram.buckets, histogram.counts):
+				cumulative += count
+				lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+			lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+			lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+			lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+	endpoints = [(f'socket="{_label(name)}"', endpoint) for name, endpoint in endpoints if endpoint is not None]
+	for attribute, name, description in (
+		("datagrams_sent", "udp_sent_datagrams_total", "Datagrams sent"),
+		("bytes_sent", "udp_sent_bytes_total", "Bytes sent"),
+		("datagrams_received", "udp_received_datagrams_total", "Datagrams received"),
+		("bytes_received", "udp_received_bytes_total", "Bytes received"),
+		("datagrams_dropped", "udp_dropped_datagrams_total", "Datagrams dropped with the receive buffers full"),
+		("datagrams_rejected", "udp_rejected_datagrams_total", "Datagrams dropped from hosts not allowed"),
+		("errors_received", "udp_errors_total", "Errors reported by the socket, e.g. port unreachable"),
+	):
+		family(name, "counter", description)
+		for labels, endpoint in endpoints:
+			lines.append(f"{name}{{{labels}}} {getattr(endpoint, attribute)}")
+	family("udp_late_replies_total", "counter", "Replies that arrived with nothing waiting for them")
+	for labels, endpoint in endpoints:
+		lines.append(f"udp_late_replies_total{{{labels}}} {sum(getattr(endpoint, 'late_replies', {}).values())}")
+	return "\n".join(lines) + "\n"
+
+
+async def serve(collect, host="127.0.0.1", port=METRICS_PORT):
+	"""Serve collect() (Prometheus text) over HTTP on the running loop, returns the asyncio Server"""
+
+	async def handle(reader, writer):
+		try:
+			request = await asyncio.wait_for(reader.readline(), 5)
+			while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+				pass  # headers
+			parts = request.split()
+			if len(parts) >= 2 and parts[0] == b"GET" and parts[1] in (b"/", b"/metrics"):
+				body = collect().encode()
+				status = b"200 OK"
+			else:
+				body = b"Not found\n"
+				status = b"404 Not Found"
+			writer.write(
+				b"HTTP/1.0 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: "
+				+ str(len(body)).encode() + b"\r\n\r\n" + body
+			)
+			await writer.drain()
+		except (OSError, asyncio.TimeoutError) as e:
+			LOGGER.debug("Metrics request failed: %r", e)
+		finally:
+			writer.close()
+
+	server = await asyncio.start_server(handle, host, port)
+	LOGGER.info("Serving metrics on http://%s:%d/metrics", host, port)
+	return server
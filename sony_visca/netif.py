@@ -0,0 +1,93 @@
+import collections
+import ipaddress
+import logging
+import socket
+import struct
+
+try:
+	import fcntl
+except ImportError:  # not on Linux, interfaces() finds nothing and everything goes by the routing table
+	fcntl = None
+
+LOGGER = logging.getLogger("ptz.netif")
+
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)
+
+
+class Interface(collections.namedtuple("Interface", "name ip network")):
+	"""A local IPv4 interface, network is an ipaddress.IPv4Network"""
+	__slots__ = ()
+
+	@property
+	def broadcast(self):
+		return str(self.network.broadcast_address)
+
+	def __str__(self):
+		return self.name
+
+
+def _ioctlAddress(sock, request, name):
+	packed = struct.pack("256s", name.encode()[:15])
+	return socket.inet_ntoa(fcntl.ioctl(sock.fileno(), request, packed)[20:24])
+
+
+def interfaces():
+	"""The interfaces with an IPv4 address, apart from loopback"""
+	if fcntl is None:
+		return []
+	found = []
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		for index, name in socket.if_nameindex():
+			try:
+				ip = _ioctlAddress(sock, SIOCGIFADDR, name)
+				netmask = _ioctlAddress(sock, SIOCGIFNETMASK, name)
+			except OSError:
+				continue  # down or no IPv4 address
+			interface = Interface(name, ip, ipaddress.ip_interface(f"{ip}/{netmask}").network)
+			if not interface.network.is_loopback:
+				found.append(interface)
+	return found
+
+
+def interfaceFor(ip, interfaces):
+	"""The interface whose network ip is on, None if it's only reachable through a router"""
+	address = ipaddress.ip_address(ip)
+	for interface in interfaces:
+		if address in interface.network:
+			return interface
+	return None
+
+
+def routedSource(ip):
+	"""The local address the routing table sends to ip from, None if there's no route"""
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		try:
+			sock.connect((ip, 9))  # nothing is sent, connecting a UDP socket only looks up the route
+			return sock.getsockname()[0]
+		except OSError:
+			return None
+
+
+def bindToDevice(sock, interface):
+	"""Make sock use interface whatever the routing table says, returns False if that isn't allowed (needs root)"""
+	try:
+		sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, interface.name.encode())
+	except OSError as e:
+		LOGGER.debug("Can't bind to %s: %r", interface.name, e)
+		return False
+	return True
+
+
+def deviceSocket(interface):
+	"""Non-blocking UDP socket that sends out of interface, bound to its address if it can't be bound to the device"""
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+	sock.setblocking(False)
+	try:
+		if not bindToDevice(sock, interface):
+			sock.bind((interface.ip, 0))
+	except OSError:
+		sock.close()
+		raise
+	return sock
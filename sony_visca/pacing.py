@@ -0,0 +1,57 @@
+import logging
+
+LOGGER = logging.getLogger("ptz.pacing")
+
+
+class PacingController:
+	"""Learns the gap to leave between commands sent to a camera.
+
+	Cameras time out if commands arrive too quickly after an ack, but how quickly depends on the model. The gap
+	eases down after every command that is answered and doubles after a "buffer full" error, and it never drops
+	below half the smoothed ack time (a camera that is slow to ack is busy). A timeout on its own is taken as a lost
+	packet rather than congestion, only a run of LOSS_BACKOFF commands in a row timing out backs off.
+	"""
+	DEFAULT_GAP = 0.05
+	MIN_GAP = 0.005
+	MAX_GAP = 0.5
+	DECREASE = 0.95  # multiplier applied to the gap after a success
+	INCREASE = 2  # multiplier applied to the gap after an error
+	SMOOTHING = 0.2  # weight of the newest sample in the ack time average
+	LOSS_BACKOFF = 2  # commands timing out in a row before it's taken as congestion
+
+	def __init__(self, gap=None):
+		self.gap = self.DEFAULT_GAP if gap is None else self._clamp(gap)
+		self.ackTime = None  # smoothed seconds from send to the first reply
+		self.successes = 0
+		self.errors = 0
+		self.timeouts = 0  # commands timed out since the last one was answered
+
+	def __repr__(self):
+		return f"<PacingController gap={self.gap * 1000:.1f}ms>"
+
+	def _clamp(self, gap):
+		return min(max(gap, self.MIN_GAP), self.MAX_GAP)
+
+	def success(self, ackTime=None):
+		"""A command was answered, ackTime being how long the first reply took"""
+		self.successes += 1
+		self.timeouts = 0
+		if ackTime is not None:
+			if self.ackTime is None:
+				self.ackTime = ackTime
+			else:
+				self.ackTime += self.SMOOTHING * (ackTime - self.ackTime)
+		floor = self.ackTime / 2 if self.ackTime is not None else self.MIN_GAP
+		self.gap = self._clamp(max(self.gap * self.DECREASE, floor))
+
+	def failure(self):
+		"""The camera said it was too busy"""
+		self.errors += 1
+		self.gap = self._clamp(self.gap * self.INCREASE)
+		LOGGER.debug("Backing off command gap to %0.1fms", self.gap * 1000)
+
+	def timeout(self):
+		"""A command got no reply, after any resends, call once per command"""
+		self.timeouts += 1
+		if self.timeouts >= self.LOSS_BACKOFF:
+			self.failure()
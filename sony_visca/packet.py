@@ -0,0 +1,41 @@
+import struct
+
+# VISCA over IP header: payload type, payload length, sequence number
+HEADER = struct.Struct(">HHI")
+
+COMMAND = 0x0100
+INQUIRY = 0x0110
+CONTROL = 0x0200
+
+
+class PacketBuilder:
+	"""Frames payloads with the VISCA over IP header in one reusable buffer, so sending doesn't allocate
+
+	build() returns a memoryview of the buffer, which is only valid until the next build(), so it has to be sent
+	straight away (asyncio copies anything it can't send immediately). The payload is copied into the buffer and is
+	never modified.
+	"""
+
+	def __init__(self, size=32):
+		self._allocate(size)
+
+	def _allocate(self, size):
+		self._buffer = bytearray(size)
+		# payload length -> (pack_into for the header and payload, memoryview of the packet), VISCA only has a few
+		#  lengths so these are made once each
+		self._lengths = {}
+
+	def build(self, payload, sequenceNumber, payloadType=COMMAND):
+		"""Frame payload as packet number sequenceNumber"""
+		length = len(payload)
+		cached = self._lengths.get(length)
+		if cached is None:
+			end = HEADER.size + length
+			if end > len(self._buffer):
+				for _, view in self._lengths.values():
+					view.release()
+				self._allocate(end)
+			packInto = struct.Struct(f"{HEADER.format}{length}s").pack_into
+			cached = self._lengths[length] = (packInto, memoryview(self._buffer)[:end])
+		cached[0](self._buffer, 0, payloadType, length, sequenceNumber, payload)
+		return cached[1]
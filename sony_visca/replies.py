@@ -0,0 +1,110 @@
+from sony_visca import packet
+
+# Reply kinds
+ACK = "ack"  # 0x4Y, command accepted into socket Y
+COMPLETION = "completion"  # 0x5Y, command in socket Y finished (inquiry replies carry their data after it)
+ERROR = "error"  # 0x6Y, error code follows
+CONTROL = "control"  # reply to a control command (sequence number reset)
+UNKNOWN = "unknown"
+
+_KINDS = {0x40: ACK, 0x50: COMPLETION, 0x60: ERROR}
+
+CONTROL_REPLY = 0x0201
+
+# Error codes
+MESSAGE_LENGTH = 0x01
+SYNTAX = 0x02
+BUFFER_FULL = 0x03
+CANCELLED = 0x04
+NO_SOCKET = 0x05
+NOT_EXECUTABLE = 0x41
+ERRORS = {
+	MESSAGE_LENGTH: "Message length error", SYNTAX: "Syntax Error", BUFFER_FULL: "Command buffer full",
+	CANCELLED: "Command canceled", NO_SOCKET: "No socket", NOT_EXECUTABLE: "Command not executable",
+}
+
+# Control reply error codes (the payload is 0F then the code)
+SEQUENCE_NUMBER = 0x01
+CONTROL_ERRORS = {SEQUENCE_NUMBER: "Abnormality in sequence number", 0x02: "Abnormality in message"}
+
+
+class Reply:
+	"""One reply from a camera, decoded once when it arrives
+
+	payload is the VISCA message (from the address byte to the 0xFF terminator) without the VISCA over IP header, so
+	it's laid out the same for Sony and headerless cameras. sequence is None for headerless replies, socket and error
+	are None unless the reply has them. key is what the reply is matched to its command by (control replies don't
+	echo the sequence number) and final is whether it finishes the command, an ack is always followed by a completion
+	or error. They're worked out here rather than as properties, as every reply is matched.
+	"""
+	__slots__ = ("kind", "socket", "sequence", "error", "payload", "key", "final")
+
+	def __init__(self, kind, socket, sequence, error, payload):
+		self.kind = kind
+		self.socket = socket
+		self.sequence = sequence
+		self.error = error
+		self.payload = payload
+		self.key = CONTROL if kind is CONTROL else sequence
+		self.final = kind is not ACK
+
+	@property
+	def errorMessage(self):
+		if self.error is None:
+			return None
+		errors = CONTROL_ERRORS if self.kind == CONTROL else ERRORS
+		return errors.get(self.error, "Unknown")
+
+	def __len__(self):
+		return len(self.payload)
+
+	def __bytes__(self):
+		return bytes(self.payload)
+
+	def __repr__(self):
+		return f"<Reply {self.kind} socket={self.socket} seq={self.sequence} error={self.error} {bytes(self.payload).hex()}>"
+
+
+_unpackHeader = packet.HEADER.unpack_from
+_HEADER_SIZE = packet.HEADER.size
+_KIND_OF = tuple(_KINDS.get(byte & 0xf0, UNKNOWN) for byte in range(256))  # second byte of the message -> kind
+
+
+def decode(data):
+	"""Decode one reply, with or without the 8 byte VISCA over IP header, in a single pass
+
+	The payload is sliced out of data, which for a reply of a few bytes is quicker than taking a memoryview of it.
+	"""
+	if len(data) >= _HEADER_SIZE and data[0] in (0x01, 0x02):
+		payloadType, length, sequence = _unpackHeader(data)
+		payload = data[_HEADER_SIZE:_HEADER_SIZE + length]
+		if payloadType == CONTROL_REPLY:
+			error = payload[1] if len(payload) > 1 and payload[0] == 0x0f else None
+			return Reply(CONTROL, None, sequence, error, payload)
+	else:
+		sequence = None
+		payload = data
+	if len(payload) < 2 or not payload[0] & 0x80:
+		return Reply(UNKNOWN, None, sequence, None, payload)
+	second = payload[1]
+	kind = _KIND_OF[second]
+	error = payload[2] if kind is ERROR and len(payload) > 2 else None
+	return Reply(kind, second & 0x0f, sequence, error, payload)
+
+
+def decodeAll(data):
+	"""Decode a datagram, headerless cameras can send several replies in one (e.g. ack and completion)"""
+	if not data or not data[0] & 0x80:
+		return (decode(data),)
+	end = data.find(b"\xff")
+	if end < 0 or end == len(data) - 1:
+		return (decode(data),)  # the usual case, one reply
+	found = []
+	start = 0
+	while start < len(data):
+		end = data.find(b"\xff", start)
+		if end < 0:
+			end = len(data) - 1
+		found.append(decode(data[start:end + 1]))
+		start = end + 1
+	return found
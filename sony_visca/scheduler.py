@@ -0,0 +1,92 @@
+import asyncio
+import collections
+import logging
+import time
+
+LOGGER = logging.getLogger("ptz.scheduler")
+
+
+class CommandScheduler:
+	"""Command queues for one camera, with a lane for each part of the camera that can be driven independently.
+
+	Within a lane only the newest motion command survives (a zoom stop replaces a pending zoom in, but never a
+	pending pan-tilt stop). The lane whose next command has the highest Command.priority goes first, so stops
+	jump ahead of settings and inquiries, and lanes of equal priority are serviced round-robin so one busy axis
+	can't starve the others.
+	"""
+	LANES = ("drive", "zoom", "focus", "settings", "inquiry")
+
+	def __init__(self):
+		self._lanes = {lane: collections.deque() for lane in self.LANES}
+		self._order = list(self._lanes.values())
+		self._next = 0  # index in _order of the lane to service next
+		self._ready = asyncio.Event()
+		self._shutdown = False
+		self.superseded = 0  # motion commands dropped because a newer one replaced them
+
+	def __len__(self):
+		return sum(len(lane) for lane in self._order)
+
+	def put(self, command, supersede=True):
+		"""Queue a command in its lane, replacing any older motion commands in that lane if supersede"""
+		lane = self._lanes[command.lane]
+		if supersede and command.motion and lane:
+			kept = [queued for queued in lane if not queued.motion]
+			for queued in lane:
+				if queued.motion:
+					LOGGER.debug("Superseded %r with %r", queued, command)
+					queued.result = None  # release anyone waiting on it
+					self.superseded += 1
+			lane.clear()
+			lane.extend(kept)
+		command.queuedAt = time.monotonic()
+		lane.append(command)
+		self._ready.set()
+
+	def put_many(self, *commands, supersede=True):
+		"""Queue each of the commands, in order"""
+		assert len(commands) >= 1, "must pass at least one command"
+		for command in commands:
+			self.put(command, supersede=supersede)
+
+	def trigger_shutdown(self):
+		"""Drop everything queued and trigger a shutdown of the consumer"""
+		for lane in self._order:
+			for command in lane:
+				command.result = None  # release anyone waiting on it
+			lane.clear()
+		self._shutdown = True
+		self._ready.set()
+
+	def wake(self):
+		"""Have get() look again, for when something its ready check depends on has changed"""
+		self._ready.set()
+
+	def get_nowait(self, ready=None):
+		"""Take the highest priority command at the front of a lane, or None if there isn't one
+		If given, lanes whose front command fails ready(command) are skipped.
+		"""
+		best = None
+		bestPriority = None
+		for i in range(len(self._order)):
+			index = (self._next + i) % len(self._order)
+			lane = self._order[index]
+			if lane and (best is None or lane[0].priority > bestPriority) and (ready is None or ready(lane[0])):
+				best = index
+				bestPriority = lane[0].priority
+		if best is None:
+			return None
+		self._next = (best + 1) % len(self._order)
+		return self._order[best].popleft()
+
+	async def get(self, ready=None):
+		"""Wait for the next command (that passes ready(command), if given), returns None once shutdown has been
+		triggered
+		"""
+		while not self._shutdown:
+			command = self.get_nowait(ready)
+			if command is not None:
+				return command
+			self._ready.clear()
+			await self._ready.wait()
+		return None
@@ -0,0 +1,10 @@
+"""Simulated VISCA over IP cameras on loopback, for developing and load testing without hardware
+
+	async with Simulator(sony=100, ptzoptics=100, profile=Profile(latency=0.005, loss=0.01)) as simulator:
+		cameras = simulator.connect(AsyncViscaCamera)
+		...
+
+or run python -m sony_visca.simulator to leave some running for the UI to find.
+"""
+from sony_visca.simulator.camera import CameraState, Profile
+from sony_visca.simulator.server import SimulatedCamera, Simulator
@@ -0,0 +1,33 @@
+import argparse
+import asyncio
+import logging
+
+from sony_visca.simulator import Profile, Simulator
+
+
+async def main(args):
+	profile = Profile(args.latency, args.jitter, args.loss, args.buffer_full, args.execution)
+	async with Simulator(args.sony, args.ptzoptics, profile, first=args.first, seed=args.seed, enq=not args.no_enq) as simulator:
+		for simulated in simulator.cameras:
+			print(simulated)
+		print(f"Sweep {simulator.network} to find them, Ctrl+C to stop")
+		await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Simulated VISCA over IP cameras on loopback")
+	parser.add_argument("--sony", type=int, default=1)
+	parser.add_argument("--ptzoptics", type=int, default=0)
+	parser.add_argument("--first", default="127.0.1.1", help="address of the first camera")
+	parser.add_argument("--latency", type=float, default=0.002, help="seconds before each reply")
+	parser.add_argument("--jitter", type=float, default=0, help="up to this many seconds more")
+	parser.add_argument("--loss", type=float, default=0, help="chance of a reply being dropped")
+	parser.add_argument("--buffer-full", type=float, default=0, help="chance of a command being refused")
+	parser.add_argument("--execution", type=float, default=0.05, help="seconds a command takes")
+	parser.add_argument("--seed", type=int)
+	parser.add_argument("--no-enq", action="store_true", help="Sony cameras don't answer the discovery ENQ")
+	logging.basicConfig(level=logging.INFO)
+	try:
+		asyncio.run(main(parser.parse_args()))
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,188 @@
+import collections
+
+from sony_visca import packet
+
+# VISCA over IP payload types the simulator replies with
+REPLY = 0x0111
+CONTROL_REPLY = 0x0201
+
+SOCKETS = 2  # command buffers, as in a real camera
+VERSION = bytes.fromhex("00200511030002")  # vendor (Sony), model, ROM version, socket count
+
+
+class Profile(collections.namedtuple("Profile", "latency jitter loss bufferFull execution", defaults=(0.002, 0, 0, 0, 0.05))):
+	"""How a simulated camera behaves on the network
+
+	latency is seconds before each reply is sent, plus up to jitter more. loss is the chance of each reply being
+	dropped, bufferFull the chance of a command being refused with buffer full even if a socket is free. execution is
+	how long a command holds its socket between the ack and the completion.
+	"""
+	__slots__ = ()
+
+
+def _nibbles(value, count):
+	"""value spread over count bytes, four bits in each, most significant first"""
+	return bytes((value >> shift) & 0x0f for shift in range(4 * (count - 1), -1, -4))
+
+
+def _value(data):
+	"""Inverse of _nibbles"""
+	value = 0
+	for byte in data:
+		value = (value << 4) | (byte & 0x0f)
+	return value
+
+
+class CameraState:
+	"""The settings a simulated camera reports, named as in CameraProperties
+
+	The block replies are laid out the way CameraProperties.decodeBlock* read them.
+	"""
+
+	def __init__(self, cameraID=0):
+		self.power = True
+		self.zoom = 0
+		self.focus = 0x1000
+		self.focusNearLimit = 0x10
+		self.autoFocus = True
+		self.digitalZoom = False
+		self.autoFocusSensitivity = False
+		self.autoFocusMode = 0
+		self.lowContrastDetection = False
+		self.RGain = 0x80
+		self.BGain = 0x80
+		self.whiteBalanceMode = 0
+		self.apertureGain = 5
+		self.exposureMode = 0
+		self.highResolution = False
+		self.wideDynamicRange = False
+		self.autoSlowShutter = False
+		self.exposureCompOn = False
+		self.backlightComp = False
+		self.shutter = 0x11
+		self.iris = 0x0d
+		self.gain = 0x01
+		self.exposureComp = 7
+		self.pictureEffect = 0
+		self.cameraID = cameraID
+		self.dropFrame = False
+		self.digitalZoomPos = 0
+		self.autoFocusActivationTime = 0x05
+		self.autoFocusIntervalTime = 0x05
+		self.colorGain = 4
+		self.gamma = 0
+		self.highSensitivity = False
+		self.noiseReduction = 0
+		self.gainLimit = 0x0f
+		self.chromaSuppress = 0
+		self.defog = False
+		self.colorHue = 4
+		self.pan = 0
+		self.tilt = 0
+
+	def blockLens(self):
+		return (
+			b"\x90\x50" + _nibbles(self.zoom, 4) + _nibbles(self.focusNearLimit, 2) + _nibbles(self.focus, 4) + b"\x00"
+			+ bytes((
+				self.autoFocus | self.digitalZoom << 1 | self.autoFocusSensitivity << 2 | (self.autoFocusMode & 3) << 3,
+				self.lowContrastDetection << 3,
+			)) + b"\xff"
+		)
+
+	def blockControl(self):
+		return b"\x90\x50" + _nibbles(self.RGain, 2) + _nibbles(self.BGain, 2) + bytes((
+			self.whiteBalanceMode & 0x0f,
+			self.apertureGain & 0x0f,
+			self.exposureMode & 0x0f,
+			self.highResolution << 5 | self.wideDynamicRange << 4 | self.backlightComp << 2 | self.exposureCompOn << 1
+			| self.autoSlowShutter,
+			self.shutter & 0x3f,
+			self.iris & 0x1f,
+			self.gain & 0x1f,
+			self.exposureComp & 0x0f,
+		)) + b"\xff"
+
+	def blockOther(self):
+		return (
+			b"\x90\x50" + bytes((self.power, 0, 0, self.pictureEffect & 0x0f, 0, 0)) + _nibbles(self.cameraID, 4)
+			+ bytes((self.dropFrame,)) + b"\xff"
+		)
+
+	def blockEnlargement(self):
+		return (
+			b"\x90\x50" + _nibbles(self.digitalZoomPos, 2) + _nibbles(self.autoFocusActivationTime, 2)
+			+ _nibbles(self.autoFocusIntervalTime, 2) + bytes((
+				0, 0, 0,
+				(self.colorGain & 0x0f) << 3,
+				0,
+				(self.gamma & 0x07) << 4 | self.highSensitivity << 3 | (self.noiseReduction & 0x07),
+				(self.chromaSuppress & 0x07) << 4 | (self.gainLimit & 0x0f),
+			)) + b"\xff"
+		)
+
+	def blockEnlargement2(self):
+		return b"\x90\x50" + bytes(5) + bytes((self.defog,)) + bytes(6) + b"\xff"
+
+	def blockEnlargement3(self):
+		return b"\x90\x50" + bytes((self.colorHue & 0x07,)) + bytes(12) + b"\xff"
+
+	def panTiltPosition(self):
+		return b"\x90\x50" + _nibbles(self.pan & 0xffff, 4) + _nibbles(self.tilt & 0xffff, 4) + b"\xff"
+
+	def apply(self, command):
+		"""Update the state for the commands that change what the inquiries report"""
+		if command[2:4] == b"\x04\x47" and len(command) >= 9:
+			self.zoom = _value(command[4:8])
+		elif command[2:4] == b"\x04\x48" and len(command) >= 9:
+			self.focus = _value(command[4:8])
+		elif command[2:4] == b"\x04\x00" and len(command) >= 5:
+			self.power = command[4] == 0x02
+		elif command[2:4] == b"\x04\x38" and len(command) >= 5:
+			self.autoFocus = command[4] == 0x02
+		elif command[2:4] == b"\x06\x02" and len(command) >= 15:
+			self.pan = _signed(_value(command[6:10]))
+			self.tilt = _signed(_value(command[10:14]))
+		elif command[2:4] == b"\x06\x04":
+			self.pan = self.tilt = 0
+
+	def inquiry(self, inquiry):
+		"""The reply to an inquiry, None if it's not one the simulator knows"""
+		reply = _INQUIRIES.get(bytes(inquiry[2:-1]))
+		return reply(self) if reply is not None else None
+
+
+def _signed(value):
+	return value - 0x10000 if value & 0x8000 else value
+
+
+_INQUIRIES = {
+	b"\x7e\x7e\x00": CameraState.blockLens,
+	b"\x7e\x7e\x01": CameraState.blockControl,
+	b"\x7e\x7e\x02": CameraState.blockOther,
+	b"\x7e\x7e\x03": CameraState.blockEnlargement,
+	b"\x7e\x7e\x04": CameraState.blockEnlargement2,
+	b"\x7e\x7e\x05": CameraState.blockEnlargement3,
+	b"\x06\x12": CameraState.panTiltPosition,
+	b"\x04\x47": lambda state: b"\x90\x50" + _nibbles(state.zoom, 4) + b"\xff",
+	b"\x04\x48": lambda state: b"\x90\x50" + _nibbles(state.focus, 4) + b"\xff",
+	b"\x04\x00": lambda state: b"\x90\x50" + (b"\x02" if state.power else b"\x03") + b"\xff",
+	b"\x04\x38": lambda state: b"\x90\x50" + (b"\x02" if state.autoFocus else b"\x03") + b"\xff",
+	b"\x00\x02": lambda state: b"\x90\x50" + VERSION + b"\xff",
+}
+
+
+def ack(socket):
+	return bytes((0x90, 0x40 | socket, 0xff))
+
+
+def completion(socket):
+	return bytes((0x90, 0x50 | socket, 0xff))
+
+
+def error(socket, code):
+	return bytes((0x90, 0x60 | socket, code, 0xff))
+
+
+def frame(payload, sequence, payloadType=REPLY):
+	"""payload with the VISCA over IP header, for Sony cameras"""
+	return packet.HEADER.pack(payloadType, len(payload), sequence) + payload
@@ -0,0 +1,225 @@
+import asyncio
+import ipaddress
+import logging
+import random
+import socket
+
+from sony_visca import discovery, packet
+from sony_visca.simulator import camera
+
+LOGGER = logging.getLogger("ptz.simulator")
+
+FIRST_IP = "127.0.1.1"
+# The controller's local socket has 52381 on every address, so simulated Sony cameras listen on the next port and
+#  reply to 52381 the way a real one does
+SONY_PORT = 52382
+SONY_REPLY_PORT = 52381
+PTZOPTICS_PORT = 1259
+
+
+class _Protocol(asyncio.DatagramProtocol):
+	def __init__(self, received):
+		self._received = received
+		self.transport = None
+
+	def connection_made(self, transport):
+		self.transport = transport
+
+	def datagram_received(self, data, addr):
+		self._received(data, addr)
+
+
+class SimulatedCamera:
+	"""One simulated camera on a loopback address, Sony (VISCA over IP with headers) or PTZOptics (headerless)
+
+	Commands are acknowledged and completed execution seconds later, while holding one of the camera's two sockets, a
+	third at once is refused with buffer full. Inquiries are answered from state, which commands that set positions
+	update. Sony cameras also answer the discovery ENQ sent to their address, unless enq is False (as for a camera
+	behind a router, whose broadcast reply never comes back).
+	"""
+
+	def __init__(self, ip, name, mac, simple_visca=False, profile=camera.Profile(), rng=None, cameraID=0, enq=True):
+		self.ip = ip
+		self.name = name
+		self.mac = mac
+		self.simple_visca = simple_visca
+		self.enq = enq
+		self.port = PTZOPTICS_PORT if simple_visca else SONY_PORT
+		self.profile = profile
+		self.state = camera.CameraState(cameraID)
+		self.received = 0
+		self.sent = 0
+		self.dropped = 0
+		self._rng = rng or random.Random()
+		self._busy = [False] * (camera.SOCKETS + 1)  # by socket number, 0 isn't used
+		self._last = 0  # when the last reply is due, so they go out in order whatever the jitter
+		self._transports = []
+		self._visca = None
+
+	def __repr__(self):
+		return f"<SimulatedCamera {self.name} {'PTZOptics' if self.simple_visca else 'Sony'} {self.ip}:{self.port}>"
+
+	async def start(self):
+		loop = asyncio.get_running_loop()
+		self._visca, _ = await loop.create_datagram_endpoint(
+			lambda: _Protocol(self._viscaReceived), local_addr=(self.ip, self.port)
+		)
+		self._transports.append(self._visca)
+		if not self.simple_visca and self.enq:
+			# the controller's discovery socket has SO_REUSEADDR on the ENQ port, the more specific address gets the ENQ
+			sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			sock.bind((self.ip, discovery.SONY_PORT))
+			enq, _ = await loop.create_datagram_endpoint(lambda: _Protocol(self._enqReceived), sock=sock)
+			self._transports.append(enq)
+
+	def close(self):
+		for transport in self._transports:
+			transport.close()
+		self._transports.clear()
+
+	def _enqReceived(self, data, addr):
+		if data != discovery.SONY_ENQ:
+			return
+		transport = self._transports[1]
+		reply = b"\xff".join((
+			b"\x02MAC:" + self.mac.encode(), b"INFO:simulator", b"MODEL:SIMCAM", b"SOFTVERSION:1.0",
+			b"IPADR:" + self.ip.encode(), b"MASK:255.0.0.0", b"GATEWAY:0.0.0.0", b"NAME:" + self.name.encode(),
+			b"WRITE:on",
+		)) + b"\xff\x03"
+		self._send(transport, reply, addr)
+
+	def _viscaReceived(self, data, addr):
+		self.received += 1
+		if self.simple_visca:
+			sequence = None
+			replyTo = addr
+			messages = [message + b"\xff" for message in data.split(b"\xff") if message]
+		else:
+			if len(data) < packet.HEADER.size:
+				return
+			payloadType, length, sequence = packet.HEADER.unpack_from(data)
+			replyTo = (addr[0], SONY_REPLY_PORT)
+			if payloadType == packet.CONTROL:
+				# sequence number reset, or anything else, is just acknowledged
+				self._reply(camera.frame(b"\x01", sequence, camera.CONTROL_REPLY), replyTo)
+				return
+			messages = [data[packet.HEADER.size:packet.HEADER.size + length]]
+		for message in messages:
+			self._message(message, sequence, replyTo)
+
+	def _message(self, message, sequence, replyTo):
+		if len(message) < 3 or message[0] & 0xf0 != 0x80:
+			self._respond(camera.error(0, 0x02), sequence, replyTo)  # syntax error
+			return
+		if message[1] == 0x09:
+			reply = self.state.inquiry(message)
+			self._respond(reply if reply is not None else camera.error(0, 0x02), sequence, replyTo)
+			return
+		if message[1] != 0x01:
+			self._respond(camera.error(0, 0x02), sequence, replyTo)
+			return
+		free = [number for number in range(1, camera.SOCKETS + 1) if not self._busy[number]]
+		if not free or self._rng.random() < self.profile.bufferFull:
+			self._respond(camera.error(0, 0x03), sequence, replyTo)
+			return
+		number = free[0]
+		self._busy[number] = True
+		self.state.apply(message)
+		delay = self._respond(camera.ack(number), sequence, replyTo)
+		asyncio.get_running_loop().call_later(
+			delay + self.profile.execution, self._complete, number, sequence, replyTo
+		)
+
+	def _complete(self, number, sequence, replyTo):
+		self._busy[number] = False
+		self._respond(camera.completion(number), sequence, replyTo)
+
+	def _respond(self, payload, sequence, replyTo):
+		"""Send a reply after the profile's latency, returns the delay"""
+		if sequence is not None:
+			payload = camera.frame(payload, sequence)
+		return self._reply(payload, replyTo)
+
+	def _reply(self, data, replyTo):
+		profile = self.profile
+		delay = profile.latency + (self._rng.random() * profile.jitter if profile.jitter else 0)
+		loop = asyncio.get_running_loop()
+		due = max(loop.time() + delay, self._last)
+		self._last = due
+		delay = due - loop.time()
+		if profile.loss and self._rng.random() < profile.loss:
+			self.dropped += 1
+			return delay
+		if delay > 0:
+			loop.call_at(due, self._send, self._visca, data, replyTo)
+		else:
+			self._send(self._visca, data, replyTo)
+		return delay
+
+	def _send(self, transport, data, addr):
+		if transport.is_closing():
+			return
+		self.sent += 1
+		transport.sendto(data, addr)
+
+
+class Simulator:
+	"""Many simulated cameras on consecutive loopback addresses, all on the running event loop
+
+	Addresses start at FIRST_IP (all of 127.0.0.0/8 is loopback on Linux). The same seed gives the same losses,
+	jitter and buffer full errors, so a run can be repeated. With enq False the Sony cameras only answer VISCA.
+	"""
+
+	def __init__(self, sony=1, ptzoptics=0, profile=camera.Profile(), first=FIRST_IP, seed=None, enq=True):
+		self._rng = random.Random(seed)
+		self.cameras = []
+		address = ipaddress.ip_address(first)
+		for number in range(sony + ptzoptics):
+			simple = number >= sony
+			self.cameras.append(SimulatedCamera(
+				str(address + number),
+				f"SIM{number + 1}",
+				"02-00-00-00-{:02x}-{:02x}".format(number >> 8 & 0xff, number & 0xff),
+				simple_visca=simple,
+				profile=profile,
+				rng=self._rng,
+				cameraID=number + 1,
+				enq=enq,
+			))
+
+	def __repr__(self):
+		return f"<Simulator {len(self.cameras)} cameras>"
+
+	@property
+	def network(self):
+		"""The smallest network holding every camera, e.g. to sweep"""
+		first = ipaddress.ip_address(self.cameras[0].ip)
+		last = ipaddress.ip_address(self.cameras[-1].ip)
+		prefix = 32 - (int(first) ^ int(last)).bit_length()
+		return str(ipaddress.ip_network(f"{first}/{prefix}", strict=False))
+
+	async def start(self):
+		await asyncio.gather(*(simulated.start() for simulated in self.cameras))
+		LOGGER.info("Started %d simulated cameras on %s", len(self.cameras), self.network)
+		return self
+
+	def close(self):
+		for simulated in self.cameras:
+			simulated.close()
+
+	async def __aenter__(self):
+		return await self.start()
+
+	async def __aexit__(self, *args):
+		self.close()
+
+	def connect(self, cls, **kwargs):
+		"""A camera object (made with cls, e.g. ViscaIPCamera) for each simulated camera, set up to talk to it"""
+		return [
+			cls(
+				simulated.name, simulated.ip, simulated.mac, port=simulated.port, simple_visca=simulated.simple_visca,
+				**kwargs
+			)
+			for simulated in self.cameras
+		]
@@ -0,0 +1,141 @@
+import asyncio
+import ipaddress
+import logging
+
+from sony_visca import aioudp, discovery, netif, packet
+from sony_visca.async_camera import AsyncViscaCamera
+
+LOGGER = logging.getLogger("ptz.sweep")
+
+ARP_TABLE = "/proc/net/arp"
+VERSION_INQ = bytes.fromhex("81090002ff")  # CAM_VersionInq, any VISCA camera answers it
+SONY_VISCA_PORT = 52381
+SIMPLE_VISCA_PORT = 1259
+
+
+class _Pacer:
+	"""Spaces sends out to at most rate per second"""
+
+	def __init__(self, rate):
+		self.interval = 1 / rate
+		self._next = 0
+
+	async def wait(self):
+		now = asyncio.get_running_loop().time()
+		at = max(now, self._next)
+		self._next = at + self.interval
+		if at > now:
+			await asyncio.sleep(at - now)
+
+
+def arpTable(path=ARP_TABLE):
+	"""{ip: mac} for every complete entry in the kernel's ARP table, empty if it can't be read"""
+	table = {}
+	try:
+		with open(path) as f:
+			next(f)  # header
+			for line in f:
+				fields = line.split()
+				# IP address, HW type, Flags, HW address, Mask, Device. Flag 0x2 is a complete entry
+				if len(fields) >= 4 and int(fields[2], 16) & 0x2:
+					table[fields[0]] = fields[3]
+	except (OSError, StopIteration, ValueError) as e:
+		LOGGER.debug("Can't read ARP table %s: %r", path, e)
+	return table
+
+
+async def sweep(cls, networks, concurrency=64, rate=500, timeout=0.5, sonyPort=SONY_VISCA_PORT):
+	"""Probe every host in networks (CIDR strings) for cameras, for cameras the discovery broadcast doesn't reach
+
+	Each host gets the Sony ENQ, and a VISCA version inquiry on sonyPort (with header) and 1259 (headerless), at most
+	concurrency hosts at a time and rate packets a second. Sony cameras always reply to port 52381, so their inquiry
+	goes out of the cameras' local socket, where the reply comes back to. A host that doesn't answer within timeout is skipped, so a
+	/24 takes about three seconds. Returns the cameras found (made with cls), the MAC comes from the ENQ reply or the ARP
+	table, and is the IP for a camera behind a router that only answered VISCA.
+	Sony cameras that broadcast their ENQ reply are heard by the discovery listener rather than here.
+	"""
+	hosts = [str(host) for network in networks for host in ipaddress.ip_network(network, strict=False).hosts()]
+	endpoint = await aioudp.open_datagram_endpoint("0.0.0.0", 0)
+	try:
+		local = await AsyncViscaCamera.openLocalSocket()
+	except (OSError, RuntimeError) as e:
+		LOGGER.warning("Can't use port 52381, Sony cameras that don't answer the ENQ won't be found: %r", e)
+		local = None
+	replies = {}  # ip -> {port: first reply}
+	answered = {}  # ip -> Event set on the first reply
+	inquiry = packet.HEADER.pack(packet.INQUIRY, len(VERSION_INQ), 0) + VERSION_INQ
+	probes = (
+		(discovery.SONY_PORT, discovery.SONY_ENQ),
+		(SIMPLE_VISCA_PORT, VERSION_INQ),
+	)
+	pacer = _Pacer(rate)
+	slots = asyncio.Semaphore(concurrency)
+
+	async def receive():
+		while True:
+			data, (ip, port) = await endpoint.receive()
+			replies.setdefault(ip, {}).setdefault(port, data)
+			if ip in answered:
+				answered[ip].set()
+
+	def viscaReplied(ip, future):
+		if not future.cancelled() and future.exception() is None:
+			replies.setdefault(ip, {}).setdefault(SONY_VISCA_PORT, future.result())
+			answered[ip].set()
+
+	async def probe(ip):
+		async with slots:
+			answered[ip] = asyncio.Event()
+			pending = None
+			if local is not None:
+				local.allow(ip)
+				# sequence number 0, which cameras only use after 2**32 commands
+				pending = local.expect(ip, 0, timeout=timeout)
+				pending.first.add_done_callback(lambda future: viscaReplied(ip, future))
+			try:
+				for port, message in probes:
+					await pacer.wait()
+					endpoint.send(message, (ip, port))
+				if local is not None:
+					await pacer.wait()
+					local.send(inquiry, (ip, sonyPort))
+				await asyncio.wait_for(answered[ip].wait(), timeout)
+			except OSError as e:
+				LOGGER.debug("Can't probe %s: %r", ip, e)
+			except asyncio.TimeoutError:
+				pass
+			finally:
+				if pending is not None:
+					pending.close()
+					local.disallow(ip)
+
+	loop = asyncio.get_running_loop()
+	start = loop.time()
+	receiver = asyncio.create_task(receive())
+	try:
+		await asyncio.gather(*(probe(ip) for ip in hosts))
+		await asyncio.sleep(min(timeout, 0.1))  # the other probes' replies to the last hosts
+	finally:
+		receiver.cancel()
+		await asyncio.gather(receiver, return_exceptions=True)
+		endpoint.close()
+		if local is not None:
+			await AsyncViscaCamera.closeLocalSocket()
+
+	arp = arpTable()
+	interfaces = netif.interfaces()
+	found = []
+	for ip, byPort in replies.items():
+		camera = None
+		if discovery.SONY_PORT in byPort:
+			camera = discovery.sonyCamera(cls, byPort[discovery.SONY_PORT], ip)
+		if camera is None and (SONY_VISCA_PORT in byPort or SIMPLE_VISCA_PORT in byPort):
+			mac = arp.get(ip, ip)
+			if SONY_VISCA_PORT in byPort:
+				camera = cls(ip, ip, mac, port=sonyPort)
+			else:
+				camera = cls(ip, ip, mac, port=SIMPLE_VISCA_PORT, simple_visca=True)
+		if camera is not None:
+			found.append(discovery.tagInterface(camera, interfaces))
+	LOGGER.info("Swept %d hosts in %.1fs, found %d cameras", len(hosts), loop.time() - start, len(found))
+	return found
@@ -22,14 +22,25 @@ class CommandTimeout(Exception):
 	"""Timeout waiting for a response from a command"""
 
 
+class Priority:
+	"""Order the camera's send loop services commands in, highest first"""
+	INQUIRY = 0
+	SET = 1
+	DRIVE = 2
+	STOP = 3
+
+
 class Command:
 	"""Wrapper for PTZ commands"""
 
-	def __init__(self, value, skipCompletion=False):
+	def __init__(self, value, skipCompletion=False, priority=None):
 		self.value = value
 		self.skipCompletion = skipCompletion
+		self._priority = priority  # None to work it out from the command
+		self.queuedAt = None  # time.monotonic() when put on a camera's queue
 		self._result = None
 		self._result_ready = threading.Event()
+		self._future = None
 
 	@property
 	def kwargs(self):
@@ -42,6 +53,14 @@ class Command:
 		if not ready:
 			raise CommandTimeout
 
+	def result_future(self, loop):
+		"""Get an asyncio future for the result, to wait on the command from the event loop"""
+		if self._future is None:
+			self._future = loop.create_future()
+			if self._result_ready.is_set():
+				self._future.set_result(self._result)
+		return self._future
+
 	@property
 	def result(self):
 		"""Get command result"""
@@ -52,10 +71,84 @@ class Command:
 		"""Set command result"""
 		self._result = value
 		self._result_ready.set()
+		if self._future is not None and not self._future.done():
+			self._future.set_result(value)
 
 	def __repr__(self):
 		return f"<Command: {self.value!r}>"
 
+	def copy(self):
+		"""A fresh command sharing this one's bytes, to send the same thing to another camera"""
+		return Command(self.value, skipCompletion=self.skipCompletion, priority=self._priority)
+
+	@property
+	def lane(self):
+		"""Which of the camera's independent command queues this goes in (drive, zoom, focus, settings or inquiry)"""
+		value = self.value
+		if len(value) > 2 and value[0] == 0x81 and value[1] == 0x09:
+			return "inquiry"
+		if len(value) > 3 and value[0] == 0x81 and value[1] == 0x01:
+			if value[2] == 0x06 and value[3] in (0x01, 0x02, 0x03, 0x04, 0x05):
+				return "drive"
+			if value[2] == 0x04:
+				if value[3] in (0x07, 0x47):
+					return "zoom"
+				if value[3] in (0x08, 0x48, 0x18, 0x28, 0x38, 0x27, 0x57, 0x58):
+					return "focus"
+		return "settings"
+
+	@property
+	def motion(self):
+		"""Whether this sets where an axis is heading, so a newer one in the same lane makes it obsolete"""
+		value = self.value
+		if len(value) > 3 and value[0] == 0x81 and value[1] == 0x01:
+			if value[2] == 0x06:
+				return value[3] in (0x01, 0x02, 0x04)  # drive, absolute, home
+			if value[2] == 0x04:
+				return value[3] in (0x07, 0x47, 0x08, 0x48)  # zoom / focus drive and direct
+		return False
+
+	@property
+	def stop(self):
+		"""Whether this is a pan-tilt, zoom or focus stop"""
+		value = self.value
+		if len(value) > 4 and value[0] == 0x81 and value[1] == 0x01:
+			if value[2] == 0x06 and value[3] == 0x01:
+				return len(value) > 7 and value[6] == 0x03 and value[7] == 0x03
+			if value[2] == 0x04 and value[3] in (0x07, 0x08):
+				return value[4] == 0x00
+		return False
+
+	@property
+	def idempotent(self):
+		"""Whether sending this twice does the same as sending it once, so it's safe to resend if a reply is lost"""
+		value = self.value
+		if len(value) > 4 and value[0] == 0x81 and value[1] == 0x01:
+			if value[2] == 0x06:
+				# relative moves and IR toggle
+				return not (value[3] == 0x03 or (value[3] == 0x08 and value[4] == 0x10))
+			if value[2] == 0x04:
+				# aperture / gain / shutter / iris / bright / exposure comp up and down steps
+				if value[3] in (0x02, 0x03, 0x04, 0x0a, 0x0b, 0x0c, 0x0d, 0x0e) and value[4] in (0x02, 0x03):
+					return False
+				# toggles and one push triggers
+				if (value[3], value[4]) in ((0x38, 0x10), (0x18, 0x01), (0x10, 0x05)):
+					return False
+		return True
+
+	@property
+	def priority(self):
+		"""How urgently this needs to go on the wire, see Priority"""
+		if self._priority is not None:
+			return self._priority
+		if self.lane == "inquiry":
+			return Priority.INQUIRY
+		if self.stop:
+			return Priority.STOP
+		if self.motion:
+			return Priority.DRIVE
+		return Priority.SET
+
 	# Commands
 	PowerOn = bytearray.fromhex("8101040002ff")
 	PowerOff = bytearray.fromhex("8101040003ff")
@@ -3,13 +3,11 @@ import socket
 import logging
 import threading
 import struct
-import re
 import ipaddress
 
-from InquiryDecode import CameraProperties
-from sony_visca import aioudp
+from sony_visca import discovery, fleet, metrics, sweep
+from sony_visca.async_camera import AsyncViscaCamera
 from sony_visca.visca_commands import Inquiry, Command
-from sony_visca.myqueue import MyQueue
 
 socket.setdefaulttimeout(2)
 
@@ -40,93 +38,66 @@ class LoopThread(threading.Thread):
 		self.ready.wait()
 
 
-class ViscaIPCamera:
+class ViscaIPCamera(AsyncViscaCamera):
+	"""Blocking wrapper around AsyncViscaCamera for code that isn't async (the Qt UI)
+	All cameras run on one event loop in a background thread, started with the first camera (or the discovery listener)
+	and stopped once the last one has gone.
+	"""
 	_LOOP_THREAD = None
-	_LOCAL_SOCK = None
 	_CONNECTED_CAMS = 0
+	_LISTENER = None
+	_METRICS = None
 
-	def __init__(self, name, ip, mac, netmask="255.255.255.0", gateway="0.0.0.0", port=52381, device_id=None, simple_visca=False):
-		self.sequenceNumber = 1 # starts at 1?
-		self.name = name
-		self.ip = ip
-		self.mac = mac # mac using dashes to seperate
-		self.netmask = netmask
-		self.gateway = gateway
-		self.port = port
-		self.is_connected = False
-		self.device_id = device_id
-		self.simple_visca = simple_visca
-		self._remote_sock = None
-		self._queue_loop = None  # Handle to the Task running the queue processing loop
-
-		self.properties = CameraProperties()
-
-	def __str__(self):
-		return f"{self.name}({self.mac}) {self.ip}"
+	@classmethod
+	def _startLoop(cls):
+		if not cls._LOOP_THREAD:
+			# If we don't have an event loop, create one
+			cls._LOOP_THREAD = LoopThread()
+			cls._LOOP_THREAD.start()
+			cls._LOOP_THREAD.wait_ready()
+			LOGGER.info("Started camera event loop")
+		return cls._LOOP_THREAD.loop
 
-	def __repr__(self):
-		return f"<ViscaIPCamera name={self.name!r} mac={self.mac!r}>"
+	@classmethod
+	def _stopLoopIfIdle(cls):
+		if cls._LOOP_THREAD and cls._CONNECTED_CAMS == 0 and cls._LISTENER is None and cls._METRICS is None:
+			cls._LOOP_THREAD.stop()
+			LOGGER.info("Stopped event loop")
+			cls._LOOP_THREAD = None
 
 	def initialise(self):
 		"""Initialise this camera on the event loop"""
-		if not self._LOOP_THREAD:
-			# If we don't have an event loop, create one
-			self.__class__._LOOP_THREAD = LoopThread()
-			self._LOOP_THREAD.start()
-			self._LOOP_THREAD.wait_ready()
-			LOGGER.info("Started camera event loop")
+		return self.initialiseAsync().result()
+
+	def initialiseAsync(self):
+		"""Initialise this camera on the event loop without waiting
+		Returns a concurrent.futures.Future, done once the camera has been opened.
+		"""
+		loop = self._startLoop()
 		self.__class__._CONNECTED_CAMS += 1
-		future = asyncio.run_coroutine_threadsafe(self._initialise(), self._LOOP_THREAD.loop)
-		return future.result()
-
-	async def _initialise(self):
-		"""Setup the async sockets"""
-		self.cmd_queue = MyQueue()
-		if self._LOCAL_SOCK is None:
-			# The first camera initialised needs to open the local socket
-			self.__class__._LOCAL_SOCK = await aioudp.open_local_endpoint("0.0.0.0", 52381)
-			LOGGER.info("Opened local UDP socket")
-		self._remote_sock = await aioudp.open_remote_endpoint(self.ip, self.port)
-		LOGGER.info("Opened remote UDP socket to cam %s", self.ip)
-		try:
-			if not self.simple_visca:
-				await self.resetSequenceNumber()
-			self.is_connected = True
-		except asyncio.TimeoutError:
-			LOGGER.warning("Timeout trying to reset sequence number on camera %s", self.ip)
+		return asyncio.run_coroutine_threadsafe(self.open(), loop)
 
 	def close(self):
 		"""Close communication sockets, and event loop if this is the last camera
 		We have to teardown the event loop when the last camera is torn down as we're hiding async from the user
 		"""
-		future = asyncio.run_coroutine_threadsafe(self._close(), self._LOOP_THREAD.loop)
+		future = asyncio.run_coroutine_threadsafe(super().close(), self._LOOP_THREAD.loop)
 		future.result()
-		LOGGER.info("Closed remote UDP socket to cam %s", self.ip)
 		self.__class__._CONNECTED_CAMS -= 1
-		if self._CONNECTED_CAMS == 0:
-			# If this is the last camera, shutdown the local socket and the event loop
-			future = asyncio.run_coroutine_threadsafe(self._close_local(), self._LOOP_THREAD.loop)
-			future.result()
-			LOGGER.info("Closed local UDP socket")
-			self._LOOP_THREAD.stop()
-			LOGGER.info("Stopped event loop")
-			self.__class__._LOOP_THREAD = None
-
-	async def _close(self):
-		"""Close this camera"""
-		if self._queue_loop is not None:
-			self.cmd_queue.trigger_shutdown()
-			LOGGER.debug("Waiting for queue watcher to exit...")
-			await asyncio.gather(self._queue_loop)
-		if self._remote_sock is not None:
-			self._remote_sock.close()
-			self._remote_sock = None
-		self.is_connected = False
-
-	async def _close_local(self):
-		"""Close the local socket"""
-		self._LOCAL_SOCK.close()
-		self.__class__._LOCAL_SOCK = None
+		self._stopLoopIfIdle()
+
+	def closeAsync(self):
+		"""Close this camera without waiting, leaving the event loop running even if it was the last camera
+		Returns a concurrent.futures.Future, done once the camera is closed.
+		"""
+		self.__class__._CONNECTED_CAMS -= 1
+		return asyncio.run_coroutine_threadsafe(super().close(), self._LOOP_THREAD.loop)
+
+	def reopenAsync(self, ip=None):
+		"""Reconnect to this camera without waiting, at a new IP if it has moved
+		Returns a concurrent.futures.Future, done once the camera has been opened again.
+		"""
+		return asyncio.run_coroutine_threadsafe(self.reopen(ip), self._LOOP_THREAD.loop)
 
 	def setIP(self, ip=None, netmask=None, gateway=None, name=None, dhcp=None):
 		"""Set IP address of camera
@@ -183,213 +154,110 @@ class ViscaIPCamera:
 					LOGGER.warning("Couldn't get a response for setIP, possibly in different subnet?")
 
 	def queueCommands(self, *args, override=True):
-		"""Queue one or more messages to be sent, generally this overrides the last command unless override=False"""
-		future = asyncio.run_coroutine_threadsafe(self._queueCommands(*args, override=override), self._LOOP_THREAD.loop)
-		future.result()
+		"""Queue one or more messages to be sent, without waiting for them
+		Each command goes in the lane for its axis, where it replaces older motion commands unless override=False.
+		Returns a concurrent.futures.Future of the list of results, once every command has been answered (superseded
+		commands give None).
+		"""
+		return asyncio.run_coroutine_threadsafe(self._queueAndWait(*args, override=override), self._LOOP_THREAD.loop)
 
-	async def _queueCommands(self, *args, override=True):
-		LOGGER.debug("Putting on the queue: %r", args)
-		if override:
-			self.cmd_queue.clear_and_put(*args)
-		else:
-			self.cmd_queue.put_many(*args)
-		if self._queue_loop is None:
-			# Start the queue watcher if not already started
-			self._queue_loop = asyncio.create_task(self._watchQueue())
-
-	async def _watchQueue(self):
-		"""Watch and process the command queue for this camera."""
-		LOGGER.info("Starting queue watcher")
-		while True:
-			cmd = await self.cmd_queue.get()
-			if cmd is None:
-				LOGGER.debug("Received trigger to stop the queue watcher")
-				break
-			LOGGER.debug("Sending command cmd: %r", cmd)
-			try:
-				await self._sendCommand(cmd)
-			except Exception:
-				LOGGER.exception("Command failed: %r", cmd)
-			# Camera times out if you send commands too quickly after an ack
-			await asyncio.sleep(0.05)
-			# We should really call task done after a get() but my clearing of the queue in MyQueue breaks the counting.
-			#   So for now we'll just not bother given we never use join()
-			# self.cmd_queue.task_done()
-		LOGGER.info("Queue watcher exited")
-
-	def sendCommand(self, command, skipCompletion=False):
-		"""Send a command to the camera using the event loop"""
-		future = asyncio.run_coroutine_threadsafe(
-			self._sendCommand(command), self._LOOP_THREAD.loop
-		)
-		return future.result()
-
-	async def _sendCommand(self, command):
-		# for general commands (payload type 0100), command should be bytes
-		length = len(command.value).to_bytes(2, 'big')
-		if not self.simple_visca:
-			command.value = b"\x01\x00" + length + self.sequenceNumber.to_bytes(4, 'big') + command.value
-		data = await self._sendRawCommand(command.value, **command.kwargs) # TODO: deal with udp packets getting lost and sequence number desyncing (see manual)
-		self.sequenceNumber += 1
-		command.result = data
-		return data
-
-	def inquire(self, command):
-		"""Send an inquiry message (must be wrapped in a Command()"""
-		future = asyncio.run_coroutine_threadsafe(self._inquire(command), self._LOOP_THREAD.loop)
-		return future.result()
-
-	async def _inquire(self, command):
-		# No acknowledge messages provided for inquiries
-		command.skipCompletion = True
-		return await self._sendCommand(command)
-
-	async def resetSequenceNumber(self):
-		"""Reset the Sony camera sequence number"""
-		self.sequenceNumber = 1
-		await self._sendRawCommand(
-			bytearray.fromhex('02 00 00 01 00 00 00 01 01'), skipCompletion=True, raise_on_timeout=True
+	def sendCommandAsync(self, command, skipCompletion=False):
+		"""Send a command (wrapped in a Command()) straight away, bypassing the queue, without waiting
+		With skipCompletion the first reply is the result rather than the completion. Returns a
+		concurrent.futures.Future of the reply.
+		"""
+		if skipCompletion and not command.skipCompletion:
+			command = command.copy()
+			command.skipCompletion = True
+		return asyncio.run_coroutine_threadsafe(self._sendCommand(command), self._LOOP_THREAD.loop)
+
+	def inquireBlocking(self, command):
+		"""Send an inquiry message (must be wrapped in a Command()) and wait for the reply"""
+		return self.inquireAsync(command).result()
+
+	def inquireAsync(self, command):
+		"""Send an inquiry message (must be wrapped in a Command()) without waiting
+		Returns a concurrent.futures.Future of the reply.
+		"""
+		return asyncio.run_coroutine_threadsafe(self._inquire(command), self._LOOP_THREAD.loop)
+
+	@classmethod
+	def broadcast(cls, cameras, command, timeout=None, override=True):
+		"""Send one command to all the cameras at once without waiting
+		Returns a concurrent.futures.Future of a list of fleet.FleetResult, one per camera.
+		"""
+		return asyncio.run_coroutine_threadsafe(
+			fleet.broadcast(cameras, command, timeout=timeout, override=override), cls._LOOP_THREAD.loop
 		)
 
 	def getPos(self):
-		data = self.inquire(Command(Inquiry.PanTiltPos))
-		pan = (data[10] << 12) | (data[11] << 8) | (data[12] << 4) | data[13]
-		tilt = (data[14] << 12) | (data[15] << 8) | (data[16] << 4) | data[17]
+		data = self.inquireBlocking(Command(Inquiry.PanTiltPos)).payload
+		pan = (data[2] << 12) | (data[3] << 8) | (data[4] << 4) | data[5]
+		tilt = (data[6] << 12) | (data[7] << 8) | (data[8] << 4) | data[9]
 		LOGGER.debug("Got positions, Pan: %0.4x Tilt: %0.4x", pan, tilt)
 		return (pan, tilt)
 
-	async def _receive(self):
-		# receive() wrapped in a wait_for to simulate sync socket timeouts (for when camera goes AWOL)
-		data = await asyncio.wait_for(self._LOCAL_SOCK.receive(self.ip), timeout=1)
-		if b"NAK" in data:
-			LOGGER.error("Command failed with error: %r", data)
-		if len(data) > 10:
-			if data[8] == 0x90:
-				# acknowledged (0x4Y) / completion (0x5Y) / error message (0x6Y), Y = socket number
-				if (data[9] & 0xf0) == 0x40:
-					LOGGER.debug("Command acknowledged successfully")
-				if (data[9] & 0xf0) == 0x50:
-					LOGGER.debug("Command completed successfully")
-				if (data[9] & 0xf0) == 0x60:
-					LOGGER.error("Command failed with error: %r", data)
-					error = {0x01: "Message length error", 0x02: "Syntax Error", 0x03: "Command buffer full",
-							 0x04: "Command canceled", 0x05: "No socket", 0x41: "Command not executable"}
-					LOGGER.error("Formatted: %s", error.get(data[10], "Unknown"))
-		else:
-			if data == b'\x02\x01\x00\x01\x00\x00\x00\x00\x01':
-				LOGGER.debug("Successfully reset sequence number")
-			else:
-				LOGGER.error("Returned data was too short?")
-		return data
-
-	async def _sendRawCommand(self, command, skipCompletion=False, raise_on_timeout=False):
-		# this sends a command and waits for a response, note it does NOT calculate / use the sequence number
-		# command should be a bytes object
-		LOGGER.debug("Sending to %s: %r", self.ip, command)
-		self._remote_sock.send(command)
-
-		# FIXME: hack to workaround currently being unable to receive from non Sony cameras
-		if self.simple_visca:
-			return None
-
-		LOGGER.debug("Waiting for _receive...")
-		try:
-			data = await self._receive()  # acknowledge
-			if skipCompletion:
-				return data
-			data = await self._receive()  # completion
-			return data
-		except asyncio.TimeoutError:
-			LOGGER.error("Timeout waiting for data from camera %s!", self.ip)
-			# TODO: may be nice to set is_connected or similar False here and update UI to show warning. Reset on next
-			#  success. Bare in mind the implications of setting is_connected to False in other code
-			if raise_on_timeout:
-				raise
+	@classmethod
+	def listen(cls, callback, interval=discovery.DiscoveryListener.INTERVAL):
+		"""Start the discovery listener on the event loop, it re-announces every interval seconds
+		callback(discovery.DiscoveryEvent) is called (from the event loop thread) whenever a camera appears, moves to
+		a new IP or goes away. Returns the listener, whose cameras are the ones on the network right now.
+		"""
+		if cls._LISTENER is None:
+			listener = discovery.DiscoveryListener(cls, callback, interval)
+			asyncio.run_coroutine_threadsafe(listener.start(), cls._startLoop()).result()
+			cls._LISTENER = listener
+		return cls._LISTENER
 
 	@classmethod
-	def discoverCameras(cls):
-		# UDP socket, enable broadcast, and socket reuse (hah if even that worked)
-		s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-		s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-		s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-		s.settimeout(1)
-
-		try:
-			s.bind(("", 52380))
-
-			discoverCmd = b"\x02ENQ:network\xFF\x33"
-			LOGGER.debug("Sending sony discover...")
-			s.sendto(discoverCmd, ('<broadcast>', 52380))
-			cameras = []
-			try:
-				while True:
-					raw, addr = s.recvfrom(1024)
-					if raw == discoverCmd:
-						continue
-					data = raw.split(b'\xFF')
-					name = data[7][5:].decode("utf-8")
-					mac = data[0][5:].decode("utf-8")
-					LOGGER.info("Found camera '%s' (%s) at IP %s", name, mac, addr[0])
-					cameras.append(cls(name, addr[0], mac))
-			except socket.timeout:
-				LOGGER.debug("End Sony discover")
-			return cameras
-		finally:
-			s.close()
+	def announce(cls):
+		"""Ask every camera to reply to the discovery listener now, rather than at the next interval"""
+		if cls._LISTENER is not None:
+			cls._LOOP_THREAD.loop.call_soon_threadsafe(cls._LISTENER.announce)
+
+	@classmethod
+	def stopListening(cls):
+		"""Stop the discovery listener, and the event loop if there are no cameras open"""
+		if cls._LISTENER is None:
+			return
+		asyncio.run_coroutine_threadsafe(cls._LISTENER.stop(), cls._LOOP_THREAD.loop).result()
+		cls._LISTENER = None
+		cls._stopLoopIfIdle()
+
+	@classmethod
+	def sweep(cls, networks, concurrency=64, rate=500, timeout=0.5, sonyPort=sweep.SONY_VISCA_PORT):
+		"""Probe every host in networks (CIDR strings) for cameras on the event loop without waiting
+		Returns a concurrent.futures.Future of the list of cameras found.
+		"""
+		return asyncio.run_coroutine_threadsafe(
+			sweep.sweep(cls, networks, concurrency=concurrency, rate=rate, timeout=timeout, sonyPort=sonyPort),
+			cls._startLoop(),
+		)
+
+	@classmethod
+	def serveMetrics(cls, cameras, port=metrics.METRICS_PORT):
+		"""Serve the metrics of cameras() (a callable returning the cameras to report) on http://127.0.0.1:port/metrics
+		The server runs on the event loop, keeping it running until stopMetrics(). Returns the URL.
+		"""
+		if cls._METRICS is None:
+			def collect():
+				return metrics.render(cameras(), [("local", AsyncViscaCamera._LOCAL_SOCK)])
+			cls._METRICS = asyncio.run_coroutine_threadsafe(
+				metrics.serve(collect, port=port), cls._startLoop()
+			).result()
+		host, port = cls._METRICS.sockets[0].getsockname()[:2]
+		return f"http://{host}:{port}/metrics"
 
 	@classmethod
-	def discoverNonSony(cls):
-		"""Discover non-Sony PTZ cameras over multicast"""
-		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-		sock.settimeout(0.5)
-		responses = []
-		try:
-			# sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-			remote_addr = ipaddress.ip_address("239.255.255.251")
-			sock.setsockopt(
-				socket.IPPROTO_IP,
-				socket.IP_ADD_MEMBERSHIP,
-				struct.pack("4sl", remote_addr.packed, socket.INADDR_ANY),
-			)
-			sock.bind(("", 8005))
-			LOGGER.debug("Sending non-sony discover...")
-			sock.sendto(b"SEARCH * UPGRADE", ("239.255.255.251", 8005))
-			try:
-				while True:
-					data, addr = sock.recvfrom(1024)
-					LOGGER.debug("Discover got data: %r", data)
-					responses.append(data)
-			except socket.timeout:
-				LOGGER.debug("End non-Sony discover")
-		finally:
-			sock.close()
-
-		regexes = [
-			re.compile(
-				r"REPLY OK\s+Client ID:(?P<client_id>[A-Fa-f0-9]{32})?\s+Device ID:(?P<device_id>[A-Fa-f0-9]{32})(\s+Uptime=\d*)?\s+DHCP=(?P<dhcp>\d).*IP=(?P<ip>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MASK=(?P<mask>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+GATEWAY=(?P<gateway>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MAC=(?P<mac>([A-Fa-f0-9]{2}[:-]){5}[A-Fa-f0-9]{2})\s+FDNS=(?P<dns>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})",
-				re.DOTALL,
-			),
-			re.compile(
-				r"REPLY OK\s+VERSION:(?P<version>[0-9]+.[0-9]+.[0-9]+)\s+DEVICE_MODEL:(?P<model>[A-Z0-9.]{4,})\s+Client ID:(?P<client_id>[A-Fa-f0-9]{32})?\s+Device ID:(?P<device_id>[A-Fa-f0-9]{32})\s+Uptime=(?P<uptime>[0-9]+)\s+DHCP=(?P<dhcp>\d).*IP=(?P<ip>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MASK=(?P<mask>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+GATEWAY=(?P<gateway>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s+MAC=(?P<mac>([A-Fa-f0-9]{2}[:-]){5}[A-Fa-f0-9]{2})\s+FDNS=(?P<dns>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})",
-				re.DOTALL,
-			)
-		]
-		found = []
-		for resp in responses:
-			for regex in regexes:
-				mo = regex.match((resp.decode()))
-				if mo:
-					info = mo.groupdict()
-					# We don't seem to get camera names back from discover here so bodge a bit of device id
-					LOGGER.info("Found camera '%s' (%s) at IP %s", info["device_id"], info["mac"], info["ip"])
-					found.append(cls(
-						info["device_id"][:8],
-						info["ip"],
-						info["mac"],
-						netmask=info["mask"],
-						gateway=info["gateway"],
-						port=1259,
-						device_id=info["device_id"],
-						simple_visca=True,
-					))
-		return found
+	def stopMetrics(cls):
+		"""Stop the metrics server, and the event loop if nothing else needs it"""
+		if cls._METRICS is None:
+			return
+		server = cls._METRICS
+
+		async def stop():
+			server.close()
+			await server.wait_closed()
+		asyncio.run_coroutine_threadsafe(stop(), cls._LOOP_THREAD.loop).result()
+		cls._METRICS = None
+		cls._stopLoopIfIdle()